@@ -0,0 +1,160 @@
+'''Бенчмарк отрисовки графиков: pyplot с нуля на каждый запрос против шаблонов charts
+
+Прежний вариант строит фигуру через plt.subplots, считает tight_layout и
+сохраняет с bbox_inches='tight' (две отрисовки). Шаблоны charts создаются
+один раз на поток, на запрос обновляются данные и выполняется одна отрисовка.
+Данные меняются от запроса к запросу, кэш готовых PNG не участвует.
+
+Запуск: python benchmarks/bench_charts.py [--repeat 20]
+'''
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import charts  # noqa: E402
+import matplotlib  # noqa: E402
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+
+def legacy_png(fig):
+    '''Прежнее сохранение: tight_layout, savefig с bbox_inches='tight', закрытие фигуры'''
+    plt.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=charts.CHART_DPI, bbox_inches='tight')
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def legacy_histogram(salaries, query, city_name, median, mean):
+    fig, ax = plt.subplots(figsize=(12, 7))
+    ax.hist(salaries, bins=30, color='#3498db', alpha=0.7, edgecolor='black')
+    ax.axvline(median, color='red', linestyle='--', linewidth=2, label=f'Медиана: {int(median):,} ₽')
+    ax.axvline(mean, color='green', linestyle='--', linewidth=2, label=f'Среднее: {int(mean):,} ₽')
+    ax.set_xlabel('Заработная плата (₽)', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Количество вакансий', fontsize=12, fontweight='bold')
+    ax.set_title(f'Распределение зарплат: {query}\n{city_name}', fontsize=14, fontweight='bold')
+    ax.legend(fontsize=11)
+    ax.grid(True, alpha=0.3)
+    ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x/1000)}k'))
+    return legacy_png(fig)
+
+
+def legacy_comparison(professions, medians, means):
+    fig, ax = plt.subplots(figsize=(14, 8))
+    x = np.arange(len(professions))
+    width = 0.35
+    bars1 = ax.bar(x - width/2, medians, width, label='Медиана', color='#3498db')
+    bars2 = ax.bar(x + width/2, means, width, label='Среднее', color='#2ecc71')
+    ax.set_xlabel('Профессия', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Зарплата (₽)', fontsize=12, fontweight='bold')
+    ax.set_title('Сравнение зарплат по профессиям', fontsize=14, fontweight='bold')
+    ax.set_xticks(x)
+    ax.set_xticklabels(professions, rotation=15, ha='right')
+    ax.legend()
+    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x/1000)}k'))
+    for bars in [bars1, bars2]:
+        for bar in bars:
+            height = bar.get_height()
+            if height > 0:
+                ax.text(bar.get_x() + bar.get_width()/2., height, f'{int(height/1000)}k',
+                        ha='center', va='bottom', fontsize=9)
+    return legacy_png(fig)
+
+
+def legacy_report(salaries, median, top_emp, exp_dist, emp_dist, query, city_name):
+    fig = plt.figure(figsize=(16, 10))
+    ax1 = plt.subplot(2, 3, 1)
+    ax1.hist(salaries, bins=25, color='#3498db', alpha=0.7, edgecolor='black')
+    ax1.axvline(median, color='red', linestyle='--', linewidth=2)
+    ax1.set_xlabel('Зарплата (₽)')
+    ax1.set_ylabel('Количество')
+    ax1.set_title('Распределение зарплат')
+    ax1.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x/1000)}k'))
+    ax2 = plt.subplot(2, 3, 2)
+    names, counts = zip(*top_emp)
+    ax2.barh(range(len(names)), counts, color='#2ecc71')
+    ax2.set_yticks(range(len(names)))
+    ax2.set_yticklabels([n[:25] + '...' if len(n) > 25 else n for n in names], fontsize=9)
+    ax2.set_xlabel('Количество вакансий')
+    ax2.set_title('Топ работодателей')
+    ax2.invert_yaxis()
+    ax3 = plt.subplot(2, 3, 3)
+    ax3.pie(exp_dist.values(), labels=exp_dist.keys(), autopct='%1.1f%%',
+            colors=['#e74c3c', '#f39c12', '#3498db', '#9b59b6'], startangle=90)
+    ax3.set_title('Распределение по опыту')
+    ax4 = plt.subplot(2, 3, 4)
+    ax4.bar(range(len(emp_dist)), emp_dist.values(), color='#1abc9c')
+    ax4.set_xticks(range(len(emp_dist)))
+    ax4.set_xticklabels(emp_dist.keys(), rotation=45, ha='right', fontsize=9)
+    ax4.set_ylabel('Количество')
+    ax4.set_title('Тип занятости')
+    ax5 = plt.subplot(2, 3, 5)
+    ax5.boxplot(salaries)
+    ax5.set_ylabel('Зарплата (₽)')
+    ax5.set_title('Статистика зарплат')
+    ax5.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x/1000)}k'))
+    plt.suptitle(f'Детальный анализ: {query} | {city_name}', fontsize=16, fontweight='bold', y=0.995)
+    return legacy_png(fig)
+
+
+def make_args(rng, i):
+    '''Данные i-го запроса для каждого типа графика'''
+    salaries = rng.lognormal(11.7, 0.45, 1500)
+    median, mean = float(np.median(salaries)), float(salaries.mean())
+    query = f'профессия {i}'
+    professions = [query, 'аналитик данных', 'дизайнер']
+    top = [(f'Компания номер {j} ({i})', 40 - j) for j in range(10)]
+    experience = {'Нет опыта': 10 + i, 'От 1 года до 3 лет': 30, 'От 3 до 6 лет': 20,
+                  'Более 6 лет': 5}
+    employment = {'Полная занятость': 50 + i, 'Частичная занятость': 5, 'Стажировка': 2}
+    return {
+        'гистограмма': (salaries, query, 'Москва', median, mean),
+        'сравнение': (professions, [median, 150_000 + i, 90_000], [mean, 160_000, 95_000]),
+        'отчет': (salaries, median, top, experience, employment, query, 'Москва'),
+    }
+
+
+def timeit(fn, args_list):
+    '''Среднее время на график, мс'''
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    requests = [make_args(rng, i) for i in range(args.repeat)]
+    implementations = {
+        'гистограмма': (legacy_histogram, charts.salary_histogram),
+        'сравнение': (legacy_comparison, charts.comparison_chart),
+        'отчет': (legacy_report, charts.detailed_report),
+    }
+
+    for name, (legacy, templated) in implementations.items():
+        args_list = [r[name] for r in requests]
+        legacy(*args_list[0])  # прогрев шрифтов для обоих вариантов
+
+        start = time.perf_counter()
+        templated(*args_list[0])  # создание шаблона
+        cold = (time.perf_counter() - start) * 1000
+
+        legacy_ms = timeit(legacy, args_list)
+        templated_ms = timeit(templated, args_list)
+        print(f'{name:>12}: pyplot {legacy_ms:7.1f} мс, шаблон {templated_ms:6.1f} мс '
+              f'(создание шаблона {cold:6.1f} мс), x{legacy_ms / templated_ms:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+'''Бенчмарк загрузки при сбоях hh.ru: прежний цикл против адаптивного HHClient
+
+Стаб hh.ru вносит сбои (см. stub_hh_server.StubHH): в сценарии «503» часть
+ответов — ошибки сервера, в сценарии «лимит» сервер пропускает --server-rate
+запросов в секунду, отвечает 429 сверх лимита и банит (403) клиента,
+получившего больше --ban-after ответов 429 за 10 секунд. --users поисков
+идут одновременно.
+
+Прежний цикл — requests.get по страницам со sleep(0.5) и одним try/except на
+весь поиск (как было в VacancyStats): любой сбой обнуляет поиск. HHClient
+повторяет страницы с паузой, подстраивает окно и частоту под 429/5xx и
+отдает неполный результат, если страницы так и не загрузились; его бюджет
+нарочно выше лимита сервера (--client-rate). Печатаются полные, неполные и
+пустые поиски, доля полученных вакансий, время, вакансий в секунду, число
+ответов 429 и банов.
+
+Запуск: python benchmarks/bench_faults.py [--users 8] [--found 600]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import hh_client  # noqa: E402
+from stub_hh_server import start_server  # noqa: E402
+
+
+def legacy_search(base_url, params):
+    '''Прежний цикл: страницы по одной со sleep(0.5), при любой ошибке — пустой результат'''
+    try:
+        params = dict(params, page=0, per_page=100)
+        req = requests.get(base_url + '/vacancies', params, timeout=10)
+        data = json.loads(req.content.decode())
+        pages = min(data.get('pages', 0), 20)
+        items = []
+        for page in range(pages):
+            params['page'] = page
+            req = requests.get(base_url + '/vacancies', params, timeout=10)
+            data = json.loads(req.content.decode())
+            items.extend(data['items'])
+            time.sleep(0.5)
+        # Ошибка на первой странице не бросает исключения, но дает ноль страниц
+        return items, 0 if items else None
+    except Exception:
+        return [], None
+
+
+def adaptive_search(client, params):
+    '''HHClient: (вакансии, число потерянных страниц) или ([], None), если нет первой'''
+    missing = []
+    try:
+        items = [item for page in client.iter_pages(params, missing=missing) for item in page]
+    except Exception:
+        return [], None
+    return items, len(missing)
+
+
+def run(search, users, found):
+    '''Одновременные поиски: строка результатов'''
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        results = list(pool.map(search, [{'text': f'сбои {i}', 'area': 1} for i in range(users)]))
+    elapsed = time.perf_counter() - start
+    vacancies = sum(len(items) for items, _ in results)
+    return {
+        'full': sum(1 for _, lost in results if lost == 0),
+        'partial': sum(1 for _, lost in results if lost),
+        'empty': sum(1 for _, lost in results if lost is None),
+        'share': vacancies / (users * found),
+        'time': elapsed,
+        'rate': vacancies / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--found', type=int, default=600)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.1)
+    parser.add_argument('--server-rate', type=float, default=10)
+    parser.add_argument('--ban-after', type=int, default=40)
+    parser.add_argument('--client-rate', type=float, default=40)
+    args = parser.parse_args()
+
+    scenarios = [
+        ('503', {'error_rate': args.error_rate}),
+        ('лимит', {'rate_limit': args.server_rate, 'ban_after': args.ban_after, 'ban_time': 30}),
+    ]
+    print(f'поисков: {args.users}, вакансий на запрос: {args.found}, '
+          f'503: {args.error_rate:.0%}, лимит сервера: {args.server_rate}/с')
+    print(f'{"сценарий":>9} {"клиент":>9} {"полных":>7} {"неполн.":>8} {"пустых":>7} '
+          f'{"вакансий":>9} {"время, с":>9} {"вак./с":>7} {"429":>5} {"банов":>6}')
+    for name, faults in scenarios:
+        for kind in ('прежний', 'HHClient'):
+            # Новый стаб на каждый прогон: бан и счетчики не переходят между клиентами
+            server, stub, url = start_server(latency=args.latency, found=args.found, **faults)
+            if kind == 'прежний':
+                row = run(lambda params: legacy_search(url, params), args.users, args.found)
+            else:
+                client = hh_client.HHClient(url, rate=args.client_rate)
+                row = run(lambda params: adaptive_search(client, params), args.users, args.found)
+                client.close()
+            server.shutdown()
+            print(f'{name:>9} {kind:>9} {row["full"]:>7} {row["partial"]:>8} {row["empty"]:>7} '
+                  f'{row["share"]:>9.0%} {row["time"]:>9.1f} {row["rate"]:>7.0f} '
+                  f'{stub.throttled:>5} {stub.bans:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''Бенчмарк загрузки вакансий: старый последовательный цикл против HHClient
+
+Запуск: python benchmarks/bench_fetch.py [--latency 0.15] [--concurrency 4]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import hh_client  # noqa: E402
+from stub_hh_server import start_server  # noqa: E402
+
+
+def legacy_fetch(base_url, params):
+    '''Прежний цикл из VacancyStats.__init__: requests.get по одной странице и sleep(0.5)'''
+    params = dict(params, page=0, per_page=100)
+    req = requests.get(base_url + '/vacancies', params, timeout=10)
+    data = json.loads(req.content.decode())
+    pages = min(data.get('pages', 0), 20)
+    items = []
+    for page in range(pages):
+        params['page'] = page
+        req = requests.get(base_url + '/vacancies', params, timeout=10)
+        data = json.loads(req.content.decode())
+        items.extend(data['items'])
+        time.sleep(0.5)
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.15)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=8)
+    args = parser.parse_args()
+
+    server, stub, url = start_server(latency=args.latency)
+    params = {'text': 'программист', 'area': 1}
+
+    start = time.perf_counter()
+    legacy = legacy_fetch(url, params)
+    legacy_time = time.perf_counter() - start
+    legacy_requests = stub.requests
+
+    client = hh_client.HHClient(url, concurrency=args.concurrency, rate=args.rate)
+    stub.requests = 0
+    start = time.perf_counter()
+    items = client.fetch_vacancies(params)
+    new_time = time.perf_counter() - start
+
+    assert [i['id'] for i in items] == [i['id'] for i in legacy]
+    print(f'Вакансий: {len(items)}, задержка стаба: {args.latency:.2f} с')
+    print(f'Старый цикл: {legacy_time:6.2f} с, запросов: {legacy_requests}')
+    print(f'HHClient:    {new_time:6.2f} с, запросов: {stub.requests} '
+          f'(concurrency={args.concurrency}, rate={args.rate}/с)')
+    print(f'Ускорение: x{legacy_time / new_time:.1f}')
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
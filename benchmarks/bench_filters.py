@@ -0,0 +1,145 @@
+'''Бенчмарк смены фильтров опыта и удаленки: новая загрузка против масок по выдаче
+
+Пользователь ищет запрос и перебирает в /settings все сочетания опыта
+(все, без опыта, 1-3, 3-6, больше 6 лет) и «только удаленка» — 10 поисков.
+Прежде каждое сочетание было отдельной выдачей hh.ru (здесь — прямой вызов
+VacancyStats._load_frame с параметрами фильтров), теперь выдача без фильтров
+грузится один раз, а сочетания считаются масками по столбцам experience.id и
+schedule.id. Печатаются запросы к стабу hh.ru, общее время и время одной
+смены фильтра (медиана по сочетаниям после первого поиска), для синхронного
+VacancyStats и для hh_async.load_stats.
+
+Отдельно — первый поиск сразу с фильтрами: выдача без них грузится, только
+если found ее первой страницы обещает загрузку целиком (при --found больше
+BOT_HARVEST_SHARDS * 2000 — нет, и запросов столько же, сколько у загрузки
+с фильтрами, плюс одна страница).
+
+Стаб не применяет фильтры к выдаче, поэтому кадры с фильтрами сверяются с
+вакансиями выдачи без фильтров, отобранными по опыту и графику в Python.
+
+Запуск: python benchmarks/bench_filters.py [--found 2000] [--latency 0.05]
+'''
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from stub_hh_server import start_server  # noqa: E402
+
+EXPERIENCE = [None, 'noExperience', 'between1And3', 'between3And6', 'moreThan6']
+FILTERS = [{'experience': experience, 'remote_only': remote}
+           for remote in (False, True) for experience in EXPERIENCE]
+
+
+def run(label, stub, search):
+    '''Поиски по всем сочетаниям фильтров: (запросов, секунд, мс на смену фильтра)'''
+    requests_before = stub.requests
+    times = []
+    for filters in FILTERS:
+        start = time.perf_counter()
+        search(filters)
+        times.append(time.perf_counter() - start)
+    requests = stub.requests - requests_before
+    flip = statistics.median(times[1:]) * 1000
+    print(f'{label:>22} {requests:>9} {sum(times):>9.2f} {flip:>12.2f}')
+    return requests, flip
+
+
+def check(query, client):
+    '''Кадры с фильтрами совпадают с отбором вакансий выдачи без фильтров'''
+    import numpy as np
+    import harvester
+    import schema
+    import stats_advanced
+    source = harvester.Harvester(client)
+    records = [schema.project(item) for page in source.iter_pages(
+        stats_advanced.search_params(query)) for item in page]
+    if source.truncated:
+        print(f'выдача без фильтров загружена не целиком (еще {source.truncated}): '
+              f'кадры с фильтрами грузятся своими запросами, сверка пропущена')
+        return False
+    for filters in FILTERS:
+        key = stats_advanced.make_query_key(query, **filters)
+        df = stats_advanced.VacancyStats(query, **filters).df
+        expected = schema.to_frame([r for r in records if stats_advanced.matches(r, key)])
+        assert len(df) == len(expected), (filters, len(df), len(expected))
+        # Окна выдачи грузятся параллельно, порядок вакансий может отличаться
+        for name in ('salary.from', 'salary.to'):
+            assert np.array_equal(np.sort(df[name]), np.sort(expected[name]),
+                                  equal_nan=True), (filters, name)
+        for name in schema.CATEGORY_COLUMNS:
+            assert df[name].value_counts().to_dict() == expected[name].value_counts().to_dict()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--found', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    # Вакансии равномерно за последние 27 дней, как у hh.ru (ищет за 30)
+    server, stub, url = start_server(latency=args.latency, found=args.found,
+                                     interval=27 * 86400 / args.found)
+    # Без хранилища на диске: иначе повторные загрузки шли бы из SQLite
+    os.environ.update({'HH_API_URL': url, 'HH_STORE_PATH': '', 'HH_RATE': '100000'})
+    import hh_async
+    import hh_client
+    import stats_advanced
+    client = hh_client.get_client()
+    query = 'python разработчик'
+
+    def refetch(filters):
+        key = stats_advanced.make_query_key(query, **filters)
+        df = stats_advanced.VacancyStats._load_frame(key, stats_advanced.key_params(key),
+                                                     client, None)
+        stats_advanced.VacancyStats.from_frame(query, 1, df, key).get_basic_stats()
+
+    def derive(filters):
+        stats_advanced.VacancyStats(query, **filters).get_basic_stats()
+
+    async def derive_async(filters):
+        stats = await hh_async.load_stats(query, **filters)
+        stats.get_basic_stats()
+
+    # Один event loop на все поиски: у асинхронного клиента общая сессия
+    loop = asyncio.new_event_loop()
+
+    def run_async(filters):
+        loop.run_until_complete(derive_async(filters))
+
+    print(f'найдено: {args.found}, задержка стаба: {args.latency * 1000:.0f} мс, '
+          f'сочетаний фильтров: {len(FILTERS)}')
+    print(f'{"":>22} {"запросов":>9} {"всего, с":>9} {"смена, мс":>12}')
+    before, before_flip = run('загрузка на фильтр', stub, refetch)
+    stats_advanced.RESULT_CACHE.clear()
+    after, after_flip = run('маски', stub, derive)
+    stats_advanced.RESULT_CACHE.clear()
+    run('маски (асинхронно)', stub, run_async)
+    print(f'запросов к hh.ru меньше в {before / after:.1f} раза, '
+          f'смена фильтра быстрее в {before_flip / after_flip:.0f} раз')
+
+    filters = FILTERS[-1]
+    requests_before = stub.requests
+    refetch(filters)
+    direct = stub.requests - requests_before
+    for label, search in (('', derive), (' (асинхронно)', run_async)):
+        stats_advanced.RESULT_CACHE.clear()
+        requests_before = stub.requests
+        search(filters)
+        print(f'первый поиск с фильтрами{label}: {stub.requests - requests_before} запросов '
+              f'(загрузка с фильтрами — {direct})')
+
+    if check(query, client):
+        print('кадры с фильтрами совпадают с отбором из выдачи без фильтров')
+    loop.run_until_complete(hh_async.get_client().close())
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
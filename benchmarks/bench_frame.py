@@ -0,0 +1,50 @@
+'''Бенчмарк представления вакансий: pd.json_normalize полной выдачи против schema
+
+Меряется размер кадра одного поиска (memory_usage(deep=True)) и время его
+построения из ответов API. Вакансии — в формате hh.ru из стаба.
+
+Запуск: python benchmarks/bench_frame.py
+'''
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import schema  # noqa: E402
+from stub_hh_server import make_vacancy  # noqa: E402
+
+
+def legacy_frame(items):
+    '''Прежний кадр: все поля выдачи'''
+    return pd.json_normalize(items)
+
+
+def schema_frame(items):
+    '''Проекция при разборе и типизированные столбцы'''
+    return schema.to_frame([schema.project(item) for item in items])
+
+
+def measure(fn, items, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = fn(items)
+        best = min(best, time.perf_counter() - start)
+    return best, int(df.memory_usage(deep=True).sum())
+
+
+def main():
+    for count in (2000, 20_000):
+        items = [make_vacancy(1, i, time.time()) for i in range(count)]
+        legacy_time, legacy_bytes = measure(legacy_frame, items)
+        schema_time, schema_bytes = measure(schema_frame, items)
+        print(f'{count:>6} вакансий: json_normalize {legacy_bytes / 2**20:6.2f} МБ '
+              f'за {legacy_time * 1000:6.0f} мс, schema {schema_bytes / 2**10:7.1f} КБ '
+              f'за {schema_time * 1000:5.0f} мс, память x{legacy_bytes / schema_bytes:.0f}')
+
+
+if __name__ == '__main__':
+    main()
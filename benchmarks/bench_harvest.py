@@ -0,0 +1,84 @@
+'''Бенчмарк загрузки выдачи больше 2000 вакансий: первые 2000 против окон harvester
+
+Стаб hh.ru отдает --found вакансий (публикуются раз в --interval секунд, все
+в пределах 30 дней) и, как hh.ru, не глубже 2000 на запрос, но понимает
+date_from/date_to. HHClient.iter_pages получает первые 2000, Harvester и
+AsyncHarvester делят период на окна. Печатаются полученные вакансии, доля от
+found, повторы по id, truncated (сколько не поместилось в --shards окон), число
+запросов к API и время. Проверяется, что повторов нет, а все, что не
+загружено, учтено в truncated: предел окон урезает выдачу (см. harvester).
+
+Запуск: python benchmarks/bench_harvest.py [--found 10000] [--latency 0.05]
+'''
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+import harvester  # noqa: E402
+import hh_async  # noqa: E402
+import hh_client  # noqa: E402
+from stub_hh_server import start_server  # noqa: E402
+
+
+def collect(source, params):
+    '''id загруженных вакансий и сколько осталось за пределом'''
+    return [item['id'] for page in source.iter_pages(params) for item in page], source.truncated
+
+
+async def collect_async(url, params, rate, shards):
+    client = hh_async.AsyncHHClient(url, rate=rate)
+    try:
+        source = harvester.AsyncHarvester(client, max_shards=shards)
+        ids = [item['id'] async for page in source.iter_pages(params) for item in page]
+        return ids, source.truncated
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--found', type=int, default=10000)
+    parser.add_argument('--interval', type=float, default=60)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--rate', type=float, default=50)
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+
+    server, stub, url = start_server(latency=args.latency, found=args.found,
+                                     interval=args.interval)
+    params = {'text': 'программист', 'area': 113}
+    client = hh_client.HHClient(url, rate=args.rate)
+    runs = [
+        ('первые 2000', lambda: collect(harvester.Harvester(client, max_shards=0), params)),
+        ('Harvester', lambda: collect(harvester.Harvester(client, max_shards=args.shards),
+                                      params)),
+        ('асинхронный', lambda: asyncio.run(collect_async(url, params, args.rate, args.shards))),
+    ]
+
+    print(f'найдено: {args.found}, окон не больше: {args.shards}, '
+          f'задержка стаба: {args.latency * 1000:.0f} мс, лимит: {args.rate}/с')
+    print(f'{"":>12} {"вакансий":>9} {"доля":>6} {"повторов":>9} {"урезано":>9} {"запросов":>9} '
+          f'{"время, с":>9}')
+    for name, run in runs:
+        requests_before = stub.requests
+        start = time.perf_counter()
+        ids, truncated = run()
+        elapsed = time.perf_counter() - start
+        unique = len(set(ids))
+        print(f'{name:>12} {len(ids):>9} {unique / args.found:>6.0%} {len(ids) - unique:>9} '
+              f'{truncated:>9} {stub.requests - requests_before:>9} {elapsed:>9.2f}')
+        assert len(ids) == unique, 'повторы вакансий на границах окон'
+        # Вакансии на границах окон могут попасть в truncated двух окон, отсюда >=
+        assert unique + truncated >= args.found, \
+            f'загружено {unique} из {args.found}, а урезано только {truncated}'
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
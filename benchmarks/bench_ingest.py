@@ -0,0 +1,87 @@
+'''Бенчмарк накопления страниц выдачи: пиковая память и время в зависимости от числа страниц
+
+Сравниваются три способа собрать кадр из страниц по 100 вакансий:
+  concat   — прежний цикл self.df = pd.concat([self.df, pd.json_normalize(page)]);
+  list     — все записи schema.project в одном списке, затем schema.to_frame;
+  stream   — страницы по одной в буферы schema.FrameBuilder (как сейчас в боте).
+Страницы заранее сериализованы в JSON (как ответы API) и разбираются по мере
+потребления, поэтому пик tracemalloc показывает, что держит в памяти сам способ.
+
+Запуск: python benchmarks/bench_ingest.py [--pages 5 20 80 160]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import schema  # noqa: E402
+from stub_hh_server import make_vacancy  # noqa: E402
+
+PER_PAGE = 100
+
+
+def make_pages(count):
+    '''Ответы API страницами: JSON-строки'''
+    now = time.time()
+    return [json.dumps({'items': [make_vacancy(1, page * PER_PAGE + i, now)
+                                  for i in range(PER_PAGE)]}, ensure_ascii=False)
+            for page in range(count)]
+
+
+def parsed(pages):
+    '''Страницы по мере «загрузки»'''
+    for body in pages:
+        yield json.loads(body)['items']
+
+
+def concat_frame(pages):
+    df = pd.DataFrame()
+    for items in parsed(pages):
+        df = pd.concat([df, pd.json_normalize(items)], ignore_index=True)
+    return df
+
+
+def list_frame(pages):
+    records = [schema.project(item) for items in parsed(pages) for item in items]
+    return schema.to_frame(records)
+
+
+def stream_frame(pages):
+    return schema.build_frame([schema.project(item) for item in items] for items in parsed(pages))
+
+
+def measure(fn, pages):
+    '''(время, пиковая память, размер итогового кадра)'''
+    start = time.perf_counter()
+    fn(pages)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    df = fn(pages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, int(df.memory_usage(deep=True).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, nargs='+', default=[5, 20, 80, 160])
+    args = parser.parse_args()
+
+    print(f'{"страниц":>8} {"способ":>7} {"время, мс":>10} {"пик, МБ":>8} {"кадр, МБ":>9}')
+    for count in args.pages:
+        pages = make_pages(count)
+        for name, fn in [('concat', concat_frame), ('list', list_frame), ('stream', stream_frame)]:
+            elapsed, peak, size = measure(fn, pages)
+            print(f'{count:>8} {name:>7} {elapsed * 1000:>10.0f} {peak / 2**20:>8.2f} '
+                  f'{size / 2**20:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
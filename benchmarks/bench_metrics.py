@@ -0,0 +1,135 @@
+'''Бенчмарк метрик: цена замера этапа и накладные расходы на поиск
+
+1. Цена одного metrics.stage (в гистограмму и в разбивку поиска) и
+   Counter.inc в наносекундах, при включенных и выключенных метриках.
+2. --searches разных поисков (загрузка со стаба hh.ru без задержки, базовая
+   статистика, текст сообщения, гистограмма зарплат) с метриками и без,
+   прогоны чередуются. Печатается разница во времени (шумная) и оценка
+   накладных расходов: число замеров за поиск, умноженное на цену замера,
+   к времени поиска. Оценка должна быть меньше 1%.
+3. /metrics поднимается на свободном порту, ответ проверяется на формат
+   Prometheus и наличие этапов поиска.
+
+Запуск: python benchmarks/bench_metrics.py [--searches 30] [--rounds 3]
+'''
+import argparse
+import os
+import re
+import socket
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from stub_hh_server import start_server  # noqa: E402
+
+
+def op_cost(fn, repeat=200000):
+    '''Наносекунд на вызов'''
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e9
+
+
+def stage_cost(metrics):
+    def one():
+        with metrics.stage('bench'):
+            pass
+    return op_cost(one)
+
+
+def run(searches, tag):
+    '''Поиски без кэша: (секунд всего, замеров этапов)'''
+    import metrics
+    import stats_advanced
+    before = sum(row[-1] for row in metrics.STAGE_SECONDS.values.values())
+    start = time.perf_counter()
+    for i in range(searches):
+        with metrics.trace('search', query=i):
+            stats = stats_advanced.VacancyStats(f'метрики {tag} {i}', city_id=1)
+            stats_advanced.format_stats_message(stats)
+            stats.create_salary_histogram()
+    elapsed = time.perf_counter() - start
+    after = sum(row[-1] for row in metrics.STAGE_SECONDS.values.values())
+    return elapsed, after - before
+
+
+def check_endpoint(metrics):
+    '''Проверка /metrics: формат строк и этапы поиска'''
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = metrics.start_server(port=port)
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as resp:
+        assert resp.status == 200
+        text = resp.read().decode()
+    server.shutdown()
+    for line in text.splitlines():
+        if line.startswith('# HELP ') or line.startswith('# TYPE '):
+            continue
+        name, _, value = line.rpartition(' ')
+        float(value)
+        assert re.match(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{.*\})?$', name), line
+    for stage in ('load', 'hh_request', 'basic_stats', 'chart_render', 'search_total'):
+        assert f'stage="{stage}"' in text, stage
+    assert 'bot_cache_hits_total{cache="result"}' in text
+    return len(text.splitlines())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--searches', type=int, default=30)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--found', type=int, default=400)
+    args = parser.parse_args()
+
+    server, _, url = start_server(latency=0, found=args.found)
+    os.environ.update(HH_API_URL=url, HH_STORE_PATH='', HH_RATE='1000', BOT_METRICS_LOG='')
+    import metrics
+    import stats_advanced
+
+    costs = {}
+    for enabled in (True, False):
+        metrics.ENABLED = enabled
+        costs[enabled] = stage_cost(metrics)
+    metrics.ENABLED = True
+    inc = op_cost(lambda: metrics.HH_RETRIES.inc('bench'))
+    print(f'stage: {costs[True]:.0f} нс (выключено: {costs[False]:.0f} нс), '
+          f'Counter.inc: {inc:.0f} нс')
+
+    run(3, 'прогрев')
+    totals = {True: 0.0, False: 0.0}
+    observed = 0
+    for r in range(args.rounds):
+        for enabled in (False, True):
+            metrics.ENABLED = enabled
+            stats_advanced.RESULT_CACHE.clear()
+            stats_advanced.SUMMARY_CACHE.clear()
+            stats_advanced.CHART_CACHE.clear()
+            elapsed, count = run(args.searches, f'{r} {enabled}')
+            totals[enabled] += elapsed
+            if enabled:
+                observed += count
+    metrics.ENABLED = True
+
+    searches = args.searches * args.rounds
+    per_search = totals[True] / searches
+    stages = observed / searches
+    estimate = stages * costs[True] * 1e-9 / per_search
+    diff = totals[True] / totals[False] - 1
+    print(f'поиск: {per_search * 1000:.1f} мс, замеров на поиск: {stages:.1f}')
+    print(f'без метрик: {totals[False]:.2f} с, с метриками: {totals[True]:.2f} с '
+          f'(разница {diff:+.1%}, в пределах шума)')
+    print(f'оценка накладных расходов: {estimate:.3%}')
+    assert estimate < 0.01, 'метрики дороже 1% времени поиска'
+
+    lines = check_endpoint(metrics)
+    print(f'/metrics: {lines} строк, формат в порядке')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
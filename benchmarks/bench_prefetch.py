@@ -0,0 +1,100 @@
+'''Бенчмарк упреждающей загрузки: время поиска после викторины с prefetch и без
+
+--users пользователей заканчивают викторину с интервалом --gap секунд и через
+--think секунд (пока читают результат) ищут первую рекомендованную профессию.
+У каждого свои профессии, так что без упреждающей загрузки все поиски идут
+мимо кэша. Загрузка — со стаба hh.ru, хранилище вакансий отключено;
+упреждающая загрузка берет не больше --prefetch-share окна общего бюджета.
+Печатаются медиана и p95 времени поиска (до готовой базовой статистики),
+доля попаданий в кэш и сэкономленное время по отчету Prefetcher.
+
+Запуск: python benchmarks/bench_prefetch.py [--users 20] [--think 2]
+'''
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from stub_hh_server import start_server  # noqa: E402
+
+
+def run(args, enabled, tag):
+    '''Один прогон: (времена поиска, отчет Prefetcher)'''
+    import prefetch
+    import quiz
+    import stats_advanced
+
+    active = [0]
+    lock = threading.Lock()
+    # Фоновые запросы — в том же бюджете, что и поиски пользователей (hh_client.get_limiter)
+    prefetcher = prefetch.Prefetcher(busy=lambda: active[0] > 0, top=0,
+                                     share=args.prefetch_share)
+    prefetcher.start()
+    rng = random.Random(0)
+    times = [None] * args.users
+
+    def user(index):
+        time.sleep(index * args.gap)
+        profile = rng.choice(list(quiz.CAREER_PROFILES))
+        professions = [f'{name} {tag} {index}'
+                       for name in quiz.CAREER_PROFILES[profile]['professions'][:3]]
+        filters = {'city_id': 1, 'experience': None, 'remote_only': 0}
+        if enabled:
+            prefetcher.recommend(professions, filters)
+        time.sleep(args.think)
+
+        with lock:
+            active[0] += 1
+        start = time.perf_counter()
+        prefetcher.note_search(professions[0], filters)
+        stats = stats_advanced.VacancyStats(professions[0], **filters)
+        stats.get_basic_stats()
+        times[index] = time.perf_counter() - start
+        with lock:
+            active[0] -= 1
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    prefetcher.stop()
+    return np.array(times), prefetcher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--gap', type=float, default=0.3)
+    parser.add_argument('--think', type=float, default=2.0)
+    parser.add_argument('--found', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--prefetch-share', type=float, default=0.25)
+    args = parser.parse_args()
+
+    server, _, url = start_server(latency=args.latency, found=args.found)
+    os.environ.update(HH_API_URL=url, HH_STORE_PATH='', HH_RATE='100')
+    import stats_advanced
+
+    print(f'пользователей: {args.users}, чтение результата: {args.think} с, '
+          f'вакансий на запрос: {args.found}')
+    print(f'{"":>10} {"p50, мс":>9} {"p95, мс":>9} {"в кэше":>8} {"сэкономлено, с":>15}')
+    for enabled in (False, True):
+        stats_advanced.RESULT_CACHE.clear()
+        stats_advanced.SUMMARY_CACHE.clear()
+        times, report = run(args, enabled, 'on' if enabled else 'off')
+        print(f'{"prefetch" if enabled else "без него":>10} '
+              f'{np.median(times) * 1000:>9.0f} {np.percentile(times, 95) * 1000:>9.0f} '
+              f'{report["hit_rate"]:>8.0%} {report["saved_seconds"]:>15.2f}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
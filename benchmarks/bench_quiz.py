@@ -0,0 +1,122 @@
+'''Бенчмарк подсчета результатов викторины: прежний цикл против матриц quiz.QuizEngine
+
+Сначала проверяется правильность: прежний код искал номер вопроса через
+answers.index(ответ), и повторяющиеся номера ответов засчитывались первому
+вопросу с таким номером. Проверки здесь (основные — в tests/test_quiz.py):
+ручные примеры с повторами и совпадение с прежним кодом на наборах без
+повторов (где он считал верно). Затем печатается время одного подсчета
+(QuizEngine.score, цикл по спискам индексов) и пропускная способность
+пакетного QuizEngine.score_batch (матрицы).
+
+Запуск: python benchmarks/bench_quiz.py [--sets 10000]
+'''
+import argparse
+import os
+import sys
+import time
+from itertools import permutations
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import quiz  # noqa: E402
+
+
+def legacy(answers):
+    '''Прежний calculate_quiz_result (с поиском вопроса через index)'''
+    trait_scores = {}
+    for answer_idx in answers:
+        question_num = answers.index(answer_idx)
+        if question_num < len(quiz.QUIZ_QUESTIONS):
+            question = quiz.QUIZ_QUESTIONS[question_num]
+            if answer_idx < len(question['options']):
+                for trait in question['options'][answer_idx]['traits']:
+                    trait_scores[trait] = trait_scores.get(trait, 0) + 1
+    profile_scores = {profile: sum(trait_scores.get(t, 0) for t in traits)
+                      for profile, traits in quiz.PROFILE_TRAITS.items()}
+    max_profile = max(profile_scores, key=profile_scores.get)
+    if len(set(profile_scores.values())) <= 2:
+        max_profile = 'balanced'
+    return {'profile': max_profile, 'scores': profile_scores, 'trait_scores': trait_scores}
+
+
+def expected_traits(answers):
+    '''Черты, посчитанные вручную: ответ i — на вопрос i'''
+    traits = {}
+    for question, answer in zip(quiz.QUIZ_QUESTIONS, answers):
+        if 0 <= answer < len(question['options']):
+            for trait in question['options'][answer]['traits']:
+                traits[trait] = traits.get(trait, 0) + 1
+    return traits
+
+
+def check(engine):
+    questions = len(quiz.QUIZ_QUESTIONS)
+    options = len(quiz.QUIZ_QUESTIONS[0]['options'])
+
+    # Повторяющиеся номера: каждый ответ засчитывается своему вопросу
+    for answers in ([0] * questions, [3] * questions, [1, 1, 2, 2, 0, 0, 3]):
+        result = quiz.calculate_quiz_result(answers)
+        assert result['trait_scores'] == expected_traits(answers), answers
+        assert sum(result['trait_scores'].values()) == sum(
+            len(q['options'][a]['traits']) for q, a in zip(quiz.QUIZ_QUESTIONS, answers))
+
+    # Неполные наборы, лишние и неверные номера
+    assert quiz.calculate_quiz_result([])['profile'] == 'balanced'
+    assert quiz.calculate_quiz_result([2, 9, -1])['trait_scores'] == expected_traits([2])
+    assert (quiz.calculate_quiz_result([1] * (questions + 3))['trait_scores']
+            == expected_traits([1] * questions))
+
+    # Без повторов прежний код считал верно — результаты должны совпасть
+    for head in permutations(range(options)):
+        answers = list(head) + [9] * (questions - options)
+        assert quiz.calculate_quiz_result(answers) == legacy(answers), answers
+
+    # Пакет совпадает с поштучным подсчетом
+    rng = np.random.default_rng(0)
+    sets = rng.integers(0, options, (500, questions)).tolist()
+    _, profile_scores, best = engine.score_batch(sets)
+    for answers, scores, index in zip(sets, profile_scores, best):
+        result = quiz.calculate_quiz_result(answers)
+        assert result['profile'] == engine.profiles[index]
+        assert list(result['scores'].values()) == scores.tolist()
+    print('проверки пройдены')
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sets', type=int, default=10_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine = quiz.get_engine()
+    print(f'компиляция: {(time.perf_counter() - start) * 1000:.1f} мс, '
+          f'черт: {len(engine.traits)}, профилей: {len(engine.profiles)}')
+    check(engine)
+
+    rng = np.random.default_rng(1)
+    options = len(quiz.QUIZ_QUESTIONS[0]['options'])
+    sets = rng.integers(0, options, (args.sets, len(quiz.QUIZ_QUESTIONS))).tolist()
+    answers = sets[0]
+
+    one_legacy = timed(lambda: legacy(answers), 2000)
+    one_engine = timed(lambda: quiz.calculate_quiz_result(answers), 2000)
+    many_legacy = timed(lambda: [legacy(a) for a in sets], 1)
+    many_engine = timed(lambda: engine.score_batch(sets), 3)
+
+    print(f'{"":>22} {"прежний":>10} {"QuizEngine":>10}')
+    print(f'{"один набор, мкс":>22} {one_legacy * 1e6:>10.1f} {one_engine * 1e6:>10.1f}')
+    print(f'{"наборов в секунду":>22} {args.sets / many_legacy:>10.0f} '
+          f'{args.sets / many_engine:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''Бенчмарк нормализации зарплат: DataFrame.apply по строкам против векторных функций
+
+Запуск: python benchmarks/bench_salary.py
+'''
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import converter  # noqa: E402
+from stub_hh_server import make_vacancy  # noqa: E402
+
+
+def legacy_prepare(df):
+    '''Прежний prepare_salary_data: .loc для середины вилки и apply по строкам'''
+    def convert_to_rub(row):
+        if row['salary.currency'] == 'EUR':
+            return row['salary'] * 90
+        if row['salary.currency'] == 'USD':
+            return row['salary'] * 80
+        return row['salary']
+
+    def convert_to_net(row):
+        if row['salary.gross'] == 1:
+            return row['salary'] * 0.87
+        return row['salary']
+
+    df = df.copy()
+    df['salary'] = (df['salary.from'].fillna(0) + df['salary.to'].fillna(0)) / 2
+    df.loc[df['salary.from'].isna() & df['salary.to'].notna(), 'salary'] = df['salary.to']
+    df.loc[df['salary.to'].isna() & df['salary.from'].notna(), 'salary'] = df['salary.from']
+    df['salary'] = df.apply(convert_to_rub, axis=1)
+    df['salary'] = df.apply(convert_to_net, axis=1)
+    return df[(df['salary'] > 0) & (df['salary'] < 1000000)]['salary']
+
+
+def vector_prepare(df):
+    '''Новый prepare_salary_data на функциях converter'''
+    salary = converter.salary_midpoint(df['salary.from'], df['salary.to'])
+    salary = converter.to_rub(salary, converter.currency_codes(df['salary.currency']))
+    salary = pd.Series(converter.to_net(salary, df['salary.gross']), index=df.index)
+    return salary[(salary > 0) & (salary < 1000000)]
+
+
+def make_frame(rows):
+    '''Широкий кадр, как после pd.json_normalize выдачи hh.ru'''
+    base = pd.json_normalize([make_vacancy(1, i, time.time()) for i in range(2000)])
+    return pd.concat([base] * (rows // len(base)), ignore_index=True)
+
+
+def timeit(fn, df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    for rows, repeat in [(2000, 5), (200_000, 1)]:
+        df = make_frame(rows)
+        legacy_time, legacy = timeit(legacy_prepare, df, repeat)
+        vector_time, vector = timeit(vector_prepare, df, repeat)
+        assert np.allclose(legacy.to_numpy(), vector.to_numpy())
+        print(f'{rows:>7} строк: apply {legacy_time * 1000:9.1f} мс, '
+              f'векторно {vector_time * 1000:7.2f} мс, x{legacy_time / vector_time:.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''Бенчмарк сливаемых сводок зарплат (sketch.SalarySummary) против точных квантилей
+
+Для 2k, 20k и 200k зарплат (логнормальное распределение, как у выдачи hh.ru)
+печатаются: размер сводки против столбца, время построения, максимальная
+ошибка ранга по 99 квантилям и то же для сводки, слитой из шардов по 2000
+значений (так собирается статистика «по всем городам» из кэша), и время
+слияния одной пары сводок.
+
+Запуск: python benchmarks/bench_sketch.py
+'''
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import sketch  # noqa: E402
+
+SHARD = 2000
+QUANTILES = np.linspace(0.01, 0.99, 99)
+
+
+def rank_error(summary, exact):
+    '''Максимальная по QUANTILES доля значений между истинным и найденным квантилем'''
+    found = summary.sketch.quantiles(QUANTILES)
+    return float(np.max(np.abs(np.searchsorted(exact, found, side='right') / len(exact)
+                               - QUANTILES)))
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f'{"зарплат":>8} {"сводка, КБ":>11} {"столбец, КБ":>12} {"построение, мс":>15} '
+          f'{"ошибка ранга":>13} {"из шардов":>10} {"слияние пары, мкс":>18}')
+    for count in (2000, 20_000, 200_000):
+        salaries = rng.lognormal(11.5, 0.5, count)
+        exact = np.sort(salaries)
+
+        start = time.perf_counter()
+        summary = sketch.SalarySummary.from_salaries(salaries)
+        build = time.perf_counter() - start
+
+        shards = [sketch.SalarySummary.from_salaries(part)
+                  for part in np.split(salaries, count // SHARD)]
+        merged = sketch.SalarySummary.merged(shards)
+        assert merged.count == count and abs(merged.mean - salaries.mean()) < 1e-6 * merged.mean
+
+        start = time.perf_counter()
+        for _ in range(100):
+            sketch.SalarySummary.merged(shards[:2] if len(shards) > 1 else shards * 2)
+        pair = (time.perf_counter() - start) / 100
+
+        print(f'{count:>8} {summary.nbytes / 2**10:>11.1f} {salaries.nbytes / 2**10:>12.1f} '
+              f'{build * 1000:>15.2f} {rank_error(summary, exact):>12.2%} '
+              f'{rank_error(merged, exact):>9.2%} {pair * 1e6:>18.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''Бенчмарк холодного старта: профиль импорта точек входа бота (python -X importtime)
+
+Для main_advanced и main_async в отдельном процессе выполняется только импорт
+модуля (поллинг не запускается) и печатаются: время импорта, самые дорогие
+модули по накопленному времени и тяжелые библиотеки, загруженные до старта
+поллинга — их там быть не должно. С --save отчет записывается в файл
+(benchmarks/startup_report.txt хранится в репозитории для сравнения),
+с --check процесс завершается с ошибкой, если тяжелые библиотеки грузятся при старте.
+
+Запуск: python benchmarks/bench_startup.py [--repeat 5] [--save benchmarks/startup_report.txt]
+'''
+import argparse
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+ENTRY_POINTS = ['main_advanced', 'main_async']
+
+# Библиотеки, которые должны грузиться в фоне или при первом поиске
+HEAVY = ['pandas', 'numpy', 'matplotlib', 'seaborn', 'stats_advanced', 'charts']
+
+
+def profile(module):
+    '''Импорт модуля в чистом процессе: (строки -X importtime, загруженные тяжелые библиотеки)'''
+    code = ('import sys; sys.path.insert(0, sys.argv[1]); import ' + module + '; '
+            'print(",".join(m for m in sys.argv[2:] if m in sys.modules))')
+    env = dict(os.environ, BOT_TOKEN='123:fake', HH_STORE_PATH='')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, SRC, *HEAVY],
+                            capture_output=True, text=True, env=env, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    heavy = [m for m in result.stdout.strip().split(',') if m]
+    return rows, heavy
+
+
+def report(module, repeat, top):
+    '''Текст отчета по точке входа: медиана времени импорта по repeat запускам'''
+    runs = [profile(module) for _ in range(repeat)]
+    totals = sorted(next(r[0] for r in rows if r[2].strip() == module) for rows, _ in runs)
+    rows, heavy = runs[len(runs) // 2]
+
+    lines = [f'{module}: импорт {totals[len(totals) // 2] / 1000:.0f} мс '
+             f'(медиана из {repeat}, мин {totals[0] / 1000:.0f} мс)',
+             f'  тяжелые библиотеки при старте: {", ".join(heavy) or "нет"}',
+             '  накопл., мс   собств., мс   модуль']
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:top]:
+        lines.append(f'  {cumulative / 1000:11.1f}   {self_us / 1000:11.1f}   {name}')
+    return '\n'.join(lines), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--save', help='файл для отчета')
+    parser.add_argument('--check', action='store_true',
+                        help='ошибка, если тяжелые библиотеки грузятся при старте')
+    args = parser.parse_args()
+
+    texts = []
+    failed = False
+    for module in ENTRY_POINTS:
+        text, heavy = report(module, args.repeat, args.top)
+        texts.append(text)
+        failed = failed or bool(heavy)
+        print(text, end='\n\n')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            f.write(f'# python {sys.version.split()[0]}, {sys.platform}\n\n')
+            f.write('\n\n'.join(texts) + '\n')
+
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''Бенчмарк хранилища состояния пользователей: словари в памяти против state_store
+
+N пользователей меняют настройки и начинают викторину. Прежний вариант —
+словари словарей (как было в bot_core и quiz.QuizSession); новый —
+StateStore над SQLite с LRU на --cache записей и отложенной записью.
+Печатаются память Python-объектов (tracemalloc) после заполнения, время на
+изменение и чтение одной записи и время повторного открытия базы
+(«перезапуск»), после которого все записи на месте.
+
+Запуск: python benchmarks/bench_state.py [--users 100000 1000000] [--cache 100000]
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import state_store  # noqa: E402
+
+
+def legacy(users):
+    '''Прежнее состояние: настройки и сессии викторины в словарях'''
+    user_settings, sessions = {}, {}
+    for user_id in range(users):
+        user_settings[user_id] = {'city_id': 2, 'experience': 'all', 'remote_only': 1}
+        sessions[user_id] = {'current_question': 1, 'answers': [2]}
+    return user_settings, sessions
+
+
+def fill(store, users):
+    '''То же через StateStore'''
+    for user_id in range(users):
+        store.put(state_store.Settings(2, 'all', 1), user_id)
+        store.put(state_store.QuizProgress(b'\x02'), user_id)
+    store.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--cache', type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f'{"польз.":>9} {"словари, МБ":>12} {"store, МБ":>10} {"запись, мкс":>12} '
+          f'{"чтение, мкс":>12} {"открытие, мс":>13}')
+    for users in args.users:
+        tracemalloc.start()
+        state = legacy(users)
+        legacy_bytes = tracemalloc.get_traced_memory()[0]
+        del state
+        tracemalloc.stop()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.sqlite3')
+            store = state_store.StateStore(state_store.SQLiteBackend(path), cache_size=args.cache)
+            tracemalloc.start()
+            start = time.perf_counter()
+            fill(store, users)
+            write = (time.perf_counter() - start) / (2 * users)
+            store_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            store.close()
+
+            # «Перезапуск»: новая база, записи читаются с диска
+            start = time.perf_counter()
+            store = state_store.StateStore(state_store.SQLiteBackend(path), cache_size=args.cache)
+            reopen = time.perf_counter() - start
+            sample = range(0, users, max(1, users // 10_000))
+            start = time.perf_counter()
+            for user_id in sample:
+                assert store.get(state_store.Settings, user_id).city_id == 2
+                assert store.get(state_store.QuizProgress, user_id).answers == b'\x02'
+            read = (time.perf_counter() - start) / (2 * len(sample))
+            store.close()
+
+        print(f'{users:>9} {legacy_bytes / 2**20:>12.1f} {store_bytes / 2**20:>10.1f} '
+              f'{write * 1e6:>12.1f} {read * 1e6:>12.1f} {reopen * 1000:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+'''Набор офлайн-бенчмарков статистики с сохранением результатов и сравнением с базой
+
+Наборы данных: записанные страницы hh.ru из benchmarks/fixtures
+(record_fixtures.py) и синтетические выдачи на 2k, 20k и 200k вакансий
+(вакансии stub_hh_server.make_vacancy; для больших наборов — первые 20k,
+повторенные по кругу). Для каждого набора меряются:
+
+    fetch             загрузка выдачи со стаба hh.ru через HHClient (по 2000
+                      вакансий на запрос, как у hh.ru; наборы больше --fetch-limit
+                      не грузятся)
+    normalize         проекция вакансий (schema.project) и сборка кадра
+    stat.<имя>        каждая статистика VacancyStats и текст сообщения
+    chart.<имя>       гистограмма, детальный отчет и сравнение (без кэша PNG)
+    e2e.search        main_advanced.process_search_query с фейковым Telegram:
+                      от запроса до отправленного графика (наборы до 2000)
+
+Каждое значение — медиана --repeat прогонов в секундах, кэши очищаются перед
+каждым прогоном. Результаты пишутся в JSON (--out) и сравниваются с базой
+(--baseline): замеры медленнее базы больше чем на --tolerance и на
+--min-delta секунд (доли миллисекунды шумят) помечаются как регрессии, и
+скрипт завершается с кодом 1. --save-baseline записывает
+текущие результаты как новую базу.
+
+Запуск: python benchmarks/bench_suite.py [--sizes 2000,20000,200000] [--repeat 5]
+'''
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from fake_telegram import FakeTelegram, message_update  # noqa: E402
+from stub_hh_server import load_fixture, make_vacancy, start_server  # noqa: E402
+
+FIXTURES_DIR = os.path.join(HERE, 'fixtures')
+BASELINE = os.path.join(HERE, 'suite_baseline.json')
+
+# Сколько разных синтетических вакансий генерировать (остальные — повтор по кругу)
+DISTINCT = 20000
+
+# Выдача hh.ru не глубже 2000 вакансий на запрос
+HH_DEPTH = 2000
+
+STATS = {
+    'salary_prep': lambda s: s.prepare_salary_data(),
+    'basic_stats': lambda s: s.get_basic_stats(),
+    'salary_summary': lambda s: s.salary_summary(),
+    'top_employers': lambda s: s.get_top_employers(),
+    'top_paid_employers': lambda s: s.get_top_paid_employers(),
+    'experience': lambda s: s.get_experience_distribution(),
+    'employment': lambda s: s.get_employment_type_distribution(),
+}
+
+
+def synthetic_items(size):
+    '''Синтетическая выдача: size вакансий в формате hh.ru'''
+    pool = [make_vacancy(size, i, time.time() - i * 60) for i in range(min(size, DISTINCT))]
+    return [pool[i % len(pool)] for i in range(size)]
+
+
+def datasets(sizes, fixtures_dir):
+    '''Наборы данных: {имя: список вакансий}'''
+    result = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, '*.json*'))):
+        name = os.path.basename(path).split('.')[0]
+        result[f'recorded:{name}'] = load_fixture(path)
+    for size in sizes:
+        result[f'synthetic:{size // 1000}k'] = synthetic_items(size)
+    return result
+
+
+def median_time(fn, repeat, setup=None):
+    '''Медиана времени fn() по repeat прогонам (setup() перед каждым, вне замера)'''
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def clear_caches():
+    import bot_core
+    import stats_advanced
+    for cache in (stats_advanced.RESULT_CACHE, stats_advanced.SUMMARY_CACHE,
+                  stats_advanced.CHART_CACHE, bot_core.PHOTO_IDS):
+        cache.clear()
+
+
+def bench_dataset(name, items, stub, url, fake, args):
+    '''Замеры одного набора: {замер: секунды}'''
+    import hh_client
+    import schema
+    import stats_advanced
+
+    results = {}
+    stub.items = items
+    stub.found = min(len(items), HH_DEPTH)
+
+    # Загрузка: запросов столько, сколько нужно, чтобы набрать набор по 2000
+    if len(items) <= args.fetch_limit:
+        queries = [f'{name} {i}' for i in range(-(-len(items) // HH_DEPTH))]
+
+        def fetch(client):
+            for query in queries:
+                for _ in client.iter_pages({'text': query, 'area': 1}):
+                    pass
+            client.close()
+        results['fetch'] = median_time(fetch, args.repeat,
+                                       setup=lambda: hh_client.HHClient(url, rate=100000))
+
+    # Нормализация: страницы по 100 вакансий, как их отдает клиент
+    pages = [items[i:i + hh_client.PER_PAGE] for i in range(0, len(items), hh_client.PER_PAGE)]
+
+    def normalize(_):
+        return schema.build_frame([schema.project(item) for item in page] for page in pages)
+    results['normalize'] = median_time(normalize, args.repeat)
+    df = normalize(None)
+
+    def fresh(prepared=True):
+        clear_caches()
+        stats = stats_advanced.VacancyStats.from_frame(name, 1, df, key=(name, 1))
+        if prepared:
+            stats.prepare_salary_data()
+        return stats
+
+    for stat, fn in STATS.items():
+        results[f'stat.{stat}'] = median_time(fn, args.repeat,
+                                              setup=lambda: fresh(stat != 'salary_prep'))
+    results['stat.format_message'] = median_time(stats_advanced.format_stats_message,
+                                                 args.repeat, setup=lambda: fresh(False))
+
+    others = [stats_advanced.VacancyStats.from_frame(f'{name} {i}', 1, df.iloc[i::3])
+              for i in range(3)]
+    charts = {
+        'histogram': lambda s: s.create_salary_histogram(),
+        'detailed_report': lambda s: s.create_detailed_report(),
+        'comparison': lambda s: stats_advanced.Comparison([s] + others).create_chart(),
+    }
+    for chart, fn in charts.items():
+        results[f'chart.{chart}'] = median_time(fn, args.repeat, setup=fresh)
+
+    if len(items) <= HH_DEPTH:
+        results['e2e.search'] = median_time(lambda message: e2e_search(fake, message),
+                                            args.repeat, setup=lambda: e2e_message(fake))
+    return {key: round(value, 6) for key, value in results.items()}
+
+
+def e2e_message(fake):
+    '''Новое сообщение от нового пользователя (кэши пусты)'''
+    from telebot import types
+    clear_caches()
+    update_id = fake.next_update_id()
+    return types.Message.de_json(message_update(update_id, 10_000 + update_id, 'бенчмарк')
+                                 ['message'])
+
+
+def e2e_search(fake, message):
+    '''Поиск через обработчик бота до отправленного графика'''
+    import main_advanced
+    chat_id = str(message.chat.id)
+    main_advanced.process_search_query(message, message.text)
+    done = fake.wait_for(lambda calls: any(m == 'sendPhoto' and str(f.get('chat_id')) == chat_id
+                                           for _, m, f in calls), 60)
+    assert done, 'бот не отправил график'
+
+
+def meta():
+    '''Окружение прогона'''
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+    }
+
+
+def compare(results, baseline, tolerance, min_delta):
+    '''Таблица сравнения с базой и список регрессий'''
+    regressions = []
+    print(f'{"набор":>18} {"замер":>26} {"база, мс":>10} {"сейчас, мс":>11} {"изм.":>7}')
+    for name, rows in results.items():
+        base_rows = baseline.get(name, {})
+        for key, value in rows.items():
+            base = base_rows.get(key)
+            if base is None:
+                print(f'{name:>18} {key:>26} {"—":>10} {value * 1000:>11.1f} {"новый":>7}')
+                continue
+            change = value / base - 1 if base else 0.0
+            mark = ''
+            if change > tolerance and value - base > min_delta:
+                mark = ' ⚠️'
+                regressions.append((name, key, change))
+            print(f'{name:>18} {key:>26} {base * 1000:>10.1f} {value * 1000:>11.1f} '
+                  f'{change:>+7.0%}{mark}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='2000,20000,200000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fetch-limit', type=int, default=20000)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    parser.add_argument('--out', default=os.path.join(HERE, 'suite_latest.json'))
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-delta', type=float, default=0.002)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    server, stub, url = start_server(latency=0)
+    fake = FakeTelegram().start()
+    # Настройки читаются модулями при импорте: стаб, без хранилищ на диске и без лимитов
+    os.environ.update({
+        'BOT_TOKEN': '123:fake', 'HH_API_URL': url, 'HH_STORE_PATH': '', 'BOT_STATE_PATH': '',
+        'HH_RATE': '100000', 'BOT_METRICS_LOG': '', 'BOT_PREFETCH_TOP': '0'
+    })
+    os.chdir(tempfile.mkdtemp(prefix='bench-suite-'))
+    import telebot.apihelper
+    telebot.apihelper.API_URL = fake.api_url
+    import main_advanced
+    main_advanced.warm_up()
+
+    results = {}
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    for name, items in datasets(sizes, args.fixtures).items():
+        start = time.perf_counter()
+        results[name] = bench_dataset(name, items, stub, url, fake, args)
+        print(f'{name}: {len(items)} вакансий, {time.perf_counter() - start:.1f} с')
+
+    report = {'meta': meta(), 'results': results}
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f'результаты: {args.out}')
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f'база: {args.baseline} (коммит {baseline["meta"].get("commit") or "?"})')
+        regressions = compare(results, baseline['results'], args.tolerance, args.min_delta)
+        print(f'регрессий больше {args.tolerance:.0%}: {len(regressions)}')
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f'база сохранена: {args.baseline}')
+
+    # Процессы рисовальщиков иначе пережили бы os._exit сиротами с открытым stdout
+    main_advanced.dispatcher.shutdown(wait=True)
+    server.shutdown()
+    fake.stop()
+    # Остальные потоки бота не ждем
+    os._exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+'''Бенчмарк webhook-режима: пропускная способность от числа процессов-обработчиков
+
+Для каждого N из --workers запускается src/main_webhook.py с N обработчиками
+против фейкового Telegram API и стаба hh.ru. Генератор апдейтов шлет в
+приемник POST-запросы, как Telegram: --users пользователей, у каждого свой
+поисковый запрос (без попаданий в кэш, нагрузка — разбор выдачи, статистика
+и графики). Сначала каждый процесс прогревается одним поиском, затем меряется
+время до итоговой статистики у всех пользователей. Печатаются поисков в
+секунду и ускорение относительно первого N; при линейном масштабировании
+ускорение близко к min(N, число ядер).
+
+Запуск: python benchmarks/bench_webhook.py [--workers 1 2 4] [--users 48]
+'''
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+
+from fake_telegram import FakeTelegram, message_update  # noqa: E402
+from stub_hh_server import start_server  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class UpdateGenerator:
+    '''Фейковый Telegram на стороне webhook: POST апдейтов в приемник'''
+
+    def __init__(self, url, secret='', concurrency=16, retries=3):
+        self.url = url
+        self.secret = secret
+        self.retries = retries
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.update_id = 0
+        self.errors = []  # апдейты, не доставленные после повторов: (update_id, ошибка)
+
+    def post(self, update):
+        '''Статус ответа приемника; обрывы повторяются, как у Telegram (None — не доставлен)'''
+        request = urllib.request.Request(
+            self.url, data=json.dumps(update).encode(), method='POST',
+            headers={'Content-Type': 'application/json',
+                     'X-Telegram-Bot-Api-Secret-Token': self.secret})
+        for attempt in range(self.retries + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    return response.status
+            except urllib.error.HTTPError as e:
+                # Приемник ответил: повтор не поможет
+                self.errors.append((update['update_id'], f'HTTP {e.code}'))
+                return e.code
+            except OSError as e:
+                if attempt == self.retries:
+                    self.errors.append((update['update_id'], repr(e)))
+                    return None
+                time.sleep(0.1 * 2 ** attempt)
+
+    def messages(self, texts):
+        '''Сообщения {user_id: текст}, отправляемые параллельно; {user_id: статус}'''
+        updates = []
+        for user_id, text in texts.items():
+            self.update_id += 1
+            updates.append(message_update(self.update_id, user_id, text))
+        return dict(zip(texts, self.pool.map(self.post, updates)))
+
+    def wait_ready(self, timeout=30):
+        '''Ожидание, пока приемник начнет принимать соединения'''
+        host, port = self.url.split('//')[1].split('/')[0].split(':')
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection((host, int(port)), timeout=1).close()
+                return True
+            except OSError:
+                time.sleep(0.1)
+        return False
+
+
+def answered(users):
+    '''Предикат FakeTelegram: у всех users есть итоговая статистика'''
+    users = set(users)
+
+    def check(calls):
+        done = {int(f.get('chat_id', 0)) for _, m, f in calls
+                if m in ('sendMessage', 'editMessageText')
+                and ('Статистика' in f.get('text', '') or '❌' in f.get('text', ''))}
+        return users <= done
+    return check
+
+
+def delivered(statuses):
+    '''Пользователи, чьи апдейты приемник принял'''
+    return [user_id for user_id, status in statuses.items() if status == 200]
+
+
+def run(workers, args, fake, hh_url):
+    '''Один прогон: (поисков в секунду, завершены ли все, сколько апдейтов не доставлено)'''
+    port = free_port()
+    secret = 'bench'
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, BOT_TOKEN='123:fake', BOT_API_URL=fake.api_url,
+                   HH_API_URL=hh_url, HH_RATE='100000', BOT_WEBHOOK_WORKERS=str(workers),
+                   BOT_WEBHOOK_HOST='127.0.0.1', BOT_WEBHOOK_PORT=str(port),
+                   BOT_WEBHOOK_SECRET=secret, BOT_WEBHOOK_URL='',
+                   BOT_MAX_ACTIVE_USERS=str(args.users * 2))
+        log = open(os.path.join(workdir, 'bot.log'), 'w')
+        bot = subprocess.Popen([sys.executable, os.path.join(SRC, 'main_webhook.py')],
+                               cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            generator = UpdateGenerator(f'http://127.0.0.1:{port}/webhook', secret)
+            generator.wait_ready()
+
+            # Прогрев: по поиску на процесс (N подряд идущих id попадают во все N процессов)
+            warm = {user_id: f'прогрев {workers} {user_id}'
+                    for user_id in range(100 * workers, 101 * workers)}
+            fake.wait_for(answered(delivered(generator.messages(warm))), args.timeout)
+
+            base = 1000 * workers
+            texts = {base + i: f'профессия {workers} {i}' for i in range(args.users)}
+            start = time.perf_counter()
+            users = delivered(generator.messages(texts))
+            ok = fake.wait_for(answered(users), args.timeout)
+            elapsed = time.perf_counter() - start
+        finally:
+            bot.terminate()
+            bot.wait(timeout=15)
+            log.close()
+    for update_id, error in generator.errors:
+        print(f'апдейт {update_id} не доставлен: {error}')
+    return len(users) / elapsed, ok, len(generator.errors)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=48)
+    parser.add_argument('--found', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    hh_server, _, hh_url = start_server(latency=args.latency, found=args.found)
+    fake = FakeTelegram().start()
+    print(f'ядер: {os.cpu_count()}, пользователей: {args.users}, вакансий на запрос: {args.found}')
+    print(f'{"процессов":>10} {"поисков/с":>10} {"ускорение":>10}')
+    first = None
+    for workers in args.workers:
+        rate, ok, lost = run(workers, args, fake, hh_url)
+        first = first or rate
+        print(f'{workers:>10} {rate:>10.1f} {rate / first:>9.2f}x' + ('' if ok else '  (таймаут)')
+              + (f'  (не доставлено: {lost})' if lost else ''))
+    hh_server.shutdown()
+    fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+'''Локальный фейковый Telegram Bot API для нагрузочных тестов
+
+Понимает методы, которые вызывает бот (getUpdates, sendMessage, sendPhoto,
+editMessageText, ...), отдает апдейты, добавленные через push_update, и
+записывает все вызовы с временем, чтобы считать задержки ответов.
+
+Боту нужно подменить адрес API:
+    telebot.apihelper.API_URL = fake.api_url      # TeleBot
+    telebot.asyncio_helper.API_URL = fake.api_url  # AsyncTeleBot
+'''
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MULTIPART_FIELD = re.compile(
+    rb'name="([^"]+)"(?:; filename="[^"]*")?\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', re.S)
+
+
+def parse_fields(body, content_type):
+    '''Поля запроса из urlencoded- или multipart-тела'''
+    if content_type.startswith('multipart/form-data'):
+        fields = {}
+        for name, value in MULTIPART_FIELD.findall(body):
+            try:
+                fields[name.decode()] = value.decode()
+            except UnicodeDecodeError:
+                fields[name.decode()] = f'<{len(value)} байт>'
+        return fields
+    if content_type.startswith('application/json'):
+        return json.loads(body or b'{}')
+    return {k: v[-1] for k, v in parse_qs(body.decode()).items()}
+
+
+def message_update(update_id, user_id, text, message_id=None):
+    '''Апдейт с текстовым сообщением пользователя'''
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] \
+        if text.startswith('/') else None
+    message = {
+        'message_id': message_id or update_id,
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        'chat': {'id': user_id, 'type': 'private'},
+        'date': int(time.time()),
+        'text': text
+    }
+    if entities:
+        message['entities'] = entities
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id, user_id, data, message_id=1):
+    '''Апдейт с нажатием inline-кнопки'''
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'FakeBot'},
+                'chat': {'id': user_id, 'type': 'private'},
+                'date': int(time.time()),
+                'text': '...'
+            }
+        }
+    }
+
+
+class FakeTelegram:
+    '''Состояние фейкового API: очередь апдейтов и журнал вызовов
+
+    on_call(время, метод, поля, результат) вызывается на каждый метод, кроме
+    getUpdates; keep_calls=False не копит журнал (для долгих прогонов).
+    '''
+
+    def __init__(self, poll_timeout=1.0, on_call=None, keep_calls=True):
+        self.poll_timeout = poll_timeout
+        self.on_call = on_call
+        self.keep_calls = keep_calls
+        self.updates = []
+        self.calls = []  # (время, метод, поля)
+        self.cond = threading.Condition()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+        self.server = None
+        self.api_url = None
+
+    def next_update_id(self):
+        return next(self._update_ids)
+
+    def push_update(self, update):
+        '''Добавление апдейта, который бот получит в getUpdates'''
+        with self.cond:
+            self.updates.append(update)
+            self.cond.notify_all()
+
+    def push_message(self, user_id, text):
+        '''Сообщение от пользователя'''
+        self.push_update(message_update(self.next_update_id(), user_id, text))
+
+    def push_callback(self, user_id, data, message_id=1):
+        '''Нажатие кнопки пользователем'''
+        self.push_update(callback_update(self.next_update_id(), user_id, data, message_id))
+
+    def get_updates(self, fields):
+        offset = int(fields.get('offset', 0) or 0)
+        timeout = min(float(fields.get('timeout', 0) or 0), self.poll_timeout)
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            if offset < 0:
+                self.updates = self.updates[offset:]
+            else:
+                self.updates = [u for u in self.updates if u['update_id'] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self.cond.wait(deadline - time.monotonic())
+            return list(self.updates[:100])
+
+    def call(self, method, fields):
+        '''Ответ на метод Bot API'''
+        if method == 'getUpdates':
+            return self.get_updates(fields)
+
+        now = time.perf_counter()
+        result = self.result(method, fields)
+        if self.keep_calls:
+            with self.cond:
+                self.calls.append((now, method, fields))
+                self.cond.notify_all()
+        if self.on_call is not None:
+            self.on_call(now, method, fields, result)
+        return result
+
+    def result(self, method, fields):
+        '''Результат метода Bot API'''
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+        if method in ('sendMessage', 'sendPhoto', 'editMessageText'):
+            chat_id = int(fields.get('chat_id', 0))
+            message = {
+                'message_id': int(fields.get('message_id') or next(self._message_ids)),
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'FakeBot'},
+                'chat': {'id': chat_id, 'type': 'private'},
+                'date': int(time.time()),
+                'text': fields.get('text', fields.get('caption', ''))
+            }
+            if method == 'sendPhoto':
+                file_id = f"photo-{message['message_id']}"
+                message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id,
+                                     'width': 1280, 'height': 800}]
+            return message
+        return True
+
+    def wait_for(self, predicate, timeout):
+        '''Ожидание, пока predicate(calls) не станет истинным'''
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while not predicate(self.calls):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            return True
+
+    def start(self, port=0):
+        '''Запуск сервера в фоновом потоке'''
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(self))
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.api_url = base + '/bot{0}/{1}'
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def make_handler(fake):
+    '''Класс HTTP-обработчика, привязанный к фейковому API'''
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _handle(self, body):
+            url = urlparse(self.path)
+            method = url.path.rsplit('/', 1)[-1]
+            fields = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            fields.update(parse_fields(body, self.headers.get('Content-Type', '')))
+            payload = json.dumps({'ok': True, 'result': fake.call(method, fields)},
+                                 ensure_ascii=False).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self._handle(self.rfile.read(length))
+
+        do_GET = do_POST  # aiohttp-клиент AsyncTeleBot шлет GET с телом
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
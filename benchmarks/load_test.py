@@ -0,0 +1,164 @@
+'''Нагрузочный тест бота: синхронный TeleBot против AsyncTeleBot
+
+N пользователей одновременно присылают поисковый запрос; бот работает с
+фейковым Telegram API и стабом hh.ru. Меряется время до итоговой статистики
+у каждого пользователя, время до первого полезного ответа (предварительных
+итогов по первым страницам или сразу итоговых) и число потоков процесса.
+
+Запуск: python benchmarks/load_test.py --users 200 [--mode sync|async|both]
+'''
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+# Итоги приходят новым сообщением или правкой сообщения «Ищу вакансии»
+ANSWER_METHODS = ('sendMessage', 'editMessageText')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+def bot_threads():
+    '''Потоки бота без потоков-обработчиков фейковых серверов в этом же процессе'''
+    return sum(1 for t in threading.enumerate() if 'process_request_thread' not in t.name)
+
+
+def run_mode(args):
+    '''Один прогон в текущем процессе'''
+    from fake_telegram import FakeTelegram
+    from stub_hh_server import start_server
+
+    hh_server, stub, hh_url = start_server(latency=args.latency, found=args.found)
+    fake = FakeTelegram().start()
+
+    # Настройки читаются модулями при импорте
+    os.environ.update({
+        'BOT_TOKEN': '123:fake', 'HH_API_URL': hh_url, 'HH_STORE_PATH': '',
+        'HH_CONCURRENCY': str(args.hh_concurrency), 'HH_RATE': '100000',
+        'BOT_MAX_ACTIVE_USERS': str(args.users * 2)
+    })
+    os.chdir(args.workdir)
+
+    if args.mode == 'sync':
+        import telebot.apihelper
+        telebot.apihelper.API_URL = fake.api_url
+        import main_advanced as bot_module
+        poller = threading.Thread(target=bot_module.bot.infinity_polling,
+                                  kwargs={'timeout': 1, 'long_polling_timeout': 1},
+                                  daemon=True)
+    else:
+        import telebot.asyncio_helper
+        telebot.asyncio_helper.API_URL = fake.api_url
+        import main_async as bot_module
+        loop = asyncio.new_event_loop()
+        poller = threading.Thread(
+            target=loop.run_until_complete,
+            args=(bot_module.bot.polling(non_stop=True, timeout=1),), daemon=True)
+
+    poller.start()
+    fake.wait_for(lambda calls: any(c[1] == 'getMe' for c in calls), 10)
+    # Как при запуске бота: аналитика и рисовальщики загружены до первых запросов
+    bot_module.warm_up()
+
+    # Все пользователи пишут одновременно
+    users = range(1, args.users + 1)
+    start = time.perf_counter()
+    for user_id in users:
+        query = f'профессия {user_id}' if args.distinct else 'программист'
+        fake.push_message(user_id, query)
+
+    peak_threads = bot_threads()
+
+    def answered(calls):
+        done = {int(f['chat_id']) for _, m, f in calls
+                if m in ANSWER_METHODS and ('Статистика' in f.get('text', '')
+                                            or '❌' in f.get('text', ''))}
+        return len(done) >= args.users
+
+    sampler_stop = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not sampler_stop.wait(0.05):
+            peak_threads = max(peak_threads, bot_threads())
+
+    threading.Thread(target=sample_threads, daemon=True).start()
+    ok = fake.wait_for(answered, args.timeout)
+    sampler_stop.set()
+    total = time.perf_counter() - start
+
+    first_answer = {}
+    first_useful = {}
+    for t, method, fields in fake.calls:
+        if method not in ANSWER_METHODS:
+            continue
+        text = fields.get('text', '')
+        if 'Статистика' in text:
+            first_answer.setdefault(int(fields['chat_id']), t - start)
+        if 'Статистика' in text or 'Предварительно' in text:
+            first_useful.setdefault(int(fields['chat_id']), t - start)
+    latencies = list(first_answer.values())
+    useful = list(first_useful.values())
+
+    result = {
+        'mode': args.mode, 'users': args.users, 'completed': ok,
+        'answered': len(latencies), 'total_s': round(total, 2),
+        'p50_s': round(percentile(latencies, 0.5), 2),
+        'p95_s': round(percentile(latencies, 0.95), 2),
+        'max_s': round(max(latencies, default=float('nan')), 2),
+        'first_useful_p50_s': round(percentile(useful, 0.5), 2),
+        'first_useful_p95_s': round(percentile(useful, 0.95), 2),
+        'peak_threads': peak_threads, 'hh_requests': stub.requests
+    }
+    print(json.dumps(result, ensure_ascii=False))
+    # Процессы рисовальщиков иначе пережили бы os._exit сиротами с открытым stdout
+    if args.mode == 'sync':
+        bot_module.dispatcher.shutdown(wait=True)
+    else:
+        bot_module.renderer.shutdown(wait=True)
+    hh_server.shutdown()
+    fake.stop()
+    os._exit(0)  # поллинг не ждем
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--found', type=int, default=500)
+    parser.add_argument('--hh-concurrency', type=int, default=32)
+    parser.add_argument('--distinct', action='store_true',
+                        help='у каждого пользователя свой запрос (без попаданий в кэш)')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--workdir', default='/tmp')
+    args = parser.parse_args()
+
+    if args.mode != 'both':
+        run_mode(args)
+        return
+
+    # Каждый режим в отдельном процессе: модули бота читают настройки при импорте
+    for mode in ('sync', 'async'):
+        argv = sys.argv[1:]
+        if '--mode' in argv:
+            i = argv.index('--mode')
+            argv = argv[:i] + argv[i + 2:]
+        cmd = [sys.executable, __file__] + argv + ['--mode', mode]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        lines = out.stdout.strip().splitlines()
+        print(lines[-1] if lines else f'{mode}: нет вывода')
+
+
+if __name__ == '__main__':
+    main()
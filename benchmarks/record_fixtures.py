@@ -0,0 +1,89 @@
+'''Запись страниц выдачи hh.ru для офлайн-бенчмарков
+
+Загружает выдачу /vacancies по запросу (по умолчанию с api.hh.ru) и
+сохраняет страницы в benchmarks/fixtures/<имя>.json.gz. Перед записью
+выдача очищается (sanitize): из вакансий остаются только поля schema.FIELDS,
+id заменяются порядковыми номерами, названия работодателей — «Работодатель N»,
+так что в репозиторий не попадают ссылки, контакты и адреса. Стаб
+(stub_hh_server.py --fixture) и bench_suite.py потом отдают эти вакансии
+вместо сгенерированных, так что бенчмарки видят настоящие распределения
+зарплат, валют и работодателей без доступа к сети.
+
+Запуск: python benchmarks/record_fixtures.py "python разработчик" [--area 1] [--name python]
+'''
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+import hh_client  # noqa: E402
+import schema  # noqa: E402
+
+FIXTURES_DIR = os.path.join(HERE, 'fixtures')
+
+
+def record(client, query, area, max_pages):
+    '''Страницы выдачи целиком (с found, pages и полными вакансиями)'''
+    params = {'text': query, 'area': area, 'per_page': hh_client.PER_PAGE}
+    first = client.get_page(params, 0)
+    pages = [first]
+    for page in range(1, min(first.get('pages', 0), max_pages)):
+        pages.append(client.get_page(params, page))
+    return pages
+
+
+def sanitize(pages):
+    '''Страницы только с полями статистики, без id и названий работодателей hh.ru'''
+    ids, employers = {}, {}
+    result = []
+    for page in pages:
+        items = []
+        for item in page.get('items', []):
+            record = schema.project(item)
+            record['id'] = str(ids.setdefault(record['id'], len(ids) + 1))
+            if record['employer.name'] is not None:
+                record['employer.name'] = employers.setdefault(
+                    record['employer.name'], f'Работодатель {len(employers) + 1}')
+            clean = {'salary': None} if item.get('salary') is None else {}
+            for field, path in schema.FIELDS.items():
+                if clean.get(path[0], {}) is None:
+                    continue
+                node = clean
+                for key in path[:-1]:
+                    node = node.setdefault(key, {})
+                node[path[-1]] = record[field]
+            items.append(clean)
+        meta = {key: page[key] for key in ('found', 'pages', 'page', 'per_page') if key in page}
+        result.append(dict(meta, items=items))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('query')
+    parser.add_argument('--area', type=int, default=1)
+    parser.add_argument('--pages', type=int, default=hh_client.MAX_PAGES)
+    parser.add_argument('--name', help='имя файла (по умолчанию из запроса)')
+    parser.add_argument('--url', default=hh_client.HH_API_URL)
+    args = parser.parse_args()
+
+    client = hh_client.HHClient(args.url)
+    pages = sanitize(record(client, args.query, args.area, args.pages))
+    client.close()
+
+    name = args.name or re.sub(r'\W+', '_', args.query.lower()).strip('_')
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    path = os.path.join(FIXTURES_DIR, f'{name}.json.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(pages, f, ensure_ascii=False)
+    items = sum(len(page.get('items', [])) for page in pages)
+    print(f'{path}: {len(pages)} страниц, {items} вакансий')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,445 @@
+'''Нагрузочный и длительный (soak) тест: поиск, сравнение и викторина вперемешку
+
+--users виртуальных пользователей работают одновременно в течение --duration
+секунд: каждый выбирает сценарий по весам --mix, проходит его через настоящий
+бот (main_advanced: text_handler, callback_handler, send_quiz_question) с
+фейковым Telegram API и стабом hh.ru и делает паузу около --think секунд.
+С вероятностью --churn следующий сценарий начинает новый пользователь, так
+что число известных боту пользователей растет, как в проде.
+
+    search   запрос из --queries разных профессий, ответ — итоговая статистика
+    compare  «Сравнить профессии» и 2-3 профессии, ответ — текст сравнения
+    quiz     «Тест на профориентацию» и ответы на все вопросы кнопками;
+             задержка меряется на каждый ответ (quiz_answer)
+
+Раз в --sample секунд снимаются RSS процесса (бот и харнесс вместе; память
+харнесса ограничена: задержки копятся в KLL-скетчах), RSS рисовальщиков,
+число потоков и размеры структур бота: LRU состояния пользователей, кэши,
+очереди диспетчера и упреждающей загрузки. В конце печатаются пропускная
+способность, p50/p99 по сценариям, отказы «занято», ошибки и таймауты, а для
+каждого размера — прирост за час по второй половине прогона. ⚠️ помечаются
+структуры, вышедшие за свой предел (размер LRU, лимит кэша), и структуры без
+предела, которые к концу выросли больше чем в полтора раза против середины
+прогона. Доля ошибок больше --max-errors или рост RSS больше
+--max-rss-growth МБ/ч (по прогонам от 10 минут: на коротких рост прогрева
+кэшей экстраполируется на час) дают код возврата 1. Снимки пишутся в
+--samples (JSON lines).
+
+Запуск: python benchmarks/soak_test.py --users 1000 --duration 7200 [--mix search=6,compare=2,quiz=2]
+'''
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from stub_hh_server import start_server  # noqa: E402
+
+PROFESSIONS = ['программист', 'аналитик данных', 'дизайнер', 'тестировщик', 'менеджер',
+               'бухгалтер', 'маркетолог', 'devops', 'юрист', 'врач', 'инженер', 'учитель']
+
+BUSY = '⏳ Сейчас слишком много'
+
+# Рост RSS оценивается по прогонам не короче этого (секунды)
+MIN_SOAK = 600
+
+
+class Timeout(Exception):
+    '''Бот не ответил за отведенное время'''
+
+
+def rss_mb(pid='self'):
+    '''Резидентная память процесса в МБ (Linux)'''
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class Latencies:
+    '''Задержки сценария: KLL-скетч вместо списка, чтобы память харнесса не росла'''
+
+    def __init__(self):
+        import sketch
+        self.sketch = sketch.KLLSketch(k=2000)
+        self.buffer = []
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.buffer.append(value)
+            self.count += 1
+            if len(self.buffer) >= 1000:
+                self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.sketch.update(np.array(self.buffer))
+            self.buffer = []
+
+    def quantiles(self, qs):
+        with self.lock:
+            self._flush()
+            return self.sketch.quantiles(qs) if self.count else [float('nan')] * len(qs)
+
+
+class Replies:
+    '''Ответы бота по чатам: фейковый Telegram раскладывает, пользователи ждут свои'''
+
+    def __init__(self):
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def register(self, chat_id):
+        with self.lock:
+            inbox = self.queues[chat_id] = queue.Queue()
+        return inbox
+
+    def unregister(self, chat_id):
+        with self.lock:
+            self.queues.pop(chat_id, None)
+
+    def on_call(self, now, method, fields, result):
+        chat_id = fields.get('chat_id')
+        if chat_id is None:
+            return
+        inbox = self.queues.get(int(chat_id))
+        if inbox is not None:
+            inbox.put((now, method, fields, result))
+
+
+def expect(inbox, predicate, timeout):
+    '''Первый ответ, для которого predicate истинно: (время, метод, поля, результат)'''
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise Timeout()
+        try:
+            reply = inbox.get(timeout=remaining)
+        except queue.Empty:
+            raise Timeout() from None
+        if predicate(*reply[1:3]):
+            return reply
+
+
+def text_of(fields):
+    return fields.get('text', fields.get('caption', ''))
+
+
+def answer(prefix):
+    '''Итоговый ответ сценария: текст с prefix, ошибка или отказ «занято»'''
+    def predicate(method, fields):
+        text = text_of(fields)
+        return method in ('sendMessage', 'editMessageText') and (
+            text.startswith(prefix) or text.startswith('❌') or text.startswith(BUSY))
+    return predicate
+
+
+def buttons(fields, prefix):
+    '''callback_data кнопок reply_markup, начинающиеся с prefix'''
+    markup = fields.get('reply_markup')
+    if not markup:
+        return []
+    markup = json.loads(markup) if isinstance(markup, str) else markup
+    return [button.get('callback_data', '') for row in markup.get('inline_keyboard', [])
+            for button in row if button.get('callback_data', '').startswith(prefix)]
+
+
+class Harness:
+    '''Виртуальные пользователи, счетчики и снимки'''
+
+    def __init__(self, args, fake, replies):
+        self.args = args
+        self.fake = fake
+        self.replies = replies
+        self.mix = self.parse_mix(args.mix)
+        self.queries = [f'{PROFESSIONS[i % len(PROFESSIONS)]} {i // len(PROFESSIONS)}'
+                        for i in range(args.queries)]
+        self.latencies = {}
+        self.outcomes = {}
+        self.lock = threading.Lock()
+        self.user_ids = itertools.count(1)
+        self.samples = []
+        self.stop = threading.Event()
+
+    @staticmethod
+    def parse_mix(text):
+        mix = {}
+        for part in text.split(','):
+            name, _, weight = part.partition('=')
+            mix[name.strip()] = float(weight or 1)
+        return mix
+
+    def record(self, scenario, outcome, latency=None):
+        with self.lock:
+            key = (scenario, outcome)
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+            if latency is not None and scenario not in self.latencies:
+                self.latencies[scenario] = Latencies()
+        if latency is not None:
+            self.latencies[scenario].add(latency)
+
+    def finish(self, scenario, start, reply):
+        '''Учет итогового ответа сценария'''
+        text = text_of(reply[2])
+        if text.startswith(BUSY):
+            self.record(scenario, 'busy')
+        elif text.startswith('❌'):
+            self.record(scenario, 'error')
+        else:
+            self.record(scenario, 'ok', reply[0] - start)
+
+    # Сценарии: user_id совпадает с chat_id
+
+    def search(self, user_id, inbox, rng):
+        start = time.perf_counter()
+        self.fake.push_message(user_id, rng.choice(self.queries))
+        self.finish('search', start, expect(inbox, answer('📊'), self.args.timeout))
+
+    def compare(self, user_id, inbox, rng):
+        self.fake.push_message(user_id, '⚖️ Сравнить профессии')
+        expect(inbox, lambda method, fields: 'Сравнение профессий' in text_of(fields),
+               self.args.timeout)
+        start = time.perf_counter()
+        self.fake.push_message(user_id, ', '.join(rng.sample(self.queries, rng.randint(2, 3))))
+        self.finish('compare', start, expect(inbox, answer('📊'), self.args.timeout))
+
+    def quiz(self, user_id, inbox, rng):
+        def question(method, fields):
+            return method == 'sendMessage' and (buttons(fields, 'quiz_') or
+                                                buttons(fields, 'search_'))
+
+        start = time.perf_counter()
+        self.fake.push_message(user_id, '🎯 Тест на профориентацию')
+        reply = expect(inbox, question, self.args.timeout)
+        self.record('quiz_start', 'ok', reply[0] - start)
+        while True:
+            options = buttons(reply[2], 'quiz_')
+            if not options:
+                self.record('quiz', 'ok')
+                return
+            start = time.perf_counter()
+            self.fake.push_callback(user_id, rng.choice(options), reply[3]['message_id'])
+            reply = expect(inbox, question, self.args.timeout)
+            self.record('quiz_answer', 'ok', reply[0] - start)
+
+    def user(self, index):
+        '''Виртуальный пользователь: сценарии по весам до конца прогона'''
+        rng = random.Random(index)
+        user_id = next(self.user_ids)
+        inbox = self.replies.register(user_id)
+        names, weights = list(self.mix), list(self.mix.values())
+        time.sleep(rng.uniform(0, self.args.think))
+        while not self.stop.is_set():
+            if rng.random() < self.args.churn:
+                self.replies.unregister(user_id)
+                user_id = next(self.user_ids)
+                inbox = self.replies.register(user_id)
+            scenario = rng.choices(names, weights)[0]
+            try:
+                getattr(self, scenario)(user_id, inbox, rng)
+            except Timeout:
+                self.record(scenario, 'timeout')
+                # Поздние ответы не должны засчитаться следующему сценарию
+                self.replies.unregister(user_id)
+                user_id = next(self.user_ids)
+                inbox = self.replies.register(user_id)
+            self.stop.wait(rng.expovariate(1 / self.args.think) if self.args.think else 0)
+
+    def sizes(self):
+        '''Размеры структур бота, которые не должны расти без предела'''
+        import bot_core
+        import main_advanced
+        import state_store
+        import stats_advanced
+        state = state_store.get_state()
+        prefetcher = main_advanced.prefetcher
+        dispatcher = main_advanced.dispatcher
+        renderer = dispatcher.renderer._executor
+        render_pids = list(renderer._processes) if renderer is not None else []
+        return {
+            'rss_mb': round(rss_mb(), 1),
+            'render_rss_mb': round(sum(rss_mb(pid) for pid in render_pids), 1),
+            'threads': threading.active_count(),
+            'state_lru': len(state._cache),
+            'state_dirty': len(state._dirty),
+            'result_cache': len(stats_advanced.RESULT_CACHE),
+            'result_cache_mb': round(stats_advanced.RESULT_CACHE.size / 2**20, 1),
+            'summary_cache_mb': round(stats_advanced.SUMMARY_CACHE.size / 2**20, 2),
+            'chart_cache_mb': round(stats_advanced.CHART_CACHE.size / 2**20, 1),
+            'photo_ids_mb': round(bot_core.PHOTO_IDS.size / 2**20, 2),
+            'active_users': dispatcher.active_users,
+            'queued_jobs': dispatcher.queued,
+            'prefetch_queue': prefetcher.stats()['queued'],
+            'prefetch_tracked': len(prefetcher._popular) + len(prefetcher._loaded),
+            'reply_inboxes': len(self.replies.queues),
+        }
+
+    @staticmethod
+    def limits():
+        '''Пределы ограниченных структур'''
+        import bot_core
+        import prefetch
+        import state_store
+        import stats_advanced
+        return {
+            'state_lru': state_store.CACHE_SIZE,
+            'result_cache_mb': stats_advanced.RESULT_CACHE.max_bytes / 2**20,
+            'summary_cache_mb': stats_advanced.SUMMARY_CACHE.max_bytes / 2**20,
+            'chart_cache_mb': stats_advanced.CHART_CACHE.max_bytes / 2**20,
+            'photo_ids_mb': bot_core.PHOTO_IDS.max_bytes / 2**20,
+            'prefetch_tracked': 2 * prefetch.MAX_TRACKED,
+        }
+
+    def sample(self, start, out):
+        row = {'t': round(time.perf_counter() - start, 1), 'users_seen': next(self.user_ids) - 1}
+        row.update(self.sizes())
+        with self.lock:
+            row['done'] = sum(n for (_, outcome), n in self.outcomes.items() if outcome == 'ok')
+        self.samples.append(row)
+        if out is not None:
+            out.write(json.dumps(row, ensure_ascii=False) + '\n')
+            out.flush()
+        print(f"{row['t']:>7.0f} с  RSS {row['rss_mb']:>7.1f} МБ  потоков {row['threads']:>4}  "
+              f"пользователей {row['users_seen']:>7}  LRU {row['state_lru']:>7}  "
+              f"ответов {row['done']:>8}", flush=True)
+
+
+def growth(samples, key):
+    '''(прирост за час по второй половине, конец / середина)'''
+    tail = samples[len(samples) // 2:]
+    if len(tail) < 2:
+        return 0.0, 1.0
+    t = np.array([s['t'] for s in tail])
+    y = np.array([s[key] for s in tail], dtype=float)
+    slope = np.polyfit(t, y, 1)[0] * 3600 if np.ptp(t) > 0 else 0.0
+    ratio = y[-1] / y[0] if y[0] > 0 else (float('inf') if y[-1] > 0 else 1.0)
+    return slope, ratio
+
+
+def ms(seconds):
+    return '—' if seconds != seconds else f'{seconds * 1000:.0f}'
+
+
+def report(harness, elapsed, args):
+    '''Итоговая таблица; True, если прогон в пределах порогов'''
+    print(f'\nсценарии за {elapsed:.0f} с:')
+    print(f'{"сценарий":>12} {"ок":>8} {"занято":>7} {"ошибок":>7} {"таймаут":>8} '
+          f'{"в с":>7} {"p50, мс":>9} {"p99, мс":>9}')
+    total = failed = 0
+    for scenario in sorted({s for s, _ in harness.outcomes}):
+        counts = {outcome: harness.outcomes.get((scenario, outcome), 0)
+                  for outcome in ('ok', 'busy', 'error', 'timeout')}
+        total += sum(counts.values())
+        failed += counts['error'] + counts['timeout']
+        p50, p99 = (harness.latencies[scenario].quantiles([0.5, 0.99])
+                    if scenario in harness.latencies else (float('nan'),) * 2)
+        print(f'{scenario:>12} {counts["ok"]:>8} {counts["busy"]:>7} {counts["error"]:>7} '
+              f'{counts["timeout"]:>8} {counts["ok"] / elapsed:>7.1f} '
+              f'{ms(p50):>9} {ms(p99):>9}')
+
+    print("\nрост за вторую половину прогона:")
+    print(f'{"":>18} {"начало":>10} {"конец":>10} {"за час":>10} {"предел":>10}')
+    ok = True
+    limits = harness.limits()
+    for key in harness.samples[0]:
+        if key in ('t', 'done', 'users_seen'):
+            continue
+        slope, ratio = growth(harness.samples, key)
+        last = harness.samples[-1][key]
+        limit = limits.get(key)
+        if limit is not None:
+            mark = ' ⚠️' if last > limit else ''
+        else:
+            mark = ' ⚠️' if ratio > 1.5 and slope > 0 else ''
+        if key == 'rss_mb' and elapsed >= MIN_SOAK and slope > args.max_rss_growth:
+            mark, ok = ' ⚠️', False
+        limit = '—' if limit is None else f'{limit:g}'
+        print(f'{key:>18} {harness.samples[0][key]:>10} {last:>10} {slope:>+10.1f} '
+              f'{limit:>10}{mark}')
+
+    error_share = failed / total if total else 0.0
+    print(f'\nошибок и таймаутов: {error_share:.2%}')
+    return ok and error_share <= args.max_errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=120)
+    parser.add_argument('--mix', default='search=6,compare=2,quiz=2')
+    parser.add_argument('--think', type=float, default=2.0)
+    parser.add_argument('--churn', type=float, default=0.2)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--found', type=int, default=500)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--sample', type=float, default=10)
+    parser.add_argument('--samples', help='файл для снимков (JSON lines)')
+    parser.add_argument('--max-rss-growth', type=float, default=100)
+    parser.add_argument('--max-errors', type=float, default=0.01)
+    parser.add_argument('--workdir', default=None)
+    args = parser.parse_args()
+
+    hh_server, _, hh_url = start_server(latency=args.latency, found=args.found)
+    replies = Replies()
+    fake = FakeTelegram(on_call=replies.on_call, keep_calls=False).start()
+
+    # Настройки читаются модулями при импорте; хранилища — SQLite во временном каталоге
+    os.environ.update({'BOT_TOKEN': '123:fake', 'HH_API_URL': hh_url, 'HH_RATE': '100000',
+                       'BOT_METRICS_LOG': ''})
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix='soak-'))
+    import telebot.apihelper
+    telebot.apihelper.API_URL = fake.api_url
+    import main_advanced
+    # Каждому потоку виртуального пользователя хватит небольшого стека
+    threading.stack_size(512 * 1024)
+
+    threading.Thread(target=main_advanced.bot.infinity_polling,
+                     kwargs={'timeout': 1, 'long_polling_timeout': 1}, daemon=True).start()
+    main_advanced.warm_up()
+
+    harness = Harness(args, fake, replies)
+    out = open(args.samples, 'w', encoding='utf-8') if args.samples else None
+    start = time.perf_counter()
+    harness.sample(start, out)
+    for index in range(args.users):
+        threading.Thread(target=harness.user, args=(index,), daemon=True).start()
+    while time.perf_counter() - start < args.duration:
+        time.sleep(min(args.sample, max(0.0, args.duration - (time.perf_counter() - start))))
+        harness.sample(start, out)
+    harness.stop.set()
+    elapsed = time.perf_counter() - start
+
+    ok = report(harness, elapsed, args)
+    if out is not None:
+        out.close()
+    # Начатые задачи дорабатывают при живых стабах; процессы рисовальщиков иначе
+    # пережили бы os._exit сиротами с открытым stdout
+    main_advanced.bot.stop_polling()
+    main_advanced.dispatcher.shutdown(wait=True)
+    hh_server.shutdown()
+    fake.stop()
+    # Поллинг и пользователей, ждущих ответа, не ждем
+    os._exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+'''Локальный стаб HeadHunter API для офлайн-бенчмарков
+
+Отдает /vacancies в формате hh.ru с детерминированными вакансиями
+и искусственной задержкой ответа. Для проверки повторов и адаптивного лимита
+умеет вносить сбои: доля ответов 503 (--error-rate), лимит запросов в секунду
+с ответами 429 и Retry-After (--rate-limit) и бан (403) клиента, который
+продолжает долбить после --ban-after ответов 429 за BAN_WINDOW секунд.
+Вместо сгенерированных вакансий может отдавать записанные с hh.ru
+(--fixture, файл record_fixtures.py): любой запрос получает их по порядку.
+
+Запуск: python benchmarks/stub_hh_server.py --port 8765 --latency 0.15
+'''
+import argparse
+import gzip
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+EMPLOYERS = ['Яндекс', 'Сбер', 'Тинькофф', 'VK', 'Ozon', 'Авито', 'МТС',
+             'Касперский', 'X5 Group', 'Ростелеком', 'Альфа-Банк', 'Wildberries']
+EXPERIENCE = [('noExperience', 'Нет опыта'), ('between1And3', 'От 1 года до 3 лет'),
+              ('between3And6', 'От 3 до 6 лет'), ('moreThan6', 'Более 6 лет')]
+EMPLOYMENT = [('full', 'Полная занятость'), ('part', 'Частичная занятость'),
+              ('project', 'Проектная работа'), ('probation', 'Стажировка')]
+SCHEDULE = [('fullDay', 'Полный день'), ('remote', 'Удаленная работа'),
+            ('flexible', 'Гибкий график'), ('shift', 'Сменный график')]
+CURRENCIES = ['RUR'] * 18 + ['USD', 'EUR']
+
+# Окно подсчета ответов 429 для бана (секунды)
+BAN_WINDOW = 10
+
+
+def format_time(ts):
+    '''Время в формате hh.ru'''
+    return time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime(ts))
+
+
+def parse_time(value):
+    '''Параметр date_from/date_to в секундах epoch'''
+    return datetime.fromisoformat(value.replace(' ', '+')).timestamp()
+
+
+def make_vacancy(seed, index, published_ts):
+    '''Одна вакансия в формате hh.ru'''
+    rnd = random.Random(seed * 1000003 + index)
+    vacancy_id = str(10_000_000 + (seed % 1000) * 100_000 + index)
+    salary = None
+    if rnd.random() < 0.7:
+        base = rnd.lognormvariate(11.5, 0.5)
+        low = int(base // 1000 * 1000)
+        high = int(low * rnd.uniform(1.1, 1.6) // 1000 * 1000)
+        salary = {
+            'from': low if rnd.random() < 0.85 else None,
+            'to': high if rnd.random() < 0.6 else None,
+            'currency': rnd.choice(CURRENCIES),
+            'gross': rnd.random() < 0.5
+        }
+        if salary['from'] is None and salary['to'] is None:
+            salary['from'] = low
+    employer = rnd.choice(EMPLOYERS)
+    exp_id, exp_name = rnd.choice(EXPERIENCE)
+    emp_id, emp_name = rnd.choice(EMPLOYMENT)
+    sch_id, sch_name = rnd.choice(SCHEDULE)
+    return {
+        'id': vacancy_id,
+        'premium': False,
+        'name': f'Вакансия {index}',
+        'department': None,
+        'has_test': rnd.random() < 0.1,
+        'response_letter_required': False,
+        'area': {'id': '1', 'name': 'Москва', 'url': 'https://api.hh.ru/areas/1'},
+        'salary': salary,
+        'type': {'id': 'open', 'name': 'Открытая'},
+        'address': None,
+        'response_url': None,
+        'sort_point_distance': None,
+        'published_at': format_time(published_ts),
+        'created_at': format_time(published_ts),
+        'archived': False,
+        'apply_alternate_url': f'https://hh.ru/applicant/vacancy_response?vacancyId={vacancy_id}',
+        'url': f'https://api.hh.ru/vacancies/{vacancy_id}?host=hh.ru',
+        'alternate_url': f'https://hh.ru/vacancy/{vacancy_id}',
+        'relations': [],
+        'employer': {
+            'id': str(zlib.crc32(employer.encode()) % 100000),
+            'name': employer,
+            'url': 'https://api.hh.ru/employers/1',
+            'alternate_url': 'https://hh.ru/employer/1',
+            'logo_urls': {'90': 'https://hh.ru/logo90.png', '240': 'https://hh.ru/logo240.png',
+                          'original': 'https://hh.ru/logo.png'},
+            'vacancies_url': 'https://api.hh.ru/vacancies?employer_id=1',
+            'accredited_it_employer': rnd.random() < 0.3,
+            'trusted': True
+        },
+        'snippet': {
+            'requirement': 'Опыт коммерческой разработки. Знание SQL, Git. ' * 2,
+            'responsibility': 'Разработка и поддержка сервисов компании. ' * 2
+        },
+        'contacts': None,
+        'schedule': {'id': sch_id, 'name': sch_name},
+        'working_days': [],
+        'working_time_intervals': [],
+        'working_time_modes': [],
+        'accept_temporary': False,
+        'professional_roles': [{'id': '96', 'name': 'Программист, разработчик'}],
+        'accept_incomplete_resumes': False,
+        'experience': {'id': exp_id, 'name': exp_name},
+        'employment': {'id': emp_id, 'name': emp_name},
+    }
+
+
+def load_fixture(path):
+    '''Вакансии из записанных страниц выдачи (JSON или JSON.gz со списком страниц)'''
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        pages = json.load(f)
+    return [item for page in pages for item in page['items']]
+
+
+class StubHH:
+    '''Состояние стаба: сколько вакансий отдавать и с какой задержкой
+
+    items — готовые вакансии (записанные или заранее сгенерированные) вместо
+    make_vacancy; found тогда по умолчанию равно их числу.
+    '''
+
+    def __init__(self, found=None, latency=0.1, interval=600, error_rate=0.0, rate_limit=0,
+                 ban_after=0, ban_time=60, seed=0, items=None):
+        self.items = items
+        self.found = found if found is not None else len(items) if items else 2000
+        self.latency = latency
+        # Вакансия i опубликована в anchor - i * interval, новые появляются со временем
+        self.anchor = time.time()
+        self.interval = interval
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        # Сбои: доля 503, лимит частоты (0 — без лимита) и бан за игнорирование 429
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.ban_after = ban_after
+        self.ban_time = ban_time
+        self.rng = random.Random(seed)
+        self.tokens = rate_limit
+        self.updated = time.monotonic()
+        self.throttled_at = []  # время недавних ответов 429
+        self.banned_until = 0.0
+        self.errors = self.throttled = self.bans = 0
+
+    def fault(self):
+        '''Сбой для очередного запроса: (код, заголовки) или None (вызывать под lock)'''
+        now = time.monotonic()
+        if now < self.banned_until:
+            return 403, {}
+        if self.rate_limit:
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.updated) * self.rate_limit)
+            self.updated = now
+            if self.tokens < 1:
+                self.throttled += 1
+                self.throttled_at = [t for t in self.throttled_at if t > now - BAN_WINDOW] + [now]
+                if self.ban_after and len(self.throttled_at) > self.ban_after:
+                    self.bans += 1
+                    self.banned_until = now + self.ban_time
+                    return 403, {}
+                return 429, {'Retry-After': '1'}
+            self.tokens -= 1
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors += 1
+            return 503, {}
+        return None
+
+    def vacancy(self, seed, index):
+        '''Вакансия номер index в выдаче запроса'''
+        if self.items:
+            return self.items[index % len(self.items)]
+        return make_vacancy(seed, index, self.anchor - index * self.interval)
+
+    def search(self, params):
+        '''Ответ /vacancies для заданных параметров'''
+        text = params.get('text', '')
+        area = params.get('area', '1')
+        seed = zlib.crc32(f'{text}|{area}'.encode())
+        per_page = int(params.get('per_page', 20))
+        page = int(params.get('page', 0))
+
+        # Индексы вакансий, попадающих в окно date_from/date_to
+        now = time.time()
+        newest = -int((now - self.anchor) // self.interval)
+        lo, hi = newest, self.found
+        if 'date_to' in params:
+            lo = max(lo, math.ceil((self.anchor - parse_time(params['date_to'])) / self.interval))
+        if 'date_from' in params:
+            hi = min(hi, math.floor((self.anchor - parse_time(params['date_from'])) / self.interval) + 1)
+        found = max(0, hi - lo)
+
+        depth = min(found, 2000)  # как у hh.ru: не глубже 2000 результатов
+        pages = (depth + per_page - 1) // per_page
+        start = lo + page * per_page
+        stop = min(start + per_page, lo + depth)
+        items = [self.vacancy(seed, i) for i in range(start, stop)]
+        return {'items': items, 'found': found, 'pages': pages,
+                'page': page, 'per_page': per_page}
+
+
+def make_handler(stub):
+    '''Класс HTTP-обработчика, привязанный к состоянию стаба'''
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            with stub.lock:
+                stub.requests += 1
+                fault = stub.fault()
+            if stub.latency:
+                time.sleep(stub.latency)
+
+            if fault is not None:
+                status, headers = fault
+                self._send(status, {'errors': [{'type': 'stub_fault'}]}, headers)
+            elif url.path == '/vacancies':
+                self._send(200, stub.search(params))
+            else:
+                self._send(404, {'errors': [{'type': 'not_found'}]})
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port=0, **kwargs):
+    '''Запуск стаба в фоновом потоке, возвращает (server, stub, base_url)'''
+    stub = StubHH(**kwargs)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(stub))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, stub, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Стаб HeadHunter API')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--found', type=int, default=None)
+    parser.add_argument('--fixture', help='записанные страницы hh.ru (record_fixtures.py)')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0)
+    parser.add_argument('--ban-after', type=int, default=0)
+    args = parser.parse_args()
+
+    server, _, url = start_server(args.port, found=args.found, latency=args.latency,
+                                  error_rate=args.error_rate, rate_limit=args.rate_limit,
+                                  ban_after=args.ban_after,
+                                  items=load_fixture(args.fixture) if args.fixture else None)
+    print(f'Стаб HH запущен: {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,464 @@
+'''Общая логика бота для синхронного и асинхронного режимов
+
+Обработчики не обращаются к Telegram сами, а возвращают список действий:
+Reply — вызов метода Bot API (имена методов у TeleBot и AsyncTeleBot общие),
+Search и Compare — тяжелые задачи, которые каждый режим выполняет по-своему,
+Prefetch — упреждающая загрузка статистики (prefetch.Prefetcher).
+'''
+import os
+from telebot import types
+import cache
+import hh_client
+import metrics
+import quiz
+import state_store
+from state_store import DialogState, Settings
+
+# Викторина; сессии, как настройки и состояния диалога, — в state_store.get_state(),
+# которое создается при первом обращении, а не при импорте
+quiz_manager = quiz.QuizSession()
+
+# file_id уже отправленных графиков: повторная отправка без загрузки PNG
+PHOTO_IDS = metrics.watch_cache('photo_ids', cache.TTLCache(ttl=86400, max_bytes=8 * 2**20))
+
+BUSY_MESSAGE = "⏳ Сейчас слишком много запросов, попробуй через минуту."
+# Профессии сравнения загружаются одновременно и агрегируются одним проходом
+MAX_COMPARE = int(os.getenv('BOT_MAX_COMPARE', '8'))
+
+
+class Reply:
+    '''Вызов метода Bot API'''
+
+    def __init__(self, method, *args, quiet=False, on_result=None, on_error=None, **kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.quiet = quiet  # ошибки игнорируются (например, устаревшие callback)
+        self.on_result = on_result  # вызывается с ответом Bot API
+        self.on_error = on_error  # при ошибке возвращает действия взамен этого
+
+
+class Search:
+    '''Поиск статистики по профессии'''
+
+    def __init__(self, chat_id, user_id, query, settings):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.query = query
+        self.settings = settings
+        self.message_id = None  # сообщение «Ищу вакансии», которое дополняется итогами
+
+
+class Compare:
+    '''Сравнение нескольких профессий'''
+
+    def __init__(self, chat_id, user_id, professions, settings):
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.professions = professions
+        self.settings = settings
+
+
+class Prefetch:
+    '''Фоновая загрузка статистики профессий, которые пользователь вероятно будет искать'''
+
+    def __init__(self, queries, settings):
+        self.queries = queries
+        self.settings = settings
+
+
+def send_message(chat_id, text, **kwargs):
+    '''Действие sendMessage'''
+    return Reply('send_message', chat_id, text, **kwargs)
+
+
+def photo_reply(chat_id, chart, **kwargs):
+    '''Действие sendPhoto: по file_id, если такой график уже отправлялся
+
+    Если Telegram не принял сохраненный file_id (устарел, выдан другому
+    боту), id забывается, а PNG загружается заново.
+    '''
+    def remember(message):
+        if message is not None and message.photo:
+            PHOTO_IDS.put(chart.key, message.photo[-1].file_id)
+
+    def upload():
+        return Reply('send_photo', chat_id, chart.buffer(), on_result=remember, **kwargs)
+
+    file_id = PHOTO_IDS.get(chart.key)
+    if file_id is None:
+        return upload()
+
+    def resend():
+        PHOTO_IDS.discard(chart.key)
+        return [upload()]
+
+    return Reply('send_photo', chat_id, file_id, on_error=resend, **kwargs)
+
+
+def get_main_keyboard():
+    '''Главная клавиатура с кнопками'''
+    keyboard = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
+    keyboard.add(
+        types.KeyboardButton('🔍 Поиск вакансий'),
+        types.KeyboardButton('⚖️ Сравнить профессии'),
+        types.KeyboardButton('🎯 Тест на профориентацию'),
+        types.KeyboardButton('⚙️ Настройки'),
+        types.KeyboardButton('ℹ️ Помощь')
+    )
+    return keyboard
+
+
+def get_cities_keyboard():
+    '''Клавиатура выбора города'''
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    cities = [
+        ('Москва', 1),
+        ('Санкт-Петербург', 2),
+        ('Екатеринбург', 3),
+        ('Новосибирск', 4),
+        ('Казань', 88),
+        ('Нижний Новгород', 66),
+        ('Вся Россия', 113)
+    ]
+    buttons = [types.InlineKeyboardButton(name, callback_data=f'city_{id}')
+               for name, id in cities]
+    markup.add(*buttons)
+    return markup
+
+
+def get_experience_keyboard():
+    '''Клавиатура выбора опыта'''
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    experiences = [
+        ('Не важно', 'all'),
+        ('Без опыта', 'noExperience'),
+        ('1-3 года', 'between1And3'),
+        ('3-6 лет', 'between3And6'),
+        ('Более 6 лет', 'moreThan6')
+    ]
+    buttons = [types.InlineKeyboardButton(name, callback_data=f'exp_{code}')
+               for name, code in experiences]
+    markup.add(*buttons)
+    return markup
+
+
+def get_user_settings(user_id):
+    '''Получение настроек пользователя (по умолчанию, если он их не менял)'''
+    return state_store.get_state().get(Settings, user_id) or Settings()
+
+
+def update_user_settings(user_id, **kwargs):
+    '''Обновление настроек пользователя'''
+    user_set = get_user_settings(user_id)
+    for name, value in kwargs.items():
+        setattr(user_set, name, value)
+    state_store.get_state().put(user_set, user_id)
+
+
+def get_dialog(user_id):
+    '''Состояние диалога с пользователем'''
+    return state_store.get_state().get(DialogState, user_id) or DialogState()
+
+
+def stats_filters(settings):
+    '''Аргументы VacancyStats по настройкам пользователя'''
+    return {
+        'city_id': settings.city_id,
+        'experience': settings.experience if settings.experience != 'all' else None,
+        'remote_only': settings.remote_only
+    }
+
+
+def start(message):
+    '''Команда /start'''
+    user_name = message.from_user.first_name
+    msg = f"👋 Привет, <b>{user_name}</b>!\n\n"
+    msg += "Я помогу тебе с выбором профессии! Могу показать:\n\n"
+    msg += "🔍 Статистику по зарплатам с графиками\n"
+    msg += "⚖️ Сравнение разных профессий\n"
+    msg += "🎯 Тест на профориентацию\n\n"
+    msg += "Используй кнопки ниже или просто напиши название профессии! 👇"
+
+    return [send_message(message.chat.id, msg, parse_mode='html',
+                         reply_markup=get_main_keyboard())]
+
+
+def help_command(message):
+    '''Команда /help'''
+    msg = "📖 <b>Как пользоваться ботом:</b>\n\n"
+    msg += "1️⃣ <b>Поиск вакансий:</b>\n"
+    msg += "   Просто напиши профессию, например: 'программист'\n\n"
+    msg += "2️⃣ <b>Настройки:</b>\n"
+    msg += "   Выбери город, опыт работы, удаленка/офис\n\n"
+    msg += "3️⃣ <b>Сравнение:</b>\n"
+    msg += "   Используй /compare программист, дизайнер\n\n"
+    msg += "4️⃣ <b>Тест:</b>\n"
+    msg += "   Пройди тест на профориентацию /quiz\n\n"
+    msg += "<b>Команды:</b>\n"
+    msg += "/start - Начать работу\n"
+    msg += "/help - Помощь\n"
+    msg += "/settings - Настройки\n"
+    msg += "/compare - Сравнение профессий\n"
+    msg += "/quiz - Тест на профориентацию\n"
+
+    return [send_message(message.chat.id, msg, parse_mode='html')]
+
+
+def settings(message):
+    '''Настройки пользователя'''
+    user_set = get_user_settings(message.from_user.id)
+
+    msg = "⚙️ <b>Настройки поиска:</b>\n\n"
+    city_name = hh_client.CITIES.get(user_set.city_id, 'Москва')
+    msg += f"📍 Город: {city_name}\n"
+    msg += f"💼 Опыт: {user_set.experience}\n"
+    msg += f"🏠 Только удаленка: {'Да' if user_set.remote_only else 'Нет'}\n\n"
+    msg += "Выбери что хочешь изменить:"
+
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    markup.add(
+        types.InlineKeyboardButton('📍 Изменить город', callback_data='settings_city'),
+        types.InlineKeyboardButton('💼 Изменить опыт', callback_data='settings_exp'),
+        types.InlineKeyboardButton('🏠 Переключить удаленку', callback_data='settings_remote')
+    )
+
+    return [send_message(message.chat.id, msg, parse_mode='html', reply_markup=markup)]
+
+
+def compare_command(message):
+    '''Команда сравнения профессий'''
+    msg = "⚖️ <b>Сравнение профессий</b>\n\n"
+    msg += f"Введи 2-{MAX_COMPARE} профессий через запятую, например:\n"
+    msg += "<code>программист, дизайнер, аналитик</code>\n\n"
+    msg += "Я покажу сравнение зарплат!"
+
+    dialog = get_dialog(message.from_user.id)
+    dialog.state = 'waiting_compare'
+    state_store.get_state().put(dialog, message.from_user.id)
+    return [send_message(message.chat.id, msg, parse_mode='html')]
+
+
+def quiz_command(message):
+    '''Запуск викторины'''
+    quiz_manager.start_quiz(message.from_user.id)
+    return send_quiz_question(message.chat.id, message.from_user.id)
+
+
+def send_quiz_question(chat_id, user_id):
+    '''Отправка вопроса викторины'''
+    question = quiz_manager.get_current_question(user_id)
+
+    if not question:
+        # Викторина завершена
+        result = quiz_manager.get_result(user_id)
+        if result is None:
+            return []
+        result_msg = quiz.get_quiz_result_message(result)
+
+        # Предлагаем посмотреть профессии
+        markup = types.InlineKeyboardMarkup()
+        profile_professions = quiz.CAREER_PROFILES[result['profile']]['professions']
+        for profession in profile_professions[:3]:
+            markup.add(types.InlineKeyboardButton(
+                f"🔍 {profession}",
+                callback_data=f"search_{profession}"
+            ))
+
+        quiz_manager.end_quiz(user_id)
+        return [
+            send_message(chat_id, result_msg, parse_mode='html'),
+            send_message(chat_id, "Хочешь узнать больше о этих профессиях?",
+                         reply_markup=markup),
+            # Обычно дальше ищут одну из предложенных профессий
+            Prefetch(profile_professions[:3], get_user_settings(user_id).copy())
+        ]
+
+    # Отправляем вопрос с кнопками
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    for idx, option in enumerate(question['options']):
+        markup.add(types.InlineKeyboardButton(
+            option['text'],
+            callback_data=f"quiz_{idx}"
+        ))
+
+    return [send_message(chat_id, question['question'], reply_markup=markup)]
+
+
+def callback_handler(call):
+    '''Обработчик всех callback кнопок'''
+    user_id = call.from_user.id
+    chat_id = call.message.chat.id
+    message_id = call.message.message_id
+    data = call.data
+
+    # Ответ на callback (ошибки с истекшими кнопками игнорируются)
+    def safe_answer(message=""):
+        return Reply('answer_callback_query', call.id, message, quiet=True)
+
+    def saved():
+        return Reply('edit_message_text', "✅ Настройки сохранены!", chat_id, message_id)
+
+    # Обработка настроек города
+    if data.startswith('city_'):
+        city_id = int(data.split('_')[1])
+        update_user_settings(user_id, city_id=city_id)
+        city_name = hh_client.CITIES.get(city_id, 'Неизвестно')
+        return [safe_answer(f"Город изменен на: {city_name}"), saved()]
+
+    # Обработка настроек опыта
+    elif data.startswith('exp_'):
+        experience = data.split('_')[1]
+        update_user_settings(user_id, experience=experience)
+        return [safe_answer("Опыт работы обновлен!"), saved()]
+
+    # Переключение удаленки
+    elif data == 'settings_remote':
+        new_value = 0 if get_user_settings(user_id).remote_only else 1
+        update_user_settings(user_id, remote_only=new_value)
+        status = "включена" if new_value else "выключена"
+        return [safe_answer(f"Удаленка {status}"), saved()]
+
+    # Открытие меню настроек
+    elif data == 'settings_city':
+        return [Reply('edit_message_text', "Выбери город:", chat_id, message_id,
+                      reply_markup=get_cities_keyboard())]
+
+    elif data == 'settings_exp':
+        return [Reply('edit_message_text', "Выбери опыт работы:", chat_id, message_id,
+                      reply_markup=get_experience_keyboard())]
+
+    # Поиск профессии
+    elif data.startswith('search_'):
+        profession = data[7:]  # Убираем 'search_'
+        return (search_request(call.message, profession, user_id) +
+                [safe_answer(f"Ищу: {profession}")])
+
+    # Викторина
+    elif data.startswith('quiz_'):
+        answer = data[5:]  # Убираем 'quiz_'
+        if not answer.isdigit() or not quiz_manager.add_answer(user_id, int(answer)):
+            return [safe_answer("Этот вариант устарел")]
+        return ([safe_answer("✅"), Reply('delete_message', chat_id, message_id)] +
+                send_quiz_question(chat_id, user_id))
+
+    return []
+
+
+def search_request(message, query, user_id=None):
+    '''Обработка поискового запроса'''
+    user_id = user_id or message.from_user.id
+
+    # Сохраняем последний запрос
+    dialog = get_dialog(user_id)
+    dialog.last_query = query
+    state_store.get_state().put(dialog, user_id)
+
+    return [Search(message.chat.id, user_id, query, get_user_settings(user_id).copy())]
+
+
+def comparison_request(message, professions):
+    '''Обработка сравнения профессий'''
+    chat_id = message.chat.id
+
+    if len(professions) < 2:
+        return [send_message(chat_id, "❌ Нужно минимум 2 профессии для сравнения!")]
+
+    if len(professions) > MAX_COMPARE:
+        return [send_message(chat_id, f"❌ Максимум {MAX_COMPARE} профессий для сравнения!")]
+
+    user_id = message.from_user.id
+    return [Compare(chat_id, user_id, professions, get_user_settings(user_id).copy())]
+
+
+def text_handler(message):
+    '''Обработчик текстовых сообщений'''
+    user_id = message.from_user.id
+    text = message.text.strip()
+
+    # Проверяем состояние пользователя
+    dialog = get_dialog(user_id)
+    if dialog.state == 'waiting_compare':
+        professions = [p.strip() for p in text.split(',')]
+        dialog.state = None
+        state_store.get_state().put(dialog, user_id)
+        return comparison_request(message, professions)
+
+    # Обработка кнопок главного меню
+    if text == '🔍 Поиск вакансий':
+        return [send_message(message.chat.id,
+                             "Напиши название профессии, например:\n"
+                             "• программист\n• дизайнер\n• аналитик данных")]
+
+    elif text == '⚖️ Сравнить профессии':
+        return compare_command(message)
+
+    elif text == '🎯 Тест на профориентацию':
+        return quiz_command(message)
+
+    elif text == '⚙️ Настройки':
+        return settings(message)
+
+    elif text == 'ℹ️ Помощь':
+        return help_command(message)
+
+    # Обычный поисковый запрос
+    return search_request(message, text)
+
+
+def search_started(search):
+    '''Сообщение о начале поиска; его потом заменяют промежуточные и итоговые результаты'''
+    def remember(message):
+        if message is not None:
+            search.message_id = message.message_id
+
+    return send_message(search.chat_id, f"🔍 Ищу вакансии: <b>{search.query}</b>...",
+                        parse_mode='html', on_result=remember)
+
+
+def search_progress(search, text):
+    '''Промежуточная статистика в сообщении о начале поиска'''
+    if search.message_id is None:
+        return []
+    return [Reply('edit_message_text', text, search.chat_id, search.message_id,
+                  parse_mode='html', quiet=True)]
+
+
+def search_finished(search, text):
+    '''Итоговая статистика: в том же сообщении, если оно было отправлено'''
+    if search.message_id is None:
+        return [send_message(search.chat_id, text, parse_mode='html')]
+    return [Reply('edit_message_text', text, search.chat_id, search.message_id,
+                  parse_mode='html')]
+
+
+def search_failed(search, error):
+    '''Сообщение об ошибке поиска'''
+    return send_message(search.chat_id, f"❌ Ошибка при получении данных: {str(error)}\n"
+                                        "Попробуй другой запрос или проверь настройки.")
+
+
+def comparison_started(compare):
+    '''Сообщение о начале сравнения'''
+    return send_message(compare.chat_id, "⏳ Собираю данные для сравнения...")
+
+
+def comparison_message(compare, comparison):
+    '''Текстовое сравнение профессий (comparison — stats_advanced.Comparison)'''
+    msg = "📊 <b>Сравнение профессий:</b>\n\n"
+    for query, median, mean, count in comparison.rows():
+        msg += f"<b>{query}</b>\n"
+        msg += f"  Медиана: {median:,} ₽\n"
+        msg += f"  Среднее: {mean:,} ₽\n"
+        msg += f"  Вакансий: {count}\n\n"
+    return send_message(compare.chat_id, msg, parse_mode='html')
+
+
+def comparison_failed(compare, error):
+    '''Сообщение об ошибке сравнения'''
+    return send_message(compare.chat_id, f"❌ Ошибка: {str(error)}")
+
+
+def comparison_caption(compare):
+    '''Подпись к графику сравнения'''
+    return f"⚖️ Сравнение: {', '.join(compare.professions)}"
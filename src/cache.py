@@ -0,0 +1,159 @@
+'''Кэш результатов поиска: TTL, LRU-вытеснение по лимиту памяти и single-flight'''
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    '''Оценка размера значения в байтах'''
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+
+class _Flight:
+    '''Загрузка, которую ждут все одинаковые запросы'''
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0  # сколько запросов ждут ее, кроме загружающего
+
+
+class TTLCache:
+    '''Потокобезопасный кэш с временем жизни записей и лимитом памяти'''
+
+    def __init__(self, ttl=900, max_bytes=256 * 2**20, sizeof=estimate_size):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires, size, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, key):
+        '''Живая запись или None (вызывать под блокировкой)'''
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self.size -= size
+
+    def get(self, key, default=None):
+        '''Значение из кэша или default'''
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[2]
+
+    def peek(self, key, default=None):
+        '''Значение из кэша или default; статистику и LRU не меняет'''
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return default
+            return entry[2]
+
+    def expires_in(self, key):
+        '''Сколько секунд запись еще проживет (None — ее нет); статистику и LRU не меняет'''
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            left = entry[0] - time.monotonic()
+            return left if left > 0 else None
+
+    def put(self, key, value):
+        '''Сохранение значения с вытеснением самых старых записей'''
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._data)))
+
+    def discard(self, key):
+        '''Удаление записи, если она есть'''
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def get_or_load(self, key, loader, keep=None):
+        '''Значение из кэша; при промахе загружается один раз, даже при параллельных запросах
+
+        keep(значение) — сохранять ли загруженное в кэш (неполный результат
+        получат ждущие его запросы, но следующий загрузит заново).
+        '''
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            if keep is None or keep(flight.value):
+                self.put(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.event.set()
+
+    def abandon(self, key):
+        '''Отказ от загрузки key, если ее никто, кроме загружающего, не ждет (True — отказались)
+
+        Следующий get_or_load по key начнет загрузку заново, не дожидаясь
+        брошенной.
+        '''
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is None or flight.waiters:
+                return False
+            del self._inflight[key]
+            return True
+
+    def clear(self):
+        '''Очистка кэша'''
+        with self._lock:
+            self._data.clear()
+            self.size = 0
@@ -0,0 +1,325 @@
+'''Отрисовка графиков через объектный API matplotlib (Agg) без pyplot
+
+Для каждого типа графика фигура, оси, подписи и легенда создаются один раз на
+поток (шаблон), а на каждый запрос обновляются только данные артистов.
+Разметка полей считается один раз при создании шаблона, поэтому на запрос
+остается одна отрисовка и кодирование PNG. Чтобы разметка годилась для любого
+запроса, она считается по подписям предельной длины, а длинные запросы в
+заголовках и названия профессий под столбцами обрезаются до этих пределов
+(shorten, wrap_label). Глобальное состояние pyplot не используется: у каждого
+потока свои фигуры, рисовать можно параллельно.
+'''
+import io
+import textwrap
+import threading
+
+import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+
+# Размер картинок: Telegram все равно ужимает фото до 1280 px по большей стороне
+CHART_DPI = 100
+
+# Стиль seaborn whitegrid (font_scale=1.2, палитра Set2) без импорта seaborn
+STYLE = {
+    'figure.facecolor': 'white',
+    'axes.facecolor': 'white',
+    'axes.edgecolor': '.8',
+    'axes.labelcolor': '.15',
+    'axes.grid': True,
+    'axes.axisbelow': True,
+    'axes.linewidth': 1.25,
+    'axes.prop_cycle': matplotlib.cycler(color=[
+        '#66c2a5', '#fc8d62', '#8da0cb', '#e78ac3',
+        '#a6d854', '#ffd92f', '#e5c494', '#b3b3b3']),
+    'grid.color': '.8',
+    'grid.linestyle': '-',
+    'grid.linewidth': 1,
+    'text.color': '.15',
+    'xtick.color': '.15',
+    'ytick.color': '.15',
+    'xtick.bottom': False,
+    'ytick.left': False,
+    'lines.linewidth': 1.5,
+    'lines.solid_capstyle': 'round',
+    'patch.edgecolor': 'w',
+    'patch.force_edgecolor': True,
+    'patch.linewidth': 1,
+    'font.size': 14.4,
+    'axes.labelsize': 14.4,
+    'axes.titlesize': 14.4,
+    'xtick.labelsize': 13.2,
+    'ytick.labelsize': 13.2,
+    'legend.fontsize': 13.2,
+    'legend.title_fontsize': 14.4,
+    'figure.figsize': (12, 7),
+    'font.sans-serif': ['DejaVu Sans', 'Arial Unicode MS', 'Helvetica'],
+    'axes.unicode_minus': False,
+}
+matplotlib.rcParams.update(STYLE)
+
+# Пределы подписей: запрос в заголовке, строки и число строк подписи профессии
+TITLE_LIMIT = 60
+LABEL_WIDTH = 16
+LABEL_LINES = 2
+
+# Данные для прогрева шаблонов и расчета разметки
+SAMPLE_SALARIES = np.linspace(30_000, 300_000, 200)
+SAMPLE_QUERY = 'python разработчик'
+SAMPLE_CITY = 'Санкт-Петербург'
+# Подпись профессии предельной длины: по ней считается место под осью сравнения
+SAMPLE_PROFESSION = 'Ш' * LABEL_WIDTH * LABEL_LINES
+
+_local = threading.local()
+
+
+def thousands(x, pos):
+    '''Подпись оси в тысячах: 150000 -> 150k'''
+    return f'{int(x/1000)}k'
+
+
+def shorten(text, limit=TITLE_LIMIT):
+    '''Текст в одну строку не длиннее limit символов (лишнее — за многоточием)'''
+    text = ' '.join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + '…'
+
+
+def wrap_label(text, width=LABEL_WIDTH, lines=LABEL_LINES):
+    '''Подпись в lines строк по width символов (лишнее — за многоточием)'''
+    return '\n'.join(textwrap.wrap(' '.join(str(text).split()), width, max_lines=lines,
+                                   placeholder='…'))
+
+
+def to_png(figure):
+    '''PNG-байты фигуры: одна отрисовка без пересчета разметки'''
+    buf = io.BytesIO()
+    figure.canvas.print_png(buf)
+    return buf.getvalue()
+
+
+def set_bars(bars, lefts, widths, heights):
+    '''Новые координаты готовых столбцов'''
+    for bar, left, width, height in zip(bars, lefts, widths, heights):
+        bar.set_x(left)
+        bar.set_width(width)
+        bar.set_height(height)
+
+
+class HistogramChart:
+    '''Шаблон гистограммы зарплат'''
+
+    BINS = 30
+
+    def __init__(self):
+        self.figure = Figure(figsize=(12, 7), dpi=CHART_DPI)
+        FigureCanvasAgg(self.figure)
+        ax = self.ax = self.figure.add_subplot()
+
+        zeros = np.zeros(self.BINS)
+        self.bars = ax.bar(zeros, zeros, width=1, align='edge',
+                           color='#3498db', alpha=0.7, edgecolor='black')
+        self.median = ax.axvline(0, color='red', linestyle='--', linewidth=2)
+        self.mean = ax.axvline(0, color='green', linestyle='--', linewidth=2)
+
+        ax.set_xlabel('Заработная плата (₽)', fontsize=12, fontweight='bold')
+        ax.set_ylabel('Количество вакансий', fontsize=12, fontweight='bold')
+        self.title = ax.set_title('\n', fontsize=14, fontweight='bold')
+        self.legend = ax.legend([self.median, self.mean], ['', ''], fontsize=11)
+        ax.grid(True, alpha=0.3)
+        ax.xaxis.set_major_formatter(FuncFormatter(thousands))
+
+        self.update(SAMPLE_SALARIES, SAMPLE_QUERY, SAMPLE_CITY, 150_000, 160_000)
+        self.figure.tight_layout()
+
+    def update(self, salaries, query, city_name, median, mean):
+        counts, edges = np.histogram(salaries, bins=self.BINS)
+        set_bars(self.bars, edges[:-1], np.diff(edges), counts)
+        self.median.set_xdata([median, median])
+        self.mean.set_xdata([mean, mean])
+
+        median_label, mean_label = self.legend.get_texts()
+        median_label.set_text(f'Медиана: {int(median):,} ₽')
+        mean_label.set_text(f'Среднее: {int(mean):,} ₽')
+        self.title.set_text(f'Распределение зарплат: {shorten(query)}\n{city_name}')
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+    def render(self, *args):
+        self.update(*args)
+        return to_png(self.figure)
+
+
+class ComparisonChart:
+    '''Шаблон сравнения медиан и средних для n профессий'''
+
+    WIDTH = 0.35
+
+    def __init__(self, n):
+        self.figure = Figure(figsize=(14, 8), dpi=CHART_DPI)
+        FigureCanvasAgg(self.figure)
+        ax = self.ax = self.figure.add_subplot()
+
+        x = np.arange(n)
+        zeros = np.zeros(n)
+        self.medians = ax.bar(x - self.WIDTH/2, zeros, self.WIDTH, label='Медиана', color='#3498db')
+        self.means = ax.bar(x + self.WIDTH/2, zeros, self.WIDTH, label='Среднее', color='#2ecc71')
+        self.labels = [ax.text(bar.get_x() + bar.get_width()/2., 0, '',
+                               ha='center', va='bottom', fontsize=9)
+                       for bars in (self.medians, self.means) for bar in bars]
+
+        ax.set_xlabel('Профессия', fontsize=12, fontweight='bold')
+        ax.set_ylabel('Зарплата (₽)', fontsize=12, fontweight='bold')
+        ax.set_title('Сравнение зарплат по профессиям', fontsize=14, fontweight='bold')
+        ax.set_xticks(x)
+        ax.legend()
+        ax.yaxis.set_major_formatter(FuncFormatter(thousands))
+
+        self.update([SAMPLE_PROFESSION] * n, [150_000] * n, [160_000] * n)
+        self.figure.tight_layout()
+
+    def update(self, professions, medians, means):
+        heights = list(medians) + list(means)
+        for bar, label, height in zip([*self.medians, *self.means], self.labels, heights):
+            bar.set_height(height)
+            # Значения над столбцами
+            label.set_y(height)
+            label.set_text(f'{int(height/1000)}k')
+            label.set_visible(height > 0)
+
+        self.ax.set_xticklabels([wrap_label(p) for p in professions], rotation=15, ha='right')
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+    def render(self, *args):
+        self.update(*args)
+        return to_png(self.figure)
+
+
+class ReportChart:
+    '''Шаблон детального отчета из пяти графиков
+
+    Гистограмма и топ работодателей обновляются на месте; круговая диаграмма,
+    типы занятости и box plot меняют число элементов, поэтому перестраиваются
+    на своих осях (разметка фигуры при этом сохраняется).
+    '''
+
+    BINS = 25
+    TOP = 10
+    EXPERIENCE_COLORS = ['#e74c3c', '#f39c12', '#3498db', '#9b59b6']
+
+    def __init__(self):
+        self.figure = Figure(figsize=(16, 10), dpi=CHART_DPI)
+        FigureCanvasAgg(self.figure)
+        axes = self.figure.subplots(2, 3).flat
+        self.hist_ax, self.top_ax, self.exp_ax, self.emp_ax, self.box_ax, spare = axes
+        spare.remove()
+
+        # 1. Гистограмма зарплат
+        ax = self.hist_ax
+        zeros = np.zeros(self.BINS)
+        self.hist = ax.bar(zeros, zeros, width=1, align='edge',
+                           color='#3498db', alpha=0.7, edgecolor='black')
+        self.median = ax.axvline(0, color='red', linestyle='--', linewidth=2)
+        ax.set_xlabel('Зарплата (₽)')
+        ax.set_ylabel('Количество')
+        ax.set_title('Распределение зарплат')
+        ax.xaxis.set_major_formatter(FuncFormatter(thousands))
+
+        # 2. Топ работодателей
+        ax = self.top_ax
+        self.top = ax.barh(range(self.TOP), np.zeros(self.TOP), color='#2ecc71')
+        ax.set_yticks(range(self.TOP))
+        ax.set_xlabel('Количество вакансий')
+        ax.set_title('Топ работодателей')
+        ax.invert_yaxis()
+
+        self.suptitle = self.figure.suptitle('', fontsize=16, fontweight='bold', y=0.995)
+
+        sample_top = [(f'Работодатель с названием {i}...', 10 - i) for i in range(self.TOP)]
+        sample_dist = {'От 1 года до 3 лет': 3, 'Нет опыта': 1}
+        self.update(SAMPLE_SALARIES, 150_000, sample_top, sample_dist, sample_dist,
+                    SAMPLE_QUERY, SAMPLE_CITY)
+        self.figure.tight_layout()
+
+    def update(self, salaries, median, top_employers, experience, employment, query, city_name):
+        counts, edges = np.histogram(salaries, bins=self.BINS)
+        set_bars(self.hist, edges[:-1], np.diff(edges), counts)
+        self.median.set_xdata([median, median])
+        self.hist_ax.relim()
+        self.hist_ax.autoscale_view()
+
+        names = [n[:25] + '...' if len(n) > 25 else n for n, _ in top_employers]
+        for i, bar in enumerate(self.top):
+            bar.set_visible(i < len(top_employers))
+            bar.set_width(top_employers[i][1] if i < len(top_employers) else 0)
+        self.top_ax.set_yticks(range(len(names)))
+        self.top_ax.set_yticklabels(names, fontsize=9)
+        self.top_ax.relim(visible_only=True)
+        self.top_ax.autoscale_view()
+
+        # 3. Опыт работы
+        ax = self.exp_ax
+        ax.cla()
+        if experience:
+            ax.pie(experience.values(), labels=experience.keys(), autopct='%1.1f%%',
+                   colors=self.EXPERIENCE_COLORS, startangle=90)
+            ax.set_title('Распределение по опыту')
+
+        # 4. Тип занятости
+        ax = self.emp_ax
+        ax.cla()
+        if employment:
+            ax.bar(range(len(employment)), employment.values(), color='#1abc9c')
+            ax.set_xticks(range(len(employment)))
+            ax.set_xticklabels(employment.keys(), rotation=45, ha='right', fontsize=9)
+            ax.set_ylabel('Количество')
+            ax.set_title('Тип занятости')
+
+        # 5. Box plot зарплат
+        ax = self.box_ax
+        ax.cla()
+        ax.boxplot(salaries)
+        ax.set_ylabel('Зарплата (₽)')
+        ax.set_title('Статистика зарплат')
+        ax.yaxis.set_major_formatter(FuncFormatter(thousands))
+
+        self.suptitle.set_text(f'Детальный анализ: {shorten(query)} | {city_name}')
+
+    def render(self, *args):
+        self.update(*args)
+        return to_png(self.figure)
+
+
+def _template(cls, *args):
+    '''Шаблон графика текущего потока'''
+    templates = _local.__dict__.setdefault('templates', {})
+    key = (cls, *args)
+    if key not in templates:
+        templates[key] = cls(*args)
+    return templates[key]
+
+
+def salary_histogram(salaries, query, city_name, median, mean):
+    '''Гистограмма зарплат в PNG (функция модуля, чтобы ее можно было вызвать в другом процессе)'''
+    return _template(HistogramChart).render(salaries, query, city_name, median, mean)
+
+
+def comparison_chart(professions, medians, means):
+    '''Сравнительный график медиан и средних в PNG'''
+    return _template(ComparisonChart, len(professions)).render(professions, medians, means)
+
+
+def detailed_report(salaries, median, top_employers, experience, employment, query, city_name):
+    '''Детальный отчет в PNG'''
+    return _template(ReportChart).render(salaries, median, top_employers, experience,
+                                         employment, query, city_name)
+
+
+def warm_up(max_compare=8):
+    '''Создание шаблонов заранее: шрифты, разметка и буферы Agg (initializer пула процессов)'''
+    salary_histogram(SAMPLE_SALARIES, SAMPLE_QUERY, SAMPLE_CITY, 150_000, 160_000)
+    for n in range(2, max_compare + 1):
+        comparison_chart([SAMPLE_QUERY] * n, [150_000] * n, [160_000] * n)
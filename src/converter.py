@@ -1,14 +1,37 @@
-def convert_to_rub(row):
-    '''Конвертация в рубли'''
-    if row['salary.currency'] == 'EUR':
-        return row['salary'] * 90
-    if row['salary.currency'] == 'USD':
-        return row['salary'] * 80
-    return row['salary']
-
-
-def convert_to_net(row):
-    '''Конвертация в рубли'''
-    if row['salary.gross'] == 1:
-        return row['salary'] * 0.87
-    return row['salary']
+'''Векторная нормализация зарплат: валюта, «на руки», середина вилки'''
+import numpy as np
+import pandas as pd
+
+# Курсы к рублю; индекс в списке — код валюты
+CURRENCIES = ['RUR', 'EUR', 'USD']
+RATES = np.array([1.0, 90.0, 80.0])
+
+# Неизвестная валюта (код -1) считается рублями
+_RATES_LOOKUP = np.append(RATES, 1.0)
+
+NET_RATE = 0.87  # зарплата «на руки» после НДФЛ 13%
+
+
+def currency_codes(currency):
+    '''Коды валют по списку CURRENCIES, -1 для неизвестных и пропусков'''
+    return pd.Index(CURRENCIES).get_indexer(pd.Series(currency, dtype=object))
+
+
+def salary_midpoint(salary_from, salary_to):
+    '''Середина вилки; если указана одна граница — она сама'''
+    salary_from = np.asarray(salary_from, dtype=float)
+    salary_to = np.asarray(salary_to, dtype=float)
+    mid = (salary_from + salary_to) / 2
+    mid = np.where(np.isnan(salary_from), salary_to, mid)
+    return np.where(np.isnan(salary_to), salary_from, mid)
+
+
+def to_rub(salary, codes):
+    '''Конвертация в рубли по кодам валют'''
+    return np.asarray(salary, dtype=float) * _RATES_LOOKUP[codes]
+
+
+def to_net(salary, gross):
+    '''Конвертация в зарплату «на руки» для вакансий с зарплатой до вычета налогов'''
+    salary = np.asarray(salary, dtype=float)
+    return np.where(np.asarray(gross) == 1, salary * NET_RATE, salary)
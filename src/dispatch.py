@@ -0,0 +1,182 @@
+'''Диспетчер тяжелых задач бота: поиск в пуле потоков, графики в пуле процессов'''
+import contextvars
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Размеры пулов и число пользователей, чьи задачи выполняются одновременно
+JOB_WORKERS = int(os.getenv('BOT_JOB_WORKERS', '8'))
+RENDER_WORKERS = int(os.getenv('BOT_RENDER_WORKERS', '2'))
+MAX_ACTIVE_USERS = int(os.getenv('BOT_MAX_ACTIVE_USERS', '32'))
+
+
+class Cancelled(Exception):
+    '''Задачу вытеснил более новый запрос того же пользователя'''
+
+
+# Задача текущего потока (копируется в потоки загрузки страниц вместе с контекстом)
+_job = contextvars.ContextVar('dispatch_job', default=None)
+
+# Отказ от общей загрузки (см. shared): True, если ее больше никто не ждет
+_abandon = contextvars.ContextVar('dispatch_abandon', default=None)
+
+
+def check():
+    '''Прерывание текущей задачи, если ее вытеснили; вне задач Dispatcher ничего не делает
+
+    Вызывается в циклах загрузки страниц. Общую загрузку (shared) задача
+    прерывает, только если ее результат больше никто не ждет.
+    '''
+    job = _job.get()
+    if job is None or not job.cancelled:
+        return
+    abandon = _abandon.get()
+    if abandon is None or abandon():
+        raise Cancelled()
+
+
+@contextmanager
+def shared(abandon):
+    '''Загрузка, которую могут ждать другие задачи: abandon() — отказ от нее, если не ждут'''
+    lock, abandoned = threading.Lock(), []
+
+    def once():
+        # Страницы проверяются из нескольких потоков, а отказаться можно один раз
+        with lock:
+            if not abandoned and abandon():
+                abandoned.append(True)
+            return bool(abandoned)
+
+    token = _abandon.set(once)
+    try:
+        yield
+    finally:
+        _abandon.reset(token)
+
+
+class Job:
+    '''Задача пользователя с признаком отмены'''
+
+    def __init__(self, user_id, fn, args):
+        self.user_id = user_id
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def check(self):
+        '''Прерывание задачи, если пользователь уже отправил новый запрос'''
+        if self.cancelled:
+            raise Cancelled()
+
+
+class RenderPool:
+    '''Пул процессов для графиков (matplotlib не потокобезопасен), создается по требованию'''
+
+    def __init__(self, workers=RENDER_WORKERS, max_compare=8):
+        self.workers = workers
+        self.max_compare = max_compare  # до скольки профессий заранее готовить графики сравнения
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    import charts  # matplotlib не нужен, пока бот не рисует
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         initializer=charts.warm_up,
+                                                         initargs=(self.max_compare,))
+        return self._executor
+
+    def render(self, plot, *args):
+        '''Отрисовка графика в одном из процессов'''
+        return self._get_executor().submit(plot, *args).result()
+
+    def warm_up(self):
+        '''Запуск процессов заранее, чтобы первый график не ждал их старта'''
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self, wait=False):
+        '''Остановка процессов (wait — дождаться текущих графиков)'''
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class Dispatcher:
+    '''Очереди задач по пользователям поверх общих пулов
+
+    У каждого пользователя выполняется не больше одной задачи. Новая задача
+    отменяет текущую и заменяет ожидающую: нужен только последний запрос.
+    '''
+
+    def __init__(self, job_workers=JOB_WORKERS, render_workers=RENDER_WORKERS,
+                 max_active_users=MAX_ACTIVE_USERS, max_compare=8):
+        self.max_active_users = max_active_users
+        self.job_workers = job_workers
+        self._jobs = ThreadPoolExecutor(max_workers=job_workers,
+                                        thread_name_prefix='bot-job')
+        self.renderer = RenderPool(render_workers, max_compare)
+        self._lock = threading.Lock()
+        self._running = {}  # user_id -> Job
+        self._pending = {}  # user_id -> Job
+
+    @property
+    def active_users(self):
+        '''Сколько пользователей сейчас ждут результата'''
+        return len(self._running)
+
+    @property
+    def queued(self):
+        '''Сколько задач ждут свободного потока или окончания прежней задачи пользователя'''
+        return max(0, len(self._running) - self.job_workers) + len(self._pending)
+
+    def submit(self, user_id, fn, *args):
+        '''Постановка задачи fn(job, *args); False, если бот перегружен'''
+        job = Job(user_id, fn, args)
+        with self._lock:
+            current = self._running.get(user_id)
+            if current is not None:
+                current.cancelled = True
+                superseded = self._pending.get(user_id)
+                if superseded is not None:
+                    superseded.cancelled = True
+                self._pending[user_id] = job
+                return True
+            if len(self._running) >= self.max_active_users:
+                return False
+            self._running[user_id] = job
+        self._jobs.submit(self._run, job)
+        return True
+
+    def _run(self, job):
+        '''Выполнение задачи и запуск следующей из очереди пользователя'''
+        token = _job.set(job)
+        try:
+            if not job.cancelled:
+                job.fn(job, *job.args)
+        except Cancelled:
+            pass
+        except Exception as e:
+            print(f"Ошибка в задаче пользователя {job.user_id}: {e}")
+        finally:
+            _job.reset(token)
+            with self._lock:
+                next_job = self._pending.pop(job.user_id, None)
+                if next_job is None:
+                    del self._running[job.user_id]
+                else:
+                    self._running[job.user_id] = next_job
+            if next_job is not None:
+                self._jobs.submit(self._run, next_job)
+
+    def render(self, plot, *args):
+        '''Отрисовка графика в пуле процессов'''
+        return self.renderer.render(plot, *args)
+
+    def shutdown(self, wait=False):
+        '''Остановка пулов (wait — дождаться уже начатых задач)'''
+        self._jobs.shutdown(wait=wait, cancel_futures=True)
+        self.renderer.shutdown(wait)
@@ -0,0 +1,288 @@
+'''Загрузка выдачи глубже 2000 вакансий: окна по дате публикации
+
+hh.ru отдает по запросу не больше 2000 вакансий (20 страниц по 100), и для
+широких запросов (Москва, вся Россия) статистика строилась по первым 2000 по
+релевантности. Если found больше, Harvester делит период поиска (последние
+PERIOD_DAYS дней или date_from/date_to запроса) на непересекающиеся окна
+date_from/date_to так, чтобы в каждом было меньше 2000 вакансий, окна с
+перебором делит дальше. Окна по дате покрывают всю выдачу (в отличие от
+вилок зарплат, мимо которых проходят вакансии без зарплаты), а их число
+оценивается по found, так что лишних запросов немного. Окна грузятся
+параллельно (SHARD_WORKERS), страницы отдаются по мере загрузки, вакансии на
+границах окон — без повторов (по id).
+
+Время загрузки ограничено: окон не больше MAX_SHARDS (BOT_HARVEST_SHARDS,
+0 — как раньше, только первые 2000), окно короче MIN_WINDOW секунд не
+делится. Предел жесткий и выдачу урезает: больше MAX_SHARDS * DEPTH вакансий
+(16000 при 8 окнах) не загрузится никогда, а если публикации распределены
+неравномерно, то и меньше — окна за пустые дни тоже расходуют предел. Так,
+для 30000 вакансий, опубликованных за последние три недели, 8 окон дают
+12000. В переполненных окнах берутся первые 2000 вакансий, а сколько
+осталось за пределом, после загрузки показывает truncated; статистика по
+урезанной выдаче предупреждает об этом (stats_advanced.format_stats_message).
+'''
+import asyncio
+import contextvars
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import dispatch
+import hh_client
+
+# Больше стольких вакансий API по одному запросу не отдает
+DEPTH = hh_client.MAX_PAGES * hh_client.PER_PAGE
+
+# Сколько окон можно загрузить ради одного запроса и сколько одновременно
+MAX_SHARDS = int(os.getenv('BOT_HARVEST_SHARDS', '8'))
+SHARD_WORKERS = int(os.getenv('BOT_HARVEST_WORKERS', '4'))
+
+# hh.ru ищет вакансии за последние 30 дней
+PERIOD_DAYS = 30
+
+# Окно меньше этого (секунды) не делится
+MIN_WINDOW = 60
+
+# Целевое заполнение окна: запас на неравномерность публикаций
+FILL = 0.8
+
+
+def fits(found, max_shards=MAX_SHARDS):
+    '''Может ли выдача с found вакансиями загрузиться целиком: не больше max_shards окон по DEPTH'''
+    return found <= DEPTH * max(1, max_shards)
+
+
+def to_ts(value):
+    '''date_from/date_to запроса в секундах epoch'''
+    return datetime.fromisoformat(value).timestamp()
+
+
+def to_param(ts):
+    '''Секунды epoch в формате date_from/date_to'''
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec='seconds')
+
+
+def period(params, now=None):
+    '''Период поиска запроса: (начало, конец) в секундах epoch'''
+    now = time.time() if now is None else now
+    start = to_ts(params['date_from']) if 'date_from' in params else now - PERIOD_DAYS * 86400
+    end = to_ts(params['date_to']) if 'date_to' in params else now
+    return start, end
+
+
+def split(start, end, found, budget):
+    '''Окна (начало, конец) вместо одного с found вакансиями; не больше budget + 1 окон'''
+    parts = min(max(2, math.ceil(found / (DEPTH * FILL))), budget + 1)
+    if parts < 2 or end - start < MIN_WINDOW:
+        return None
+    step = (end - start) / parts
+    return [(start + i * step, end if i == parts - 1 else start + (i + 1) * step)
+            for i in range(parts)]
+
+
+def shard_params(params, start, end):
+    '''Параметры запроса одного окна (границы включительно, с точностью до секунды)'''
+    return dict(params, date_from=to_param(math.floor(start)), date_to=to_param(math.ceil(end)))
+
+
+def item_id(item):
+    return item.get('id')
+
+
+def unique(pages, seen=None):
+    '''Страницы без вакансий, которые уже встречались (окна пересекаются на границах)'''
+    seen = set() if seen is None else seen
+    for page in pages:
+        fresh = []
+        for item in page:
+            vacancy_id = item_id(item)
+            if vacancy_id not in seen:
+                seen.add(vacancy_id)
+                fresh.append(item)
+        if fresh:
+            yield fresh
+
+
+class Harvester:
+    '''Выдача целиком поверх HHClient: тот же iter_pages, но без предела в 2000'''
+
+    def __init__(self, client, max_shards=MAX_SHARDS, workers=SHARD_WORKERS):
+        self.client = client
+        self.max_shards = max_shards
+        self.workers = workers
+        self.truncated = 0  # сколько вакансий последней загрузки осталось за пределом 2000
+
+    def iter_pages(self, params, max_pages=hh_client.MAX_PAGES, project=None, missing=None,
+                   first=None):
+        '''Страницы выдачи; запросы больше 2000 вакансий грузятся окнами
+
+        Номера потерянных страниц окна попадают в missing как (начало окна,
+        номер страницы); потерянное окно целиком — как (начало окна, None).
+        first — уже загруженная первая страница (как у HHClient.iter_pages).
+        '''
+        params = dict(params, per_page=hh_client.PER_PAGE)
+        if first is None:
+            first = self.client.get_page(params, 0)
+        windows = self.windows(params, first, max_pages)
+        if windows is None:
+            self.truncated = max(0, first.get('found', 0) - DEPTH)
+            yield from self.client.iter_pages(params, max_pages, project, missing, first=first)
+            return
+        yield from unique(self._harvest(params, windows, project, missing))
+
+    def windows(self, params, first, max_pages):
+        '''Первые окна запроса или None, если делить не нужно (или нельзя)'''
+        found = first.get('found', 0)
+        if found <= DEPTH or self.max_shards < 2 or max_pages < hh_client.MAX_PAGES:
+            return None
+        return split(*period(params), found, self.max_shards - 1)
+
+    def _harvest(self, params, windows, project, missing):
+        '''Страницы всех окон в порядке загрузки (с повторами на границах)'''
+        self.truncated = 0
+        out = queue.Queue()
+        lock = threading.Lock()
+        state = {'pending': 0, 'shards': len(windows)}
+        pool = ThreadPoolExecutor(self.workers, thread_name_prefix='hh-shard')
+
+        def submit(windows):
+            # Счетчик — до запуска: иначе первое окно может закончиться раньше, чем учтено второе
+            with lock:
+                state['pending'] += len(windows)
+            # Копия контекста на окно: запросы попадают в разбивку текущего поиска
+            for start, end in windows:
+                pool.submit(contextvars.copy_context().run, run, start, end)
+
+        def run(start, end):
+            try:
+                shard(start, end)
+            except dispatch.Cancelled:
+                pass
+            except Exception as e:
+                print(f"Окно выдачи с {to_param(start)} не загружено: {e}")
+                if missing is not None:
+                    missing.append((start, None))
+            finally:
+                with lock:
+                    state['pending'] -= 1
+                    done = state['pending'] == 0
+                if done:
+                    out.put(None)
+
+        def shard(start, end):
+            dispatch.check()
+            sub = shard_params(params, start, end)
+            first = self.client.get_page(sub, 0)
+            found = first.get('found', 0)
+            if found > DEPTH:
+                with lock:
+                    windows = split(start, end, found, self.max_shards - state['shards'])
+                    if windows is not None:
+                        state['shards'] += len(windows) - 1
+                    else:
+                        self.truncated += found - DEPTH
+                if windows is not None:
+                    submit(windows)
+                    return
+                print(f"Окно с {to_param(start)}: {found} вакансий, загружены первые {DEPTH}")
+            lost = []
+            for page in self.client.iter_pages(sub, project=project, missing=lost, first=first):
+                out.put(page)
+            if lost and missing is not None:
+                missing.extend((start, page) for page in lost)
+
+        submit(windows)
+        try:
+            while True:
+                page = out.get()
+                # Окна вытесненной задачи заканчиваются без страниц: выдача неполная
+                dispatch.check()
+                if page is None:
+                    return
+                yield page
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncHarvester(Harvester):
+    '''То же для hh_async.AsyncHHClient: окна — задачи event loop'''
+
+    async def iter_pages(self, params, max_pages=hh_client.MAX_PAGES, project=None, missing=None,
+                         first=None):
+        '''Страницы выдачи; запросы больше 2000 вакансий грузятся окнами (см. Harvester)'''
+        params = dict(params, per_page=hh_client.PER_PAGE)
+        if first is None:
+            first = await self.client.get_page(params, 0)
+        windows = self.windows(params, first, max_pages)
+        if windows is None:
+            self.truncated = max(0, first.get('found', 0) - DEPTH)
+            async for page in self.client.iter_pages(params, max_pages, project, missing,
+                                                     first=first):
+                yield page
+            return
+
+        seen = set()
+        async for page in self._harvest(params, windows, project, missing):
+            for fresh in unique([page], seen):
+                yield fresh
+
+    async def _harvest(self, params, windows, project, missing):
+        self.truncated = 0
+        out = asyncio.Queue()
+        slots = asyncio.Semaphore(self.workers)
+        state = {'pending': 0, 'shards': len(windows)}
+        tasks = set()
+
+        def submit(windows):
+            state['pending'] += len(windows)
+            for start, end in windows:
+                task = asyncio.ensure_future(run(start, end))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        async def run(start, end):
+            try:
+                async with slots:
+                    await shard(start, end)
+            except Exception as e:
+                print(f"Окно выдачи с {to_param(start)} не загружено: {e}")
+                if missing is not None:
+                    missing.append((start, None))
+            finally:
+                state['pending'] -= 1
+                if state['pending'] == 0:
+                    out.put_nowait(None)
+
+        async def shard(start, end):
+            sub = shard_params(params, start, end)
+            first = await self.client.get_page(sub, 0)
+            found = first.get('found', 0)
+            if found > DEPTH:
+                windows = split(start, end, found, self.max_shards - state['shards'])
+                if windows is not None:
+                    state['shards'] += len(windows) - 1
+                    submit(windows)
+                    return
+                self.truncated += found - DEPTH
+                print(f"Окно с {to_param(start)}: {found} вакансий, загружены первые {DEPTH}")
+            lost = []
+            async for page in self.client.iter_pages(sub, project=project, missing=lost,
+                                                     first=first):
+                out.put_nowait(page)
+            if lost and missing is not None:
+                missing.extend((start, page) for page in lost)
+
+        submit(windows)
+        try:
+            while True:
+                page = await out.get()
+                if page is None:
+                    return
+                yield page
+        finally:
+            for task in list(tasks):
+                task.cancel()
@@ -0,0 +1,259 @@
+'''Асинхронный клиент HeadHunter API для бота на AsyncTeleBot'''
+import asyncio
+import contextvars
+import time
+
+import aiohttp
+
+import harvester
+import hh_client
+import metrics
+import vacancy_store
+
+# stats_advanced и pandas импортируются при первом поиске, а не при старте бота
+
+
+class AsyncHHClient:
+    '''Загрузка вакансий через общий пул соединений aiohttp'''
+
+    def __init__(self, base_url=hh_client.HH_API_URL, concurrency=hh_client.DEFAULT_CONCURRENCY,
+                 rate=hh_client.DEFAULT_RATE, timeout=10, max_concurrency=hh_client.MAX_CONCURRENCY,
+                 retries=hh_client.RETRIES, limiter=None):
+        '''limiter — общий бюджет процесса (hh_client.get_limiter), иначе свой'''
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        # Тот же адаптивный бюджет, что у HHClient: concurrency — начальное окно
+        self.limiter = limiter or hh_client.AdaptiveLimiter(rate, concurrency, max_concurrency)
+        self.concurrency = self.limiter.max_limit
+        self._session = None
+
+    def _get_session(self):
+        '''Сессия создается внутри работающего event loop'''
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'User-Agent': 'Telegram-Project/1.0'}
+            )
+        return self._session
+
+    async def get_json(self, path, params):
+        '''GET-запрос к API с учетом лимитов; 429, 5xx и обрывы повторяются с паузой'''
+        session = self._get_session()
+        params = {k: str(v) for k, v in params.items()}
+        for attempt in range(self.retries + 1):
+            started = await self.limiter.acquire_async()
+            status = wait = None
+            # Слот освобождается при любом исходе, в том числе при отмене задачи
+            try:
+                async with session.get(self.base_url + path, params=params) as resp:
+                    metrics.STAGE_SECONDS.observe(time.monotonic() - started, 'hh_request')
+                    status, wait = resp.status, hh_client.retry_after(resp.headers)
+                    if status not in hh_client.RETRY_STATUSES:
+                        resp.raise_for_status()
+                        return await resp.json()
+                    error = aiohttp.ClientResponseError(
+                        resp.request_info, resp.history, status=status,
+                        message=f'{status} от {path}')
+            except aiohttp.ContentTypeError as e:
+                # Ответ пришел, но не JSON (заглушка прокси): повторяется, как у HHClient
+                error = e
+            except aiohttp.ClientResponseError:
+                # 4xx: сервер ответил, повтор не поможет
+                raise
+            except ValueError as e:
+                # Обрезанное или битое тело JSON
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, error = None, e
+            except asyncio.CancelledError:
+                self.limiter.cancel()
+                started = None
+                raise
+            finally:
+                if started is not None:
+                    self.limiter.release(started, status, wait)
+            if attempt < self.retries:
+                metrics.HH_RETRIES.inc(hh_client.retry_reason(error))
+                await asyncio.sleep(hh_client.backoff_delay(attempt, wait))
+        raise error
+
+    async def get_page(self, params, page):
+        '''Одна страница выдачи /vacancies'''
+        return await self.get_json('/vacancies', dict(params, page=page))
+
+    async def iter_pages(self, params, max_pages=hh_client.MAX_PAGES, project=None, missing=None,
+                         first=None):
+        '''Страницы выдачи по мере загрузки: первая переиспользуется, остальные грузятся параллельно
+
+        Как у HHClient.iter_pages: не загрузившиеся после повторов страницы
+        пропускаются, их номера добавляются в missing; first — уже загруженная
+        первая страница.
+        '''
+        params = dict(params, per_page=hh_client.PER_PAGE)
+        if first is None:
+            first = await self.get_page(params, 0)
+        pages = min(first.get('pages', 0), max_pages)
+
+        yield hh_client.page_items(first, project)
+        tasks = [asyncio.ensure_future(self.get_page(params, page)) for page in range(1, pages)]
+        try:
+            for page, task in enumerate(tasks, 1):
+                try:
+                    data = await task
+                except Exception as e:
+                    metrics.HH_MISSING_PAGES.inc()
+                    print(f"Страница {page} не загружена: {e}")
+                    if missing is not None:
+                        missing.append(page)
+                    continue
+                yield hh_client.page_items(data, project)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def fetch_vacancies(self, params, max_pages=hh_client.MAX_PAGES, project=None):
+        '''Все вакансии по запросу одним списком'''
+        return [item async for page in self.iter_pages(params, max_pages, project)
+                for item in page]
+
+    async def close(self):
+        '''Закрытие сессии'''
+        if self._session is not None:
+            await self._session.close()
+
+
+_client = None
+_inflight = {}  # ключ запроса -> задача загрузки
+
+
+def get_client():
+    '''Общий асинхронный клиент процесса'''
+    global _client
+    if _client is None:
+        # Бюджет общий с упреждающей загрузкой, которая идет через HHClient в потоке
+        _client = AsyncHHClient(limiter=hh_client.get_limiter())
+    return _client
+
+
+async def _run_blocking(fn, *args):
+    '''Блокирующая работа (SQLite, pandas) вне event loop, в контексте задачи (для метрик)'''
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, context.run, fn, *args)
+
+
+async def _fetch_pages(client, params, progress, on_records, missing=None, first=None):
+    '''Загрузка страниц с промежуточными итогами (progress.add может вернуть корутину)
+
+    Возвращает, сколько вакансий выдачи осталось за пределом загрузки (harvester).
+    '''
+    import schema
+    source = harvester.AsyncHarvester(client)
+    pages = source.iter_pages(params, project=schema.project, missing=missing, first=first)
+    async for records in pages:
+        on_records(records)
+        if progress is not None:
+            update = progress.add(records)
+            if update is not None:
+                await update
+    return source.truncated
+
+
+async def _load_frame(key, params, client, store, progress=None, first=None):
+    '''Загрузка вакансий в общий кэш, через локальное хранилище, если оно включено'''
+    import stats_advanced
+    with metrics.stage('load'):
+        df, missing, truncated = await _load_pages(key, params, client, store, progress, first)
+
+    await _run_blocking(stats_advanced.finish_frame, key, df, missing, truncated)
+    if not missing:
+        stats_advanced.RESULT_CACHE.put(key, df)
+    return df
+
+
+async def _load_pages(key, params, client, store, progress, first=None):
+    '''Кадр вакансий, номера не загрузившихся страниц и сколько вакансий не поместилось'''
+    import schema
+    import stats_advanced
+    missing = []
+    if store is None:
+        builder = schema.FrameBuilder()
+        truncated = await _fetch_pages(client, params, progress, builder.add, missing, first)
+        df = builder.frame()
+    else:
+        query_key = stats_advanced.store_key(client, key)
+        # Те же шаги, что у VacancyStore.sync, но страницы грузятся корутинами
+        plan = await _run_blocking(store.plan_sync, query_key, params)
+        if plan.params is not None:
+            if not plan.full:
+                progress = first = None
+            fresh = []
+            try:
+                truncated = await _fetch_pages(client, plan.params, progress, fresh.extend,
+                                               missing, first)
+                await _run_blocking(store.commit_sync, plan, fresh, missing, truncated)
+            finally:
+                # Отмена задачи не должна оставлять отметку загрузки другим процессам
+                store.release(plan)
+        df = await _run_blocking(lambda: schema.build_frame(store.iter_load(query_key)))
+        truncated = await _run_blocking(store.truncated, query_key)
+    return df, missing, truncated
+
+
+async def load_stats(query, city_id=1, experience=None, remote_only=False, client=None,
+                     store=None, progress=None):
+    '''Асинхронный аналог VacancyStats(...): тот же кэш, одна загрузка на одинаковые запросы'''
+    import pandas as pd
+    import stats_advanced
+    client = client or get_client()
+    store = store or vacancy_store.get_store()
+    key = stats_advanced.make_query_key(query, city_id, experience, remote_only)
+    # Как stats_advanced.load_frame: выдача без фильтров, фильтры — масками
+    try:
+        frame, first = await _plan_frame(key, client, store)
+        if progress is not None and frame != key:
+            progress = stats_advanced.FilteredProgress(progress, key)
+        df = await _cached_frame(frame, client, store, progress, first)
+        if frame != key:
+            if stats_advanced.is_truncated(df, key):
+                df = await _cached_frame(key, client, store)
+            else:
+                df = stats_advanced.filter_frame(df, key)
+    except Exception as e:
+        print(f"Ошибка при загрузке данных: {e}")
+        df = pd.DataFrame()
+
+    return stats_advanced.VacancyStats.from_frame(query, city_id, df, key)
+
+
+async def _plan_frame(key, client, store):
+    '''Асинхронный stats_advanced.plan_frame: (ключ кадра, первая страница его выдачи или None)'''
+    import stats_advanced
+    frame = stats_advanced.known_frame_key(key)
+    if frame is None and store is not None:
+        frame = await _run_blocking(stats_advanced.known_frame_key, key, client, store)
+    if frame is not None:
+        return frame, None
+    base = stats_advanced.base_key(key)
+    first = await client.get_page(dict(stats_advanced.key_params(base),
+                                       per_page=hh_client.PER_PAGE), 0)
+    if harvester.fits(first.get('found', 0)):
+        return base, first
+    return key, None
+
+
+async def _cached_frame(key, client, store, progress=None, first=None):
+    '''Кадр из RESULT_CACHE; при промахе одна загрузка на все одинаковые запросы'''
+    import stats_advanced
+    df = stats_advanced.RESULT_CACHE.get(key)
+    if df is not None:
+        return df
+
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(
+            _load_frame(key, stats_advanced.key_params(key), client, store, progress, first))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: отмена одного пользователя не прерывает общую загрузку
+    return await asyncio.shield(task)
@@ -0,0 +1,397 @@
+'''Клиент HeadHunter API с общей keep-alive сессией и параллельной загрузкой страниц'''
+import contextvars
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import dispatch
+import metrics
+
+# Адрес API можно переопределить (например, на локальный стаб для бенчмарков)
+HH_API_URL = os.getenv('HH_API_URL', 'https://api.hh.ru')
+
+# На сколько процессов делится бюджет запросов (main_webhook: по числу обработчиков),
+# чтобы все процессы вместе не превышали HH_RATE и HH_MAX_CONCURRENCY
+BUDGET_SHARES = max(1, int(os.getenv('HH_BUDGET_SHARES', '1')))
+
+# Ограничения по умолчанию: одновременных запросов и запросов в секунду
+DEFAULT_CONCURRENCY = max(1, int(os.getenv('HH_CONCURRENCY', '4')) // BUDGET_SHARES)
+DEFAULT_RATE = float(os.getenv('HH_RATE', '8')) / BUDGET_SHARES
+
+# Адаптивный лимит: потолок окна одновременных запросов, «медленный» ответ в секундах,
+# во сколько раз сокращаются окно и частота при перегрузке и нижняя граница частоты
+MAX_CONCURRENCY = max(1, int(os.getenv('HH_MAX_CONCURRENCY', '16')) // BUDGET_SHARES)
+LATENCY_TARGET = float(os.getenv('HH_LATENCY_TARGET', '3'))
+DECREASE = 0.5
+MIN_RATE = 0.5
+
+# Повторы: попыток после первой и границы паузы между ними (секунды)
+RETRIES = int(os.getenv('HH_RETRIES', '4'))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 10.0
+
+# Ответы, после которых запрос стоит повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+MAX_PAGES = 20  # API отдает не больше 2000 вакансий (20 страниц по 100)
+PER_PAGE = 100
+
+# Регионы hh.ru (area), доступные в настройках бота
+CITIES = {
+    1: 'Москва',
+    2: 'Санкт-Петербург',
+    3: 'Екатеринбург',
+    4: 'Новосибирск',
+    88: 'Казань',
+    66: 'Нижний Новгород',
+    113: 'Россия'
+}
+
+
+def page_items(data, project=None):
+    '''Вакансии страницы выдачи, спроецированные функцией project'''
+    items = data.get('items', [])
+    return [project(item) for item in items] if project else list(items)
+
+
+# Все бюджеты процесса (клиенты пользователей, упреждающей загрузки, асинхронный) для метрик
+_budgets = weakref.WeakSet()
+
+
+def _budget_total(field):
+    return sum(getattr(budget, field) for budget in list(_budgets))
+
+
+metrics.counter('bot_hh_responses_total', 'Ответы hh.ru: успешные, 429, ошибки и обрывы',
+                lambda: {'ok': _budget_total('ok'), 'throttled': _budget_total('throttled'),
+                         'failed': _budget_total('failed')}, label='outcome')
+metrics.gauge('bot_hh_in_flight', 'Запросы к hh.ru в полете', lambda: _budget_total('in_flight'))
+metrics.gauge('bot_hh_window', 'Окно одновременных запросов (сумма по клиентам)',
+              lambda: _budget_total('window'))
+metrics.gauge('bot_hh_rate', 'Текущий бюджет запросов в секунду (сумма по клиентам)',
+              lambda: _budget_total('rate'))
+
+
+class Congestion:
+    '''Общий бюджет запросов к API: окно одновременных запросов и частота по AIMD
+
+    Бюджет частоты — token bucket. На 429 частота и окно сокращаются вдвое
+    (и, если есть Retry-After, все запросы ждут), на 5xx, обрывы и ответы
+    медленнее latency_target — только окно. Успешный ответ увеличивает окно на
+    1/окно, а частоту на 1/частота: примерно +1 за каждый «раунд» до потолков
+    (max_concurrency и исходная частота). Сокращение срабатывает один раз на
+    раунд: неудачи запросов, отправленных до прошлого сокращения, не считаются.
+    Здесь только расчет; ожидание — в AdaptiveLimiter и hh_async.
+    '''
+
+    def __init__(self, rate=DEFAULT_RATE, concurrency=DEFAULT_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, latency_target=LATENCY_TARGET):
+        self.max_rate = rate
+        self.rate = rate
+        self.max_limit = max(max_concurrency, concurrency)
+        self.limit = float(concurrency)
+        self.latency_target = latency_target
+        self.tokens = float(concurrency)
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0  # пользовательские запросы, ждущие слота
+        self.paused_until = 0.0
+        self.decreased = 0.0  # время последнего сокращения
+        self.ok = self.throttled = self.failed = 0
+        _budgets.add(self)
+
+    @property
+    def window(self):
+        return max(1, int(self.limit))
+
+    def try_acquire(self, now, share=None):
+        '''Занять слот: 0 — занят, число — сколько ждать, None — ждать освобождения слота
+
+        share — фоновый запрос (упреждающая загрузка): он получает слот, только
+        если пользователи не ждут и в полете меньше этой доли окна.
+        '''
+        # Всплеск — не больше окна, как у прежнего TokenBucket с capacity=concurrency
+        self.tokens = min(self.window, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.in_flight >= self.window:
+            return None
+        if share is not None and (self.waiting or
+                                  self.in_flight >= max(1, int(self.window * share))):
+            return None
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def on_result(self, started, now, status=None, retry_after=None):
+        '''Итог запроса, начатого в started: status — HTTP-код или None, если ответа нет'''
+        self.in_flight -= 1
+        if status is not None and status not in RETRY_STATUSES:
+            self.ok += 1
+            if now - started <= self.latency_target:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+                return
+        elif status == 429:
+            self.throttled += 1
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+        else:
+            self.failed += 1
+
+        if started < self.decreased:
+            return
+        self.decreased = now
+        self.limit = max(1.0, self.limit * DECREASE)
+        if status == 429:
+            self.rate = max(MIN_RATE, self.rate * DECREASE)
+
+    def snapshot(self):
+        '''Текущее состояние для отчетов'''
+        return {'window': self.window, 'rate': round(self.rate, 2), 'ok': self.ok,
+                'throttled': self.throttled, 'failed': self.failed}
+
+
+class AdaptiveLimiter(Congestion):
+    '''Congestion для потоков и event loop: acquire ждет слот, release сообщает итог запроса
+
+    Один бюджет на процесс (get_limiter) делят клиенты пользователей,
+    асинхронный клиент и упреждающая загрузка: потоки ждут на условии,
+    корутины — своего события, которое release будит из любого потока.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cond = threading.Condition()
+        self._async_waiters = set()  # (event loop, asyncio.Event)
+
+    def acquire(self, share=None):
+        '''Ожидание слота; возвращает время начала запроса (share — см. try_acquire)'''
+        waiting = False
+        with self.cond:
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self.try_acquire(now, share)
+                    if wait == 0:
+                        return now
+                    if share is None and not waiting:
+                        waiting = True
+                        self.waiting += 1
+                    self.cond.wait(wait)
+            finally:
+                if waiting:
+                    self.waiting -= 1
+
+    async def acquire_async(self, share=None):
+        '''То же для корутин: ожидание не блокирует event loop'''
+        import asyncio
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        waiting = False
+        try:
+            while True:
+                with self.cond:
+                    now = time.monotonic()
+                    wait = self.try_acquire(now, share)
+                    if wait == 0:
+                        return now
+                    if share is None and not waiting:
+                        waiting = True
+                        self.waiting += 1
+                    waiter[1].clear()
+                    self._async_waiters.add(waiter)
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self.cond:
+                self._async_waiters.discard(waiter)
+                if waiting:
+                    self.waiting -= 1
+
+    def release(self, started, status=None, retry_after=None):
+        with self.cond:
+            self.on_result(started, time.monotonic(), status, retry_after)
+            self._notify()
+
+    def cancel(self):
+        '''Слот запроса, отмененного на полпути: отмена — не признак перегрузки'''
+        with self.cond:
+            self.in_flight -= 1
+            self._notify()
+
+    def _notify(self):
+        '''Разбудить ждущие потоки и корутины (вызывать под self.cond)'''
+        self.cond.notify_all()
+        for loop, event in self._async_waiters:
+            loop.call_soon_threadsafe(event.set)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    '''Общий бюджет запросов процесса: пользователи, асинхронный клиент и упреждающая загрузка'''
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = AdaptiveLimiter()
+    return _limiter
+
+
+def retry_reason(error):
+    '''Метка причины повтора для метрик: код ответа или класс ошибки'''
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'status', None)
+    return str(status) if status else type(error).__name__
+
+
+def backoff_delay(attempt, retry_after=None):
+    '''Пауза перед повтором: экспоненциальная со случайным разбросом (full jitter), не меньше Retry-After'''
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+def retry_after(headers):
+    '''Retry-After в секундах (дата вместо числа не поддерживается)'''
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class HHClient:
+    '''Загрузка вакансий через одну keep-alive сессию'''
+
+    def __init__(self, base_url=HH_API_URL, concurrency=DEFAULT_CONCURRENCY,
+                 rate=DEFAULT_RATE, timeout=10, max_concurrency=MAX_CONCURRENCY,
+                 retries=RETRIES, limiter=None, share=None):
+        '''limiter — общий бюджет (get_limiter), иначе свой из rate и concurrency;
+        share — доля окна для фоновых запросов (см. Congestion.try_acquire)'''
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        # Общий для всех пользователей бюджет: concurrency — начальное окно
+        self.limiter = limiter or AdaptiveLimiter(rate, concurrency, max_concurrency)
+        self.share = share
+        self.concurrency = self.limiter.max_limit
+
+        # Пул соединений не меньше числа параллельных запросов
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = 'Telegram-Project/1.0'
+
+        # Общий пул потоков: лимит параллельности действует на всех пользователей сразу
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                        thread_name_prefix='hh-fetch')
+
+    def get_json(self, path, params):
+        '''GET-запрос к API с учетом лимитов; 429, 5xx и обрывы повторяются с паузой'''
+        for attempt in range(self.retries + 1):
+            started = self.limiter.acquire(self.share)
+            status = wait = None
+            # Слот освобождается при любом исходе: иначе общий бюджет процесса встанет
+            try:
+                with metrics.stage('hh_request'):
+                    resp = self.session.get(self.base_url + path, params=params,
+                                            timeout=self.timeout)
+                status, wait = resp.status_code, retry_after(resp.headers)
+                if status not in RETRY_STATUSES:
+                    resp.raise_for_status()
+                    return resp.json()
+                error = requests.HTTPError(f'{status} от {path}', response=resp)
+            except requests.HTTPError:
+                # 4xx: сервер ответил, повтор не поможет
+                raise
+            except requests.JSONDecodeError as e:
+                # Ответ пришел, но не JSON (заглушка прокси, обрезанное тело): повторяется
+                error = e
+            except requests.RequestException as e:
+                # Обрывы, таймауты, битое сжатие или chunked-тело, редиректы
+                status, error = None, e
+            finally:
+                self.limiter.release(started, status, wait)
+            if attempt < self.retries:
+                metrics.HH_RETRIES.inc(retry_reason(error))
+                time.sleep(backoff_delay(attempt, wait))
+        raise error
+
+    def get_page(self, params, page):
+        '''Одна страница выдачи /vacancies'''
+        return self.get_json('/vacancies', dict(params, page=page))
+
+    def iter_pages(self, params, max_pages=MAX_PAGES, project=None, missing=None, first=None):
+        '''Страницы выдачи по мере загрузки: первая переиспользуется, остальные грузятся параллельно
+
+        project (например, schema.project) применяется к каждой вакансии сразу
+        при разборе страницы, чтобы не держать в памяти полные ответы API.
+        Страница, не загрузившаяся после всех повторов, пропускается, а ее
+        номер добавляется в missing: лучше неполная статистика, чем никакой.
+        Без первой страницы результата нет — ее ошибка пробрасывается.
+        first — уже загруженная первая страница (ответ get_page(params, 0)).
+        '''
+        params = dict(params, per_page=PER_PAGE)
+        if first is None:
+            first = self.get_page(params, 0)
+        pages = min(first.get('pages', 0), max_pages)
+
+        yield page_items(first, project)
+        if pages > 1:
+            # Копия контекста на страницу: запросы попадают в разбивку текущего поиска
+            jobs = [(contextvars.copy_context(), page) for page in range(1, pages)]
+            for page, items in zip(range(1, pages), self._pool.map(
+                    lambda job: job[0].run(self._try_page, params, job[1], project), jobs)):
+                dispatch.check()
+                if items is None:
+                    if missing is not None:
+                        missing.append(page)
+                    continue
+                yield items
+
+    def _try_page(self, params, page, project):
+        '''Страница выдачи или None, если она так и не загрузилась'''
+        # Вытесненная задача не тратит бюджет hh.ru на оставшиеся страницы
+        dispatch.check()
+        try:
+            return page_items(self.get_page(params, page), project)
+        except Exception as e:
+            metrics.HH_MISSING_PAGES.inc()
+            print(f"Страница {page} не загружена: {e}")
+            return None
+
+    def fetch_vacancies(self, params, max_pages=MAX_PAGES, project=None):
+        '''Все вакансии по запросу одним списком'''
+        return [item for page in self.iter_pages(params, max_pages, project) for item in page]
+
+    def close(self):
+        '''Закрытие сессии и пула потоков'''
+        self._pool.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    '''Общий для всего процесса клиент API'''
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HHClient(limiter=get_limiter())
+    return _client
@@ -1,9 +1,14 @@
 import telebot
-from telebot import types
 import os
+import threading
 from dotenv import load_dotenv
-import stats_advanced
-import quiz
+import bot_core
+import dispatch
+import metrics
+import prefetch
+
+# stats_advanced (pandas, matplotlib) импортируется в задачах и в фоновом прогреве:
+# поллинг стартует сразу, /start и викторина не ждут загрузки аналитики
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -17,402 +22,213 @@ if not TOKEN:
 
 bot = telebot.TeleBot(TOKEN)
 
-# Инициализация викторины
-quiz_manager = quiz.QuizSession()
-
-# Словарь для хранения состояний и настроек пользователей (в памяти)
-user_states = {}
-user_settings = {}
-
-
-def get_main_keyboard():
-    '''Главная клавиатура с кнопками'''
-    keyboard = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
-    keyboard.add(
-        types.KeyboardButton('🔍 Поиск вакансий'),
-        types.KeyboardButton('⚖️ Сравнить профессии'),
-        types.KeyboardButton('🎯 Тест на профориентацию'),
-        types.KeyboardButton('⚙️ Настройки'),
-        types.KeyboardButton('ℹ️ Помощь')
-    )
-    return keyboard
-
-
-def get_cities_keyboard():
-    '''Клавиатура выбора города'''
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    cities = [
-        ('Москва', 1),
-        ('Санкт-Петербург', 2),
-        ('Екатеринбург', 3),
-        ('Новосибирск', 4),
-        ('Казань', 88),
-        ('Нижний Новгород', 66),
-        ('Вся Россия', 113)
-    ]
-    buttons = [types.InlineKeyboardButton(name, callback_data=f'city_{id}')
-               for name, id in cities]
-    markup.add(*buttons)
-    return markup
-
-
-def get_experience_keyboard():
-    '''Клавиатура выбора опыта'''
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    experiences = [
-        ('Не важно', 'all'),
-        ('Без опыта', 'noExperience'),
-        ('1-3 года', 'between1And3'),
-        ('3-6 лет', 'between3And6'),
-        ('Более 6 лет', 'moreThan6')
-    ]
-    buttons = [types.InlineKeyboardButton(name, callback_data=f'exp_{code}')
-               for name, code in experiences]
-    markup.add(*buttons)
-    return markup
-
-
-def get_user_settings(user_id):
-    '''Получение настроек пользователя (из памяти)'''
-    if user_id not in user_settings:
-        user_settings[user_id] = {
-            'city_id': 1,
-            'experience': 'all',
-            'remote_only': 0
-        }
-    return user_settings[user_id]
-
-
-def update_user_settings(user_id, **kwargs):
-    '''Обновление настроек пользователя'''
-    if user_id not in user_settings:
-        user_settings[user_id] = {
-            'city_id': 1,
-            'experience': 'all',
-            'remote_only': 0
-        }
-    user_settings[user_id].update(kwargs)
+# Поиск и графики выполняются в пулах, чтобы не блокировать остальных пользователей
+dispatcher = dispatch.Dispatcher(max_compare=bot_core.MAX_COMPARE)
+
+# Упреждающая загрузка — только пока нет поисков пользователей
+prefetcher = prefetch.Prefetcher(busy=lambda: dispatcher.active_users > 0)
+
+metrics.gauge('bot_active_users', 'Пользователи, ждущие результата',
+              lambda: dispatcher.active_users)
+metrics.gauge('bot_queue_depth', 'Задачи в очереди: диспетчер и упреждающая загрузка',
+              lambda: {'dispatcher': dispatcher.queued,
+                       'prefetch': prefetcher.stats()['queued']}, label='queue')
+
+
+def execute(actions):
+    '''Выполнение действий из bot_core через синхронный бот'''
+    for action in actions:
+        if isinstance(action, bot_core.Search):
+            job = search_job
+        elif isinstance(action, bot_core.Compare):
+            job = comparison_job
+        elif isinstance(action, bot_core.Prefetch):
+            prefetcher.recommend(action.queries, bot_core.stats_filters(action.settings))
+            continue
+        else:
+            try:
+                with metrics.stage('tg_' + action.method):
+                    result = getattr(bot, action.method)(*action.args, **action.kwargs)
+            except Exception:
+                metrics.BOT_API_ERRORS.inc(action.method)
+                if action.on_error is not None:
+                    execute(action.on_error())
+                elif not action.quiet:
+                    raise
+            else:
+                if action.on_result is not None:
+                    action.on_result(result)
+            continue
+
+        if not dispatcher.submit(action.user_id, job, action):
+            bot.send_message(action.chat_id, bot_core.BUSY_MESSAGE)
 
 
 @bot.message_handler(commands=['start'])
+@metrics.timed('handler_start')
 def start(message):
     '''Команда /start'''
-    user_name = message.from_user.first_name
-    msg = f"👋 Привет, <b>{user_name}</b>!\n\n"
-    msg += "Я помогу тебе с выбором профессии! Могу показать:\n\n"
-    msg += "🔍 Статистику по зарплатам с графиками\n"
-    msg += "⚖️ Сравнение разных профессий\n"
-    msg += "🎯 Тест на профориентацию\n\n"
-    msg += "Используй кнопки ниже или просто напиши название профессии! 👇"
-
-    bot.send_message(message.chat.id, msg, parse_mode='html',
-                    reply_markup=get_main_keyboard())
+    execute(bot_core.start(message))
 
 
 @bot.message_handler(commands=['help'])
+@metrics.timed('handler_help_command')
 def help_command(message):
     '''Команда /help'''
-    msg = "📖 <b>Как пользоваться ботом:</b>\n\n"
-    msg += "1️⃣ <b>Поиск вакансий:</b>\n"
-    msg += "   Просто напиши профессию, например: 'программист'\n\n"
-    msg += "2️⃣ <b>Настройки:</b>\n"
-    msg += "   Выбери город, опыт работы, удаленка/офис\n\n"
-    msg += "3️⃣ <b>Сравнение:</b>\n"
-    msg += "   Используй /compare программист, дизайнер\n\n"
-    msg += "4️⃣ <b>Тест:</b>\n"
-    msg += "   Пройди тест на профориентацию /quiz\n\n"
-    msg += "<b>Команды:</b>\n"
-    msg += "/start - Начать работу\n"
-    msg += "/help - Помощь\n"
-    msg += "/settings - Настройки\n"
-    msg += "/compare - Сравнение профессий\n"
-    msg += "/quiz - Тест на профориентацию\n"
-
-    bot.send_message(message.chat.id, msg, parse_mode='html')
+    execute(bot_core.help_command(message))
 
 
 @bot.message_handler(commands=['settings'])
+@metrics.timed('handler_settings')
 def settings(message):
     '''Настройки пользователя'''
-    user_set = get_user_settings(message.from_user.id)
-
-    msg = "⚙️ <b>Настройки поиска:</b>\n\n"
-    city_name = stats_advanced.VacancyStats.CITIES.get(user_set['city_id'], 'Москва')
-    msg += f"📍 Город: {city_name}\n"
-    msg += f"💼 Опыт: {user_set['experience']}\n"
-    msg += f"🏠 Только удаленка: {'Да' if user_set['remote_only'] else 'Нет'}\n\n"
-    msg += "Выбери что хочешь изменить:"
-
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    markup.add(
-        types.InlineKeyboardButton('📍 Изменить город', callback_data='settings_city'),
-        types.InlineKeyboardButton('💼 Изменить опыт', callback_data='settings_exp'),
-        types.InlineKeyboardButton('🏠 Переключить удаленку', callback_data='settings_remote')
-    )
-
-    bot.send_message(message.chat.id, msg, parse_mode='html', reply_markup=markup)
+    execute(bot_core.settings(message))
 
 
 @bot.message_handler(commands=['compare'])
+@metrics.timed('handler_compare_command')
 def compare_command(message):
     '''Команда сравнения профессий'''
-    msg = "⚖️ <b>Сравнение профессий</b>\n\n"
-    msg += "Введи 2-4 профессии через запятую, например:\n"
-    msg += "<code>программист, дизайнер, аналитик</code>\n\n"
-    msg += "Я покажу сравнение зарплат!"
-
-    bot.send_message(message.chat.id, msg, parse_mode='html')
-    user_states[message.from_user.id] = {'state': 'waiting_compare'}
+    execute(bot_core.compare_command(message))
 
 
 @bot.message_handler(commands=['quiz'])
+@metrics.timed('handler_quiz_command')
 def quiz_command(message):
     '''Запуск викторины'''
-    quiz_manager.start_quiz(message.from_user.id)
-    send_quiz_question(message.chat.id, message.from_user.id)
+    execute(bot_core.quiz_command(message))
 
 
 def send_quiz_question(chat_id, user_id):
     '''Отправка вопроса викторины'''
-    question = quiz_manager.get_current_question(user_id)
+    execute(bot_core.send_quiz_question(chat_id, user_id))
 
-    if not question:
-        # Викторина завершена
-        result = quiz_manager.get_result(user_id)
-        result_msg = quiz.get_quiz_result_message(result)
 
-        bot.send_message(chat_id, result_msg, parse_mode='html')
+@bot.callback_query_handler(func=lambda call: True)
+@metrics.timed('handler_callback_handler')
+def callback_handler(call):
+    '''Обработчик всех callback кнопок'''
+    execute(bot_core.callback_handler(call))
 
-        # Предлагаем посмотреть профессии
-        markup = types.InlineKeyboardMarkup()
-        profile_professions = quiz.CAREER_PROFILES[result['profile']]['professions']
-        for profession in profile_professions[:3]:
-            markup.add(types.InlineKeyboardButton(
-                f"🔍 {profession}",
-                callback_data=f"search_{profession}"
-            ))
 
-        bot.send_message(chat_id, "Хочешь узнать больше о этих профессиях?",
-                        reply_markup=markup)
+def process_search_query(message, query, user_id=None):
+    '''Обработка поискового запроса'''
+    execute(bot_core.search_request(message, query, user_id))
 
-        quiz_manager.end_quiz(user_id)
-        return
 
-    # Отправляем вопрос с кнопками
-    markup = types.InlineKeyboardMarkup(row_width=1)
-    for idx, option in enumerate(question['options']):
-        markup.add(types.InlineKeyboardButton(
-            option['text'],
-            callback_data=f"quiz_{idx}"
-        ))
+def process_comparison(message, professions):
+    '''Обработка сравнения профессий'''
+    execute(bot_core.comparison_request(message, professions))
 
-    bot.send_message(chat_id, question['question'], reply_markup=markup)
 
+def warm_up():
+    '''Фоновая загрузка аналитики и запуск процессов-рисовальщиков'''
+    import stats_advanced  # noqa: F401
+    bot_core.quiz.get_engine()
+    bot_core.state_store.get_state()
+    dispatcher.renderer.warm_up()
+    prefetcher.start()
 
-@bot.callback_query_handler(func=lambda call: True)
-def callback_handler(call):
-    '''Обработчик всех callback кнопок'''
-    user_id = call.from_user.id
-    chat_id = call.message.chat.id
-    data = call.data
-
-    # Функция для безопасного ответа на callback (игнорирует ошибки с истекшими кнопками)
-    def safe_answer(message=""):
-        try:
-            bot.answer_callback_query(call.id, message)
-        except:
-            pass  # Игнорируем ошибки с устаревшими callback
-
-    # Обработка настроек города
-    if data.startswith('city_'):
-        city_id = int(data.split('_')[1])
-        update_user_settings(user_id, city_id=city_id)
-        city_name = stats_advanced.VacancyStats.CITIES.get(city_id, 'Неизвестно')
-        safe_answer(f"Город изменен на: {city_name}")
-        bot.edit_message_text("✅ Настройки сохранены!", chat_id, call.message.message_id)
-
-    # Обработка настроек опыта
-    elif data.startswith('exp_'):
-        experience = data.split('_')[1]
-        update_user_settings(user_id, experience=experience)
-        safe_answer("Опыт работы обновлен!")
-        bot.edit_message_text("✅ Настройки сохранены!", chat_id, call.message.message_id)
-
-    # Переключение удаленки
-    elif data == 'settings_remote':
-        settings = get_user_settings(user_id)
-        new_value = 0 if settings['remote_only'] else 1
-        update_user_settings(user_id, remote_only=new_value)
-        status = "включена" if new_value else "выключена"
-        safe_answer(f"Удаленка {status}")
-        bot.edit_message_text("✅ Настройки сохранены!", chat_id, call.message.message_id)
-
-    # Открытие меню настроек
-    elif data == 'settings_city':
-        bot.edit_message_text("Выбери город:", chat_id, call.message.message_id,
-                             reply_markup=get_cities_keyboard())
-
-    elif data == 'settings_exp':
-        bot.edit_message_text("Выбери опыт работы:", chat_id, call.message.message_id,
-                             reply_markup=get_experience_keyboard())
-
-    # Поиск профессии
-    elif data.startswith('search_'):
-        profession = data[7:]  # Убираем 'search_'
-        process_search_query(call.message, profession)
-        safe_answer(f"Ищу: {profession}")
-
-    # Викторина
-    elif data.startswith('quiz_'):
-        answer_idx = int(data.split('_')[1])
-        quiz_manager.add_answer(user_id, answer_idx)
-        safe_answer("✅")
-        bot.delete_message(chat_id, call.message.message_id)
-        send_quiz_question(chat_id, user_id)
-
-
-def process_search_query(message, query):
-    '''Обработка поискового запроса'''
-    user_id = message.from_user.id if hasattr(message, 'from_user') else message.chat.id
-    chat_id = message.chat.id
 
-    # Сохраняем последний запрос
-    if user_id not in user_states:
-        user_states[user_id] = {}
-    user_states[user_id]['last_query'] = query
+def search_job(job, search):
+    '''Поиск вакансий и отправка статистики (выполняется в пуле)'''
+    with metrics.trace('search', user_id=search.user_id, query=search.query) as fields:
+        run_search(job, search, fields)
 
-    # Получаем настройки
-    settings = get_user_settings(user_id)
 
-    bot.send_message(chat_id, f"🔍 Ищу вакансии: <b>{query}</b>...", parse_mode='html')
+def run_search(job, search, fields):
+    '''Тело search_job; в fields — поля строки JSON-лога'''
+    import stats_advanced
+    chat_id = search.chat_id
+    execute([bot_core.search_started(search)])
+
+    def show_progress(preview):
+        # Отмененную задачу не прерываем: загрузку могут ждать другие пользователи
+        if not job.cancelled:
+            execute(bot_core.search_progress(search,
+                                             stats_advanced.format_progress_message(preview)))
 
     try:
-        # Создаем статистику
-        stats = stats_advanced.VacancyStats(
-            query,
-            city_id=settings['city_id'],
-            experience=settings['experience'] if settings['experience'] != 'all' else None,
-            remote_only=settings['remote_only']
-        )
-
-        # Отправляем текстовую статистику
+        # Создаем статистику, по ходу загрузки показывая предварительные итоги
+        filters = bot_core.stats_filters(search.settings)
+        prefetcher.note_search(search.query, filters)
+        progress = stats_advanced.Progress(search.query, filters['city_id'], show_progress)
+        stats = stats_advanced.VacancyStats(search.query, progress=progress, **filters)
+        fields.update(city_id=filters['city_id'], vacancies=len(stats.df),
+                      missing_pages=stats.missing_pages)
+        job.check()
+
+        # Заменяем предварительные итоги текстовой статистикой
         msg = stats_advanced.format_stats_message(stats)
-        bot.send_message(chat_id, msg, parse_mode='html')
+        execute(bot_core.search_finished(search, msg))
 
         # Создаем и отправляем график
-        if stats.create_salary_histogram('salaries.png'):
-            with open('salaries.png', 'rb') as photo:
-                bot.send_photo(chat_id, photo)
-
+        chart = stats.create_salary_histogram(render=dispatcher.render)
+        if chart:
+            job.check()
+            execute([bot_core.photo_reply(chat_id, chart)])
+
+    except dispatch.Cancelled:
+        fields['cancelled'] = True
+        raise
     except Exception as e:
-        bot.send_message(chat_id, f"❌ Ошибка при получении данных: {str(e)}\n"
-                                  "Попробуй другой запрос или проверь настройки.")
+        fields['error'] = str(e)
+        execute([bot_core.search_failed(search, e)])
 
 
-def process_comparison(message, professions):
-    '''Обработка сравнения профессий'''
-    chat_id = message.chat.id
-    settings = get_user_settings(message.from_user.id)
-
-    if len(professions) < 2:
-        bot.send_message(chat_id, "❌ Нужно минимум 2 профессии для сравнения!")
-        return
+def comparison_job(job, compare):
+    '''Сравнение профессий (выполняется в пуле)'''
+    with metrics.trace('compare', user_id=compare.user_id, queries=compare.professions):
+        run_comparison(job, compare)
 
-    if len(professions) > 4:
-        bot.send_message(chat_id, "❌ Максимум 4 профессии для сравнения!")
-        return
 
-    bot.send_message(chat_id, "⏳ Собираю данные для сравнения...")
+def run_comparison(job, compare):
+    '''Тело comparison_job'''
+    import stats_advanced
+    chat_id = compare.chat_id
+    execute([bot_core.comparison_started(compare)])
 
     try:
-        # Создаем статистику для каждой профессии
-        all_stats = []
-        for prof in professions:
-            prof = prof.strip()
-            stats = stats_advanced.VacancyStats(
-                prof,
-                city_id=settings['city_id'],
-                experience=settings['experience'] if settings['experience'] != 'all' else None,
-                remote_only=settings['remote_only']
-            )
-            all_stats.append(stats)
-
-        # Создаем сравнительный график
+        # Все профессии загружаются одновременно
+        all_stats = stats_advanced.load_comparison(
+            [prof.strip() for prof in compare.professions],
+            **bot_core.stats_filters(compare.settings))
+        job.check()
+
+        # Медианы, средние и число вакансий — одной группировкой для графика и текста
+        comparison = stats_advanced.Comparison(all_stats)
         if len(all_stats) > 1:
-            main_stats = all_stats[0]
-            other_stats = all_stats[1:]
-            main_stats.create_comparison_chart(other_stats, 'comparison.png')
-
-            with open('comparison.png', 'rb') as photo:
-                bot.send_photo(chat_id, photo,
-                             caption=f"⚖️ Сравнение: {', '.join(professions)}")
+            chart = comparison.create_chart(render=dispatcher.render)
+            job.check()
+            execute([bot_core.photo_reply(chat_id, chart,
+                                          caption=bot_core.comparison_caption(compare))])
 
         # Текстовое сравнение
-        msg = "📊 <b>Сравнение профессий:</b>\n\n"
-        for stats in all_stats:
-            basic = stats.get_basic_stats()
-            if basic:
-                msg += f"<b>{stats.query}</b>\n"
-                msg += f"  Медиана: {basic['median']:,} ₽\n"
-                msg += f"  Среднее: {basic['mean']:,} ₽\n"
-                msg += f"  Вакансий: {basic['count']}\n\n"
-
-        bot.send_message(chat_id, msg, parse_mode='html')
+        execute([bot_core.comparison_message(compare, comparison)])
 
+    except dispatch.Cancelled:
+        raise
     except Exception as e:
-        bot.send_message(chat_id, f"❌ Ошибка: {str(e)}")
+        execute([bot_core.comparison_failed(compare, e)])
 
 
 @bot.message_handler(content_types=['text'])
+@metrics.timed('handler_text_handler')
 def text_handler(message):
     '''Обработчик текстовых сообщений'''
-    user_id = message.from_user.id
-    text = message.text.strip()
-
-    # Проверяем состояние пользователя
-    if user_id in user_states:
-        state_data = user_states.get(user_id, {})
-
-        if state_data.get('state') == 'waiting_compare':
-            professions = [p.strip() for p in text.split(',')]
-            process_comparison(message, professions)
-            user_states[user_id]['state'] = None
-            return
-
-    # Обработка кнопок главного меню
-    if text == '🔍 Поиск вакансий':
-        bot.send_message(message.chat.id,
-                        "Напиши название профессии, например:\n"
-                        "• программист\n• дизайнер\n• аналитик данных")
-        return
-
-    elif text == '⚖️ Сравнить профессии':
-        compare_command(message)
-        return
-
-    elif text == '🎯 Тест на профориентацию':
-        quiz_command(message)
-        return
-
-    elif text == '⚙️ Настройки':
-        settings(message)
-        return
-
-    elif text == 'ℹ️ Помощь':
-        help_command(message)
-        return
-
-    # Обычный поисковый запрос
-    else:
-        process_search_query(message, text)
+    execute(bot_core.text_handler(message))
 
 
 if __name__ == '__main__':
     print("🤖 Бот запущен!")
     print("✅ Все системы готовы!\n")
+    metrics.start_server()
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
     try:
         bot.infinity_polling(timeout=60, long_polling_timeout=60, skip_pending=True)
     except KeyboardInterrupt:
         print("\n👋 Бот остановлен пользователем")
     except Exception as e:
         print(f"❌ Ошибка: {e}")
+    finally:
+        dispatcher.shutdown()
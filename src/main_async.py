@@ -0,0 +1,254 @@
+'''Асинхронная точка входа бота на AsyncTeleBot
+
+Обработчики те же, что в main_advanced.py (общее ядро bot_core), но вакансии
+грузятся асинхронным клиентом hh.ru: одновременные пользователи стоят
+корутин, а не потоков, заблокированных в requests.get.
+
+Запуск: python src/main_async.py
+'''
+import asyncio
+import contextvars
+import os
+
+from dotenv import load_dotenv
+from telebot.async_telebot import AsyncTeleBot
+
+import bot_core
+import dispatch
+import hh_async
+import metrics
+import prefetch
+
+# Загрузка переменных окружения
+load_dotenv()
+
+TOKEN = os.getenv('BOT_TOKEN')
+if not TOKEN:
+    print("❌ ОШИБКА: Токен не найден!")
+    print("📝 Создай файл .env в корне проекта и добавь строку:")
+    print("   BOT_TOKEN=твой_токен_от_BotFather")
+    exit(1)
+
+bot = AsyncTeleBot(TOKEN)
+
+# Графики рисуются в отдельных процессах, pandas-работа — в пуле потоков loop
+renderer = dispatch.RenderPool(max_compare=bot_core.MAX_COMPARE)
+
+# Текущая тяжелая задача каждого пользователя
+user_tasks = {}
+
+# Упреждающая загрузка идет в своем потоке, только пока нет задач пользователей
+prefetcher = prefetch.Prefetcher(busy=lambda: len(user_tasks) > 0)
+
+metrics.gauge('bot_active_users', 'Пользователи, ждущие результата', lambda: len(user_tasks))
+metrics.gauge('bot_queue_depth', 'Задачи в очереди упреждающей загрузки',
+              lambda: {'prefetch': prefetcher.stats()['queued']}, label='queue')
+
+
+async def run_blocking(fn, *args):
+    '''Блокирующий вызов вне event loop (этапы пишутся в разбивку текущего поиска)'''
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, context.run, fn, *args)
+
+
+def warm_up():
+    '''Фоновая загрузка аналитики (pandas, matplotlib) и запуск процессов-рисовальщиков'''
+    import stats_advanced  # noqa: F401
+    bot_core.quiz.get_engine()
+    bot_core.state_store.get_state()
+    renderer.warm_up()
+    prefetcher.start()
+
+
+async def execute(actions):
+    '''Выполнение действий из bot_core через асинхронный бот'''
+    for action in actions:
+        if isinstance(action, bot_core.Search):
+            start_task(action, search_job(action))
+        elif isinstance(action, bot_core.Compare):
+            start_task(action, comparison_job(action))
+        elif isinstance(action, bot_core.Prefetch):
+            prefetcher.recommend(action.queries, bot_core.stats_filters(action.settings))
+        else:
+            try:
+                with metrics.stage('tg_' + action.method):
+                    result = await getattr(bot, action.method)(*action.args, **action.kwargs)
+            except Exception:
+                metrics.BOT_API_ERRORS.inc(action.method)
+                if action.on_error is not None:
+                    await execute(action.on_error())
+                elif not action.quiet:
+                    raise
+            else:
+                if action.on_result is not None:
+                    action.on_result(result)
+
+
+def start_task(action, coro):
+    '''Запуск задачи пользователя: новая отменяет предыдущую, при перегрузке — отказ'''
+    previous = user_tasks.get(action.user_id)
+    if previous is not None:
+        previous.cancel()
+    elif len(user_tasks) >= dispatch.MAX_ACTIVE_USERS:
+        coro.close()
+        asyncio.ensure_future(bot.send_message(action.chat_id, bot_core.BUSY_MESSAGE))
+        return
+
+    task = user_tasks[action.user_id] = asyncio.ensure_future(coro)
+
+    def done(_):
+        if user_tasks.get(action.user_id) is task:
+            del user_tasks[action.user_id]
+
+    task.add_done_callback(done)
+
+
+@bot.message_handler(commands=['start'])
+@metrics.timed('handler_start')
+async def start(message):
+    '''Команда /start'''
+    await execute(bot_core.start(message))
+
+
+@bot.message_handler(commands=['help'])
+@metrics.timed('handler_help_command')
+async def help_command(message):
+    '''Команда /help'''
+    await execute(bot_core.help_command(message))
+
+
+@bot.message_handler(commands=['settings'])
+@metrics.timed('handler_settings')
+async def settings(message):
+    '''Настройки пользователя'''
+    await execute(bot_core.settings(message))
+
+
+@bot.message_handler(commands=['compare'])
+@metrics.timed('handler_compare_command')
+async def compare_command(message):
+    '''Команда сравнения профессий'''
+    await execute(bot_core.compare_command(message))
+
+
+@bot.message_handler(commands=['quiz'])
+@metrics.timed('handler_quiz_command')
+async def quiz_command(message):
+    '''Запуск викторины'''
+    await execute(bot_core.quiz_command(message))
+
+
+@bot.callback_query_handler(func=lambda call: True)
+@metrics.timed('handler_callback_handler')
+async def callback_handler(call):
+    '''Обработчик всех callback кнопок'''
+    await execute(bot_core.callback_handler(call))
+
+
+@bot.message_handler(content_types=['text'])
+@metrics.timed('handler_text_handler')
+async def text_handler(message):
+    '''Обработчик текстовых сообщений'''
+    await execute(bot_core.text_handler(message))
+
+
+async def search_job(search):
+    '''Поиск вакансий и отправка статистики'''
+    with metrics.trace('search', user_id=search.user_id, query=search.query) as fields:
+        await run_search(search, fields)
+
+
+async def run_search(search, fields):
+    '''Тело search_job; в fields — поля строки JSON-лога'''
+    import stats_advanced
+    chat_id = search.chat_id
+    await execute([bot_core.search_started(search)])
+
+    task = asyncio.current_task()
+
+    async def show_progress(preview):
+        # Корутину дожидается загрузчик страниц. Общая загрузка (hh_async._cached_frame)
+        # идет и после отмены поиска, но итоги отмененного поиска уже не нужны
+        if task.done():
+            return
+        msg = await run_blocking(stats_advanced.format_progress_message, preview)
+        if not task.done():
+            await execute(bot_core.search_progress(search, msg))
+
+    try:
+        # Загружаем вакансии, по ходу загрузки показывая предварительные итоги
+        filters = bot_core.stats_filters(search.settings)
+        prefetcher.note_search(search.query, filters)
+        progress = stats_advanced.Progress(search.query, filters['city_id'], show_progress)
+        stats = await hh_async.load_stats(search.query, progress=progress, **filters)
+        fields.update(city_id=filters['city_id'], vacancies=len(stats.df),
+                      missing_pages=stats.missing_pages)
+
+        # Заменяем предварительные итоги текстовой статистикой
+        msg = await run_blocking(stats_advanced.format_stats_message, stats)
+        await execute(bot_core.search_finished(search, msg))
+
+        # Создаем и отправляем график
+        chart = await run_blocking(stats.create_salary_histogram, renderer.render)
+        if chart:
+            await execute([bot_core.photo_reply(chat_id, chart)])
+
+    except asyncio.CancelledError:
+        fields['cancelled'] = True
+        raise
+    except Exception as e:
+        fields['error'] = str(e)
+        await execute([bot_core.search_failed(search, e)])
+
+
+async def comparison_job(compare):
+    '''Сравнение профессий: все профессии загружаются одновременно'''
+    with metrics.trace('compare', user_id=compare.user_id, queries=compare.professions):
+        await run_comparison(compare)
+
+
+async def run_comparison(compare):
+    '''Тело comparison_job'''
+    import stats_advanced
+    chat_id = compare.chat_id
+    await execute([bot_core.comparison_started(compare)])
+
+    try:
+        filters = bot_core.stats_filters(compare.settings)
+        all_stats = await asyncio.gather(*(
+            hh_async.load_stats(prof.strip(), **filters) for prof in compare.professions))
+
+        # Медианы, средние и число вакансий — одной группировкой для графика и текста
+        comparison = await run_blocking(stats_advanced.Comparison, all_stats)
+        chart = await run_blocking(comparison.create_chart, renderer.render)
+        await execute([bot_core.photo_reply(chat_id, chart,
+                                            caption=bot_core.comparison_caption(compare))])
+
+        # Текстовое сравнение
+        await execute([bot_core.comparison_message(compare, comparison)])
+
+    except Exception as e:
+        await execute([bot_core.comparison_failed(compare, e)])
+
+
+async def main():
+    '''Запуск поллинга'''
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+    metrics.start_server()
+    try:
+        await bot.infinity_polling(timeout=60, skip_pending=True)
+    finally:
+        await hh_async.get_client().close()
+        await bot.close_session()
+        renderer.shutdown()
+
+
+if __name__ == '__main__':
+    print("🤖 Бот запущен (asyncio)!")
+    print("✅ Все системы готовы!\n")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n👋 Бот остановлен пользователем")
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
@@ -0,0 +1,191 @@
+'''Webhook-режим: один HTTP-приемник апдейтов и N процессов-обработчиков
+
+Telegram присылает апдейты POST-запросами на BOT_WEBHOOK_PATH. Приемник
+только разбирает JSON и кладет апдейт в очередь процесса user_id % N: все
+апдейты пользователя обрабатывает один и тот же процесс и по порядку, поэтому
+LRU записей state_store в нем всегда актуален. Каждый процесс — обычный бот
+из main_advanced (свои пулы поиска и рисования).
+
+Общие у процессов только SQLite-файлы в рабочем каталоге: локальное
+хранилище вакансий (vacancy_store) и состояние пользователей (state_store);
+их бэкенды с тем же интерфейсом можно заменить на Redis. Кэши в памяти —
+RESULT_CACHE, SUMMARY_CACHE, CHART_CACHE, file_id графиков — у каждого
+процесса свои, а загрузку запроса из hh.ru процессы делят через таблицу
+claims хранилища: один грузит, остальные ждут и читают вакансии из базы.
+Схема хранилища вакансий создается приемником до запуска обработчиков.
+
+Запуск: BOT_WEBHOOK_URL=https://example.com/webhook python src/main_webhook.py
+'''
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WORKERS = int(os.getenv('BOT_WEBHOOK_WORKERS', str(os.cpu_count() or 1)))
+HOST = os.getenv('BOT_WEBHOOK_HOST', '0.0.0.0')
+PORT = int(os.getenv('BOT_WEBHOOK_PORT', '8443'))
+PATH = os.getenv('BOT_WEBHOOK_PATH', '/webhook')
+
+# Очередь соединений listen(): Telegram открывает десятки соединений сразу,
+# а при очереди по умолчанию (5) лишние сбрасываются
+BACKLOG = int(os.getenv('BOT_WEBHOOK_BACKLOG', '128'))
+
+# Публичный адрес для setWebhook (пусто — webhook настроен заранее) и секрет запросов Telegram
+PUBLIC_URL = os.getenv('BOT_WEBHOOK_URL', '')
+SECRET = os.getenv('BOT_WEBHOOK_SECRET', '')
+
+# Адрес Bot API в формате telebot.apihelper.API_URL (локальный Bot API сервер, тесты)
+API_URL = os.getenv('BOT_API_URL', '')
+
+# Виды апдейтов, у которых есть отправитель
+SENDER_KINDS = ('message', 'edited_message', 'callback_query', 'inline_query',
+                'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+                'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request')
+
+
+def update_user(update):
+    '''Id пользователя апдейта — ключ маршрутизации (для апдейтов без него — update_id)'''
+    for kind in SENDER_KINDS:
+        body = update.get(kind)
+        if body:
+            sender = body.get('from') or body.get('user') or body.get('chat') or {}
+            if 'id' in sender:
+                return sender['id']
+    return update.get('update_id', 0)
+
+
+def worker(index, queue, shares=1):
+    '''Процесс-обработчик: апдейты своих пользователей строго по порядку'''
+    # Бюджет hh.ru делится поровну между обработчиками: вместе не больше HH_RATE
+    os.environ['HH_BUDGET_SHARES'] = str(shares)
+    if API_URL:
+        import telebot.apihelper
+        telebot.apihelper.API_URL = API_URL
+    import main_advanced
+    import metrics
+    from telebot import types
+
+    bot = main_advanced.bot
+    # Обработчики выполняются в этом потоке по очереди; тяжелые задачи уходят в dispatcher
+    bot.threaded = False
+    threading.Thread(target=main_advanced.warm_up, name='warm-up', daemon=True).start()
+    print(f"🧩 Обработчик {index} запущен (pid {os.getpid()})")
+    # У каждого процесса свои счетчики: эндпоинты на BOT_METRICS_PORT + 1 + номер
+    if metrics.PORT:
+        metrics.start_server(metrics.PORT + 1 + index)
+
+    while True:
+        update = queue.get()
+        if update is None:
+            break
+        try:
+            bot.process_new_updates([types.Update.de_json(update)])
+        except Exception as e:
+            print(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+    # С ожиданием: дочерний процесс multiprocessing не закрывает пулы при выходе сам,
+    # и без него процессы-рисовальщики остались бы висеть
+    main_advanced.dispatcher.shutdown(wait=True)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    '''HTTP-сервер приемника: поток на соединение и длинная очередь listen()'''
+
+    daemon_threads = True
+    request_queue_size = BACKLOG
+
+
+def make_handler(queues):
+    '''Обработчик HTTP-запросов приемника'''
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != PATH:
+                self.send_error(404)
+                return
+            if SECRET and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != SECRET:
+                self.send_error(403)
+                return
+            try:
+                update = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            except ValueError:
+                self.send_error(400)
+                return
+
+            queues[update_user(update) % len(queues)].put(update)
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return WebhookHandler
+
+
+def prepare_stores():
+    '''Миграция хранилища вакансий до запуска обработчиков: они открывают готовую базу'''
+    import vacancy_store
+    if vacancy_store.STORE_PATH:
+        vacancy_store.VacancyStore().close()
+
+
+def start(workers=WORKERS, host=HOST, port=PORT):
+    '''Запуск обработчиков и приемника: (сервер, процессы, очереди)'''
+    prepare_stores()
+    # spawn: процессы не наследуют потоки приемника
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(workers)]
+    server = WebhookServer((host, port), make_handler(queues))
+
+    processes = [context.Process(target=worker, args=(index, queue, workers),
+                                 name=f'bot-worker-{index}')
+                 for index, queue in enumerate(queues)]
+    for process in processes:
+        process.start()
+    return server, processes, queues
+
+
+def stop(server, processes, queues):
+    '''Остановка приемника и обработчиков (после уже принятых апдейтов)'''
+    server.server_close()
+    for queue in queues:
+        queue.put(None)
+    for process in processes:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+
+
+def set_webhook():
+    '''Регистрация адреса приемника в Telegram'''
+    import telebot
+    if API_URL:
+        telebot.apihelper.API_URL = API_URL
+    bot = telebot.TeleBot(os.getenv('BOT_TOKEN'))
+    bot.set_webhook(url=PUBLIC_URL, secret_token=SECRET or None,
+                    drop_pending_updates=True)
+
+
+if __name__ == '__main__':
+    if not os.getenv('BOT_TOKEN'):
+        print("❌ ОШИБКА: Токен не найден!")
+        exit(1)
+    server, processes, queues = start()
+    # SIGTERM (systemd, docker stop) — та же штатная остановка с обработчиками
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if PUBLIC_URL:
+        set_webhook()
+    print(f"🤖 Webhook-приемник: http://{HOST}:{PORT}{PATH}, обработчиков: {WORKERS}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Бот остановлен пользователем")
+    finally:
+        stop(server, processes, queues)
@@ -0,0 +1,308 @@
+'''Метрики бота: гистограммы длительности этапов, счетчики и HTTP-эндпоинт Prometheus
+
+Этапы поиска (загрузка выдачи, подготовка зарплат, статистика, графики,
+вызовы Bot API) пишутся в одну гистограмму bot_stage_seconds{stage}.
+Счетчики, которые уже ведут кэши и клиент hh.ru, и размеры очередей не
+дублируются на горячем пути: они регистрируются функциями и читаются только
+при запросе /metrics. Эндпоинт включается BOT_METRICS_PORT, структурный
+JSON-лог (строка на поиск с разбивкой по этапам) — BOT_METRICS_LOG
+(путь к файлу или «-» для stdout). BOT_METRICS=0 выключает замеры совсем.
+'''
+import asyncio
+import bisect
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from functools import wraps
+
+ENABLED = os.getenv('BOT_METRICS', '1') != '0'
+
+# Порт эндпоинта /metrics (0 — не запускать) и адрес, на котором он слушает
+PORT = int(os.getenv('BOT_METRICS_PORT', '0'))
+HOST = os.getenv('BOT_METRICS_HOST', '127.0.0.1')
+
+# Куда писать JSON-лог поисков: путь, «-» — stdout, пусто — никуда
+LOG_PATH = os.getenv('BOT_METRICS_LOG', '')
+
+# Границы корзин гистограмм (секунды)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    '''Счетчик с метками'''
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [(self.name, _labels(self.labels, key), value) for key, value in items]
+
+
+class Histogram:
+    '''Гистограмма длительностей с метками (корзины, сумма, число)'''
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # метки -> [счетчики корзин..., сумма, число]
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0] * (len(self.buckets) + 3)
+            row[index] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(row)) for key, row in self.values.items()]
+        result = []
+        for key, row in items:
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), row):
+                total += count
+                result.append((self.name + '_bucket',
+                               _labels(self.labels + ('le',), key + (bound,)), total))
+            result.append((self.name + '_sum', _labels(self.labels, key), row[-2]))
+            result.append((self.name + '_count', _labels(self.labels, key), row[-1]))
+        return result
+
+
+class Collected:
+    '''Метрика, значения которой читаются функцией при запросе /metrics
+
+    fn возвращает число или словарь {значение метки: число}.
+    '''
+
+    def __init__(self, name, help, fn, kind='gauge', label=None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+        self.label = label
+        _registry.append(self)
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [(self.name, _labels((self.label,), (key,)), v) for key, v in value.items()]
+        return [(self.name, '', value)]
+
+
+def gauge(name, help, fn, label=None):
+    '''Текущее значение (очередь, запросы в полете), читается при сборе'''
+    return Collected(name, help, fn, 'gauge', label)
+
+
+def counter(name, help, fn, label=None):
+    '''Счетчик, который уже ведет другой объект (попадания кэша, ответы hh.ru)'''
+    return Collected(name, help, fn, 'counter', label)
+
+
+_caches = {}  # имя -> cache.TTLCache
+
+
+def watch_cache(name, cache):
+    '''Попадания, промахи и размер кэша в метриках (счетчики ведет сам кэш)'''
+    _caches[name] = cache
+    return cache
+
+
+counter('bot_cache_hits_total', 'Попадания в кэши',
+        lambda: {name: c.hits for name, c in list(_caches.items())}, label='cache')
+counter('bot_cache_misses_total', 'Промахи кэшей',
+        lambda: {name: c.misses for name, c in list(_caches.items())}, label='cache')
+gauge('bot_cache_bytes', 'Размер кэшей в байтах',
+      lambda: {name: c.size for name, c in list(_caches.items())}, label='cache')
+
+STAGE_SECONDS = Histogram('bot_stage_seconds', 'Длительность этапов обработки', ('stage',))
+HH_RETRIES = Counter('bot_hh_retries_total', 'Повторы запросов к hh.ru', ('reason',))
+HH_MISSING_PAGES = Counter('bot_hh_missing_pages_total',
+                           'Страницы выдачи, не загрузившиеся после повторов')
+BOT_API_ERRORS = Counter('bot_api_errors_total', 'Ошибки вызовов Bot API', ('method',))
+
+# Разбивка текущего поиска по этапам (для JSON-лога); общая для потоков одного контекста
+_trace = contextvars.ContextVar('metrics_trace', default=None)
+_trace_lock = threading.Lock()
+
+
+class _Stage:
+    '''Замер этапа: в гистограмму и в разбивку текущего поиска'''
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, self.stage)
+        trace = _trace.get()
+        if trace is not None:
+            # Этапы одного поиска могут закончиться одновременно в разных потоках
+            with _trace_lock:
+                trace[self.stage] = trace.get(self.stage, 0.0) + elapsed
+        return False
+
+
+class _Off:
+    '''Замер при выключенных метриках'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_OFF = _Off()
+
+
+def stage(name):
+    '''Контекстный менеджер замера этапа: with metrics.stage('load'): ...'''
+    return _Stage(name) if ENABLED else _OFF
+
+
+def timed(name):
+    '''Декоратор: замер всей функции (или корутины) как этапа name'''
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class trace:
+    '''Поиск или сравнение целиком: этап total и строка JSON-лога с разбивкой
+
+    with metrics.trace('search', user_id=1, query='python') as fields:
+        ...  # fields можно дополнить (например, fields['cache'] = 'hit')
+    '''
+
+    def __init__(self, event, **fields):
+        self.event = event
+        self.fields = fields
+
+    def __enter__(self):
+        self.stages = {}
+        self.token = _trace.set(self.stages)
+        self.start = time.perf_counter()
+        return self.fields
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _trace.reset(self.token)
+        if ENABLED:
+            STAGE_SECONDS.observe(elapsed, self.event + '_total')
+        if exc_type is not None and 'error' not in self.fields:
+            self.fields['error'] = exc_type.__name__
+        log(self.event, seconds=round(elapsed, 4),
+            stages={k: round(v, 4) for k, v in self.stages.items()}, **self.fields)
+        return False
+
+
+_log_file = None
+_log_lock = threading.Lock()
+
+
+def log(event, **fields):
+    '''Строка структурного JSON-лога (если BOT_METRICS_LOG задан)'''
+    global _log_file
+    if not LOG_PATH:
+        return
+    line = json.dumps(dict(ts=round(time.time(), 3), event=event, **fields),
+                      ensure_ascii=False, default=str)
+    with _log_lock:
+        if _log_file is None:
+            _log_file = sys.stdout if LOG_PATH == '-' else open(LOG_PATH, 'a', buffering=1,
+                                                                 encoding='utf-8')
+        _log_file.write(line + '\n')
+
+
+def render():
+    '''Все метрики в текстовом формате Prometheus'''
+    lines = []
+    for metric in list(_registry):
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def start_server(port=PORT, host=HOST):
+    '''HTTP-эндпоинт /metrics в фоновом потоке; None, если порт не задан'''
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"📈 Метрики: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,258 @@
+'''Упреждающая загрузка статистики в общий кэш
+
+После викторины пользователь почти всегда ищет одну из рекомендованных
+профессий, поэтому их статистика грузится сразу, как только показан результат
+(город, опыт и удаленка — из настроек пользователя). Раз в PREFETCH_INTERVAL
+секунд то же делается для TOP_QUERIES самых частых запросов по городам
+VacancyStats.CITIES, чтобы они не выпадали из кэша. Пар запрос×город в раунде
+не больше, чем оправдала доля попаданий прошлого раунда: если предзагруженные
+популярные запросы никто не ищет, раунд сужается до самых частых пар.
+
+Упреждающая загрузка уступает пользователям: один фоновый поток, новая
+загрузка начинается только когда busy() ложно (нет активных поисков), а
+страницы грузятся через общий бюджет hh.ru процесса (hh_client.get_limiter)
+фоновыми запросами: слот достается им, только пока пользователи не ждут и в
+полете меньше доли PREFETCH_SHARE окна. Отдельного бюджета сверх HH_RATE нет.
+
+Отчет stats()/report(): доля поисков, попавших в кэш, и сколько времени
+загрузки сэкономила упреждающая загрузка.
+'''
+import math
+import os
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import hh_client
+
+# Сколько самых частых запросов держать в кэше и как часто их обновлять
+TOP_QUERIES = int(os.getenv('BOT_PREFETCH_TOP', '5'))
+PREFETCH_INTERVAL = float(os.getenv('BOT_PREFETCH_INTERVAL', '600'))
+
+# Какую долю окна общего бюджета hh.ru может занять упреждающая загрузка
+PREFETCH_SHARE = float(os.getenv('BOT_PREFETCH_SHARE', '0.25'))
+
+# Приоритеты очереди: рекомендации викторины раньше популярных запросов
+RECOMMENDED, POPULAR = 0, 1
+
+# Пауза перед повторной проверкой, пока бот занят пользователями
+IDLE_POLL = 0.2
+
+# Сколько предзагрузок популярных пар нужно, чтобы доверять их доле попаданий
+MIN_POPULAR_SAMPLE = 10
+
+# Сколько запросов помнить для подсчета популярности и экономии
+MAX_TRACKED = 10000
+
+
+class Prefetcher:
+    '''Фоновая загрузка статистики с низким приоритетом'''
+
+    def __init__(self, busy=lambda: False, client=None, top=TOP_QUERIES,
+                 interval=PREFETCH_INTERVAL, share=PREFETCH_SHARE):
+        self.busy = busy
+        self.top = top
+        self.interval = interval
+        self.share = share
+        self._client = client
+        self._queue = queue.PriorityQueue()
+        self._queued = set()  # ключи в очереди
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._popular = Counter()  # нормализованный запрос -> число поисков
+        self._pairs = Counter()  # (запрос, город) -> число поисков
+        self._popular_loaded = set()  # популярные пары, загруженные в этом раунде
+        self._popular_limit = None  # сколько пар ставить в раунд (None — все)
+        self._loaded = OrderedDict()  # ключ -> секунды загрузки (предзагружено, еще не найдено)
+        self._thread = None
+        self._stopped = threading.Event()
+
+        self.searches = 0
+        self.cache_hits = 0
+        self.prefetch_hits = 0
+        self.saved_seconds = 0.0
+        self.loads = 0
+        self.errors = 0
+        self.popular_loads = 0
+        self.popular_hits = 0
+
+    def start(self):
+        '''Запуск фонового потока (повторный вызов ничего не делает)'''
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        '''Остановка фонового потока после текущей загрузки'''
+        self._stopped.set()
+
+    def client(self):
+        '''Клиент hh.ru с фоновыми запросами в общем бюджете процесса, создается по требованию'''
+        if self._client is None:
+            self._client = hh_client.HHClient(limiter=hh_client.get_limiter(), share=self.share)
+        return self._client
+
+    def recommend(self, queries, filters):
+        '''Рекомендации викторины: загрузка в первую очередь (первая рекомендация — раньше всех)'''
+        for query in reversed(queries):
+            self._put(RECOMMENDED, query, filters)
+        self.start()
+
+    def _put(self, priority, query, filters):
+        # Без stats_advanced: рекомендации ставятся из обработчика, pandas может быть не загружен
+        key = (' '.join(query.lower().split()), tuple(sorted(filters.items())))
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+            self._seq += 1
+            # Рекомендации — от новых к старым: кто закончил викторину давно, уже ищет сам
+            order = -self._seq if priority == RECOMMENDED else self._seq
+            self._queue.put((priority, order, query, filters, key))
+
+    def note_search(self, query, filters):
+        '''Поиск пользователя: учет популярности и попаданий в кэш (вызывать до загрузки)'''
+        import stats_advanced
+        # Фильтры опыта и графика считаются по выдаче без них: смотрим ее ключ
+        key = stats_advanced.frame_key(stats_advanced.make_query_key(query, **filters))
+        hit = stats_advanced.RESULT_CACHE.expires_in(key) is not None
+        with self._lock:
+            self.searches += 1
+            # Популярность — по запросу без фильтров (и по паре с городом для порядка раунда)
+            self._popular[key[0]] += 1
+            self._pairs[key[:2]] += 1
+            if len(self._popular) > MAX_TRACKED:
+                self._popular = Counter(dict(self._popular.most_common(MAX_TRACKED // 2)))
+            if len(self._pairs) > MAX_TRACKED:
+                self._pairs = Counter(dict(self._pairs.most_common(MAX_TRACKED // 2)))
+            saved = self._loaded.pop(key, None)
+            if hit:
+                self.cache_hits += 1
+                if saved is not None:
+                    self.prefetch_hits += 1
+                    self.saved_seconds += saved
+                    if key in self._popular_loaded:
+                        self._popular_loaded.discard(key)
+                        self.popular_hits += 1
+
+    def popular(self, limit=None):
+        '''Самые частые запросы'''
+        with self._lock:
+            return [query for query, _ in self._popular.most_common(limit or self.top)]
+
+    def popular_limit(self, total):
+        '''Сколько из total популярных пар ставить в раунд по доле попаданий прошлых раундов'''
+        with self._lock:
+            loads, hits = self.popular_loads, self.popular_hits
+            if loads >= MIN_POPULAR_SAMPLE:
+                # Такая доля пар, какая в прошлых раундах дождалась поиска, но не меньше top
+                self._popular_limit = max(self.top, math.ceil(total * hits / loads))
+                self.popular_loads = self.popular_hits = 0
+                self._popular_loaded.clear()
+            return min(total, self._popular_limit or total)
+
+    def schedule_popular(self):
+        '''Популярные запросы по городам в очередь (без фильтров опыта и графика)
+
+        Пары запрос×город идут по числу поисков (при равенстве — по порядку
+        запросов и городов), и берется не больше popular_limit из них.
+        '''
+        queries = self.popular()
+        with self._lock:
+            pairs = sorted(((query, city_id) for query in queries for city_id in hh_client.CITIES),
+                           key=lambda pair: -self._pairs[pair])
+        for query, city_id in pairs[:self.popular_limit(len(pairs))]:
+            self._put(POPULAR, query, {'city_id': city_id})
+
+    def stats(self):
+        '''Счетчики для отчета'''
+        with self._lock:
+            return {
+                'searches': self.searches,
+                'cache_hits': self.cache_hits,
+                'hit_rate': self.cache_hits / self.searches if self.searches else 0.0,
+                'prefetch_hits': self.prefetch_hits,
+                'saved_seconds': round(self.saved_seconds, 2),
+                'prefetched': self.loads,
+                'errors': self.errors,
+                'popular_limit': self._popular_limit,
+                'queued': self._queue.qsize()
+            }
+
+    def report(self):
+        '''Строка отчета для лога'''
+        s = self.stats()
+        return (f"Кэш: {s['cache_hits']}/{s['searches']} поисков ({s['hit_rate']:.0%}), "
+                f"из них предзагружено {s['prefetch_hits']}, сэкономлено {s['saved_seconds']} с "
+                f"загрузки; предзагрузок: {s['prefetched']}")
+
+    def prefetch(self, query, filters, priority=RECOMMENDED):
+        '''Загрузка и агрегация одного запроса, если его нет в кэше или он скоро истечет'''
+        import stats_advanced
+        import vacancy_store
+        query_key = stats_advanced.make_query_key(query, **filters)
+        key = stats_advanced.frame_key(query_key)
+        left = stats_advanced.RESULT_CACHE.expires_in(key)
+        if left is not None and left > self.interval:
+            return False
+
+        client, store = self.client(), vacancy_store.get_store()
+        start = time.perf_counter()
+        if left is None:
+            # Как поиск пользователя: выдача без фильтров или, если она не поместится, с ними
+            df = stats_advanced.load_frame(query_key, client, store)
+            key = stats_advanced.frame_key(query_key)
+        else:
+            # Обновление до истечения: пользователи пока получают прежний кадр
+            df = stats_advanced.VacancyStats._load_frame(key, stats_advanced.key_params(key),
+                                                         client, store)
+            if stats_advanced.is_complete(df):
+                stats_advanced.RESULT_CACHE.put(key, df)
+            if key != query_key:
+                df = stats_advanced.filter_frame(df, query_key)
+        stats = stats_advanced.VacancyStats.from_frame(query, filters.get('city_id', 1), df,
+                                                       query_key)
+        stats.salary_summary()  # сводка для merged_summary (у кадра без фильтров уже есть)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.loads += 1
+            self._loaded[key] = elapsed
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > MAX_TRACKED:
+                self._loaded.popitem(last=False)
+            if priority == POPULAR:
+                self.popular_loads += 1
+                self._popular_loaded.add(key)
+        return True
+
+    def _run(self):
+        '''Фоновый поток: очередь загрузок и периодическое обновление популярных'''
+        next_round = time.monotonic() + self.interval
+        while not self._stopped.is_set():
+            if self.top and time.monotonic() >= next_round:
+                self.schedule_popular()
+                print(f"📈 {self.report()}")
+                next_round = time.monotonic() + self.interval
+
+            try:
+                item = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            # Пользователи важнее: ждем, пока их поиски закончатся
+            while self.busy() and not self._stopped.is_set():
+                time.sleep(IDLE_POLL)
+
+            priority, _, query, filters, key = item
+            try:
+                self.prefetch(query, filters, priority)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"Ошибка упреждающей загрузки «{query}»: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
@@ -1,4 +1,7 @@
 '''Модуль викторины для профориентации'''
+import threading
+
+import state_store
 
 # Вопросы викторины
 QUIZ_QUESTIONS = [
@@ -127,41 +130,127 @@ CAREER_PROFILES = {
 }
 
 
-def calculate_quiz_result(answers):
-    '''Подсчет результатов викторины'''
-    trait_scores = {}
-
-    # Подсчитываем баллы по каждой черте
-    for answer_idx in answers:
-        question_num = answers.index(answer_idx)
-        if question_num < len(QUIZ_QUESTIONS):
-            question = QUIZ_QUESTIONS[question_num]
-            if answer_idx < len(question['options']):
-                traits = question['options'][answer_idx]['traits']
-                for trait in traits:
-                    trait_scores[trait] = trait_scores.get(trait, 0) + 1
-
-    # Определяем доминирующий профиль
-    profile_scores = {
-        'technical': sum([trait_scores.get(t, 0) for t in ['technical', 'logical']]),
-        'analytical': sum([trait_scores.get(t, 0) for t in ['analytical', 'research', 'detail-oriented']]),
-        'creative': sum([trait_scores.get(t, 0) for t in ['creative', 'artistic', 'freedom']]),
-        'social': sum([trait_scores.get(t, 0) for t in ['social', 'communication', 'helping', 'leadership']]),
-        'balanced': sum([trait_scores.get(t, 0) for t in ['balanced', 'adaptable', 'flexible']])
-    }
+# Черты, из которых складывается балл профиля (порядок — приоритет при равенстве)
+PROFILE_TRAITS = {
+    'technical': ['technical', 'logical'],
+    'analytical': ['analytical', 'research', 'detail-oriented'],
+    'creative': ['creative', 'artistic', 'freedom'],
+    'social': ['social', 'communication', 'helping', 'leadership'],
+    'balanced': ['balanced', 'adaptable', 'flexible']
+}
 
-    # Находим профиль с максимальным баллом
-    max_profile = max(profile_scores, key=profile_scores.get)
 
-    # Если баллы равномерно распределены - универсал
-    if len(set(profile_scores.values())) <= 2:
-        max_profile = 'balanced'
+class QuizEngine:
+    '''Вопросы и профили, скомпилированные в матрицы NumPy
 
-    return {
-        'profile': max_profile,
-        'scores': profile_scores,
-        'trait_scores': trait_scores
-    }
+    option_traits[вопрос, вариант, черта] — сколько раз черта есть в варианте
+    (лишняя последняя строка вариантов нулевая: в нее попадают пропуски и
+    неверные номера), trait_profiles[черта, профиль] — входит ли черта в профиль.
+    Ответ i относится к вопросу i, баллы — сумма выбранных строк. Один набор
+    (score) считается теми же индексами в цикле: на нем NumPy дороже Python.
+    '''
+
+    def __init__(self, questions=QUIZ_QUESTIONS, profile_traits=PROFILE_TRAITS):
+        import numpy as np
+        self.profiles = list(profile_traits)
+        self.traits = list(dict.fromkeys(
+            trait for question in questions for option in question['options']
+            for trait in option['traits']))
+        trait_index = {trait: i for i, trait in enumerate(self.traits)}
+
+        self.questions = len(questions)
+        self.options = max(len(question['options']) for question in questions)
+        self.option_traits = np.zeros((self.questions, self.options + 1, len(self.traits)),
+                                      np.int32)
+        for q, question in enumerate(questions):
+            for o, option in enumerate(question['options']):
+                for trait in option['traits']:
+                    self.option_traits[q, o, trait_index[trait]] += 1
+        self.option_counts = np.array([len(question['options']) for question in questions])
+
+        self.trait_profiles = np.zeros((len(self.traits), len(self.profiles)), np.int32)
+        for p, traits in enumerate(profile_traits.values()):
+            for trait in traits:
+                if trait in trait_index:
+                    self.trait_profiles[trait_index[trait], p] = 1
+        self.balanced = self.profiles.index('balanced')
+
+        # Те же матрицы списками индексов для score
+        self.option_trait_ids = [[[trait_index[trait] for trait in option['traits']]
+                                  for option in question['options']] for question in questions]
+        self.profile_trait_ids = [self.trait_profiles[:, p].nonzero()[0].tolist()
+                                  for p in range(len(self.profiles))]
+
+    def answer_matrix(self, answer_sets):
+        '''Наборы ответов в матрицу n × вопросов; пропуски и неверные номера — нулевая строка'''
+        import numpy as np
+        answers = np.full((len(answer_sets), self.questions), self.options, np.intp)
+        for row, answer_set in enumerate(answer_sets):
+            answer_set = list(answer_set)[:self.questions]
+            answers[row, :len(answer_set)] = answer_set
+        invalid = (answers < 0) | (answers >= self.option_counts)
+        answers[invalid] = self.options
+        return answers
+
+    def score_batch(self, answer_sets):
+        '''Баллы многих наборов сразу: (черты n × черт, профили n × профилей, индексы профилей)'''
+        import numpy as np
+        answers = self.answer_matrix(answer_sets)
+        trait_scores = self.option_traits[np.arange(self.questions), answers].sum(axis=1)
+        profile_scores = trait_scores @ self.trait_profiles
+
+        best = profile_scores.argmax(axis=1)
+        # Если баллы равномерно распределены (не больше двух разных значений) - универсал
+        ordered = np.sort(profile_scores, axis=1)
+        distinct = 1 + (np.diff(ordered, axis=1) != 0).sum(axis=1)
+        best[distinct <= 2] = self.balanced
+        return trait_scores, profile_scores, best
+
+    def profile_counts(self, answer_sets):
+        '''Сколько наборов ответов дали каждый профиль (для аналитики)'''
+        import numpy as np
+        _, _, best = self.score_batch(answer_sets)
+        counts = np.bincount(best, minlength=len(self.profiles))
+        return dict(zip(self.profiles, counts.tolist()))
+
+    def score(self, answers):
+        '''Результат одного набора ответов (как строка score_batch)'''
+        trait_scores = [0] * len(self.traits)
+        for options, answer in zip(self.option_trait_ids, answers):
+            if 0 <= answer < len(options):
+                for trait in options[answer]:
+                    trait_scores[trait] += 1
+        profile_scores = [sum(trait_scores[trait] for trait in traits)
+                          for traits in self.profile_trait_ids]
+
+        best = profile_scores.index(max(profile_scores))
+        if len(set(profile_scores)) <= 2:
+            best = self.balanced
+        return {
+            'profile': self.profiles[best],
+            'scores': dict(zip(self.profiles, profile_scores)),
+            'trait_scores': {trait: count for trait, count
+                             in zip(self.traits, trait_scores) if count}
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    '''Скомпилированная викторина (NumPy грузится при первом подсчете или в фоновом прогреве)'''
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = QuizEngine()
+    return _engine
+
+
+def calculate_quiz_result(answers):
+    '''Подсчет результатов викторины: ответ i — на вопрос i'''
+    return get_engine().score(answers)
 
 
 def get_quiz_result_message(result):
@@ -182,25 +271,30 @@ def get_quiz_result_message(result):
 
 
 class QuizSession:
-    '''Класс для управления сессией викторины'''
+    '''Класс для управления сессией викторины (сессии — QuizProgress в state_store)'''
+
+    def __init__(self, state=None):
+        self._state = state
+
+    @property
+    def state(self):
+        '''Хранилище сессий: заданное или общее хранилище процесса'''
+        return self._state or state_store.get_state()
 
-    def __init__(self):
-        self.sessions = {}
+    def _session(self, user_id):
+        return self.state.get(state_store.QuizProgress, user_id)
 
     def start_quiz(self, user_id):
         '''Начало викторины'''
-        self.sessions[user_id] = {
-            'current_question': 0,
-            'answers': []
-        }
+        self.state.put(state_store.QuizProgress(), user_id)
 
     def get_current_question(self, user_id):
         '''Получение текущего вопроса'''
-        if user_id not in self.sessions:
+        session = self._session(user_id)
+        if session is None:
             return None
 
-        session = self.sessions[user_id]
-        question_num = session['current_question']
+        question_num = len(session.answers)
 
         if question_num >= len(QUIZ_QUESTIONS):
             return None
@@ -208,31 +302,36 @@ class QuizSession:
         return QUIZ_QUESTIONS[question_num]
 
     def add_answer(self, user_id, answer_idx):
-        '''Добавление ответа'''
-        if user_id not in self.sessions:
+        '''Добавление ответа; номер не из вариантов текущего вопроса не сохраняется'''
+        session = self._session(user_id)
+        if session is None or len(session.answers) >= len(QUIZ_QUESTIONS):
+            return False
+
+        question = QUIZ_QUESTIONS[len(session.answers)]
+        if not 0 <= answer_idx < len(question['options']):
             return False
 
-        self.sessions[user_id]['answers'].append(answer_idx)
-        self.sessions[user_id]['current_question'] += 1
+        session.answers += bytes([answer_idx])
+        self.state.put(session, user_id)
         return True
 
     def is_quiz_complete(self, user_id):
         '''Проверка завершения викторины'''
-        if user_id not in self.sessions:
+        session = self._session(user_id)
+        if session is None:
             return False
 
-        return self.sessions[user_id]['current_question'] >= len(QUIZ_QUESTIONS)
+        return len(session.answers) >= len(QUIZ_QUESTIONS)
 
     def get_result(self, user_id):
         '''Получение результата викторины'''
-        if user_id not in self.sessions:
+        session = self._session(user_id)
+        if session is None:
             return None
 
-        answers = self.sessions[user_id]['answers']
-        return calculate_quiz_result(answers)
+        return calculate_quiz_result(list(session.answers))
 
     def end_quiz(self, user_id):
         '''Завершение викторины'''
-        if user_id in self.sessions:
-            del self.sessions[user_id]
+        self.state.delete(state_store.QuizProgress, user_id)
 
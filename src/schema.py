@@ -0,0 +1,124 @@
+'''Компактное представление вакансий: только нужные поля и типизированные столбцы
+
+Выдача hh.ru содержит десятки вложенных полей (сниппеты, адреса, ссылки на
+логотипы), а статистике нужны зарплата, валюта, gross, работодатель, опыт и
+тип занятости, а фильтрам настроек — коды опыта и графика работы. Каждая
+вакансия сразу при разборе страницы проецируется в плоскую запись (project),
+а страницы записей складываются в столбцы с типами (FrameBuilder): float32
+для зарплат, int8-коды валют по converter.CURRENCIES, category для
+текстовых полей.
+'''
+import numpy as np
+import pandas as pd
+
+import converter
+
+# Поля записи: имя столбца -> путь во вложенном JSON вакансии
+FIELDS = {
+    'id': ('id',),
+    'published_at': ('published_at',),
+    'salary.from': ('salary', 'from'),
+    'salary.to': ('salary', 'to'),
+    'salary.currency': ('salary', 'currency'),
+    'salary.gross': ('salary', 'gross'),
+    'employer.name': ('employer', 'name'),
+    'experience.name': ('experience', 'name'),
+    'employment.name': ('employment', 'name'),
+    'experience.id': ('experience', 'id'),
+    'schedule.id': ('schedule', 'id'),
+    'archived': ('archived',),
+}
+
+# Столбцы кадра статистики (id, время публикации и archived нужны только хранилищу)
+SALARY_COLUMNS = ['salary.from', 'salary.to']
+CATEGORY_COLUMNS = ['employer.name', 'experience.name', 'employment.name',
+                    'experience.id', 'schedule.id']
+
+# Емкость буферов по умолчанию: полная выдача hh.ru (20 страниц по 100)
+DEFAULT_CAPACITY = 2000
+
+
+def _get(item, path):
+    '''Значение по пути во вложенных словарях; None, если его нет'''
+    for key in path:
+        if not isinstance(item, dict):
+            return None
+        item = item.get(key)
+    return item
+
+
+def project(item):
+    '''Плоская запись вакансии только с нужными полями'''
+    return {name: _get(item, path) for name, path in FIELDS.items()}
+
+
+class FrameBuilder:
+    '''Столбцы кадра статистики, заполняемые страницами записей
+
+    Буферы выделяются заранее (на полную выдачу hh.ru) и растут удвоением, если
+    записей больше, поэтому каждая запись копируется O(1) раз, а кадр строится
+    один раз в конце. Текстовые поля сразу кодируются в коды категорий.
+    '''
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.size = 0
+        self.columns = {
+            'salary.from': np.empty(capacity, np.float32),
+            'salary.to': np.empty(capacity, np.float32),
+            'salary.currency': np.empty(capacity, np.int8),
+            'salary.gross': np.empty(capacity, bool),
+        }
+        self.columns.update((name, np.empty(capacity, np.int32)) for name in CATEGORY_COLUMNS)
+        self.categories = {name: {} for name in CATEGORY_COLUMNS}  # значение -> код
+
+    def _reserve(self, count):
+        '''Место еще под count записей'''
+        capacity = len(self.columns['salary.from'])
+        if self.size + count <= capacity:
+            return
+        capacity = max(self.size + count, capacity * 2)
+        for name, buffer in self.columns.items():
+            grown = np.empty(capacity, buffer.dtype)
+            grown[:self.size] = buffer[:self.size]
+            self.columns[name] = grown
+
+    def add(self, records):
+        '''Добавление страницы записей project'''
+        count = len(records)
+        self._reserve(count)
+        rows = slice(self.size, self.size + count)
+
+        for name in SALARY_COLUMNS:
+            # None превращается в NaN
+            self.columns[name][rows] = [r[name] for r in records]
+        self.columns['salary.currency'][rows] = converter.currency_codes(
+            [r['salary.currency'] for r in records])
+        self.columns['salary.gross'][rows] = [r['salary.gross'] is True for r in records]
+        for name in CATEGORY_COLUMNS:
+            codes = self.categories[name]
+            self.columns[name][rows] = [
+                -1 if r[name] is None else codes.setdefault(r[name], len(codes))
+                for r in records]
+
+        self.size += count
+        return self
+
+    def frame(self):
+        '''Кадр из заполненной части буферов'''
+        columns = {name: buffer[:self.size].copy() for name, buffer in self.columns.items()}
+        for name in CATEGORY_COLUMNS:
+            columns[name] = pd.Categorical.from_codes(columns[name], list(self.categories[name]))
+        return pd.DataFrame(columns)
+
+
+def build_frame(pages, capacity=DEFAULT_CAPACITY):
+    '''Кадр статистики из потока страниц записей'''
+    builder = FrameBuilder(capacity)
+    for records in pages:
+        builder.add(records)
+    return builder.frame()
+
+
+def to_frame(records):
+    '''Кадр статистики из готового списка записей'''
+    return FrameBuilder(len(records)).add(records).frame()
@@ -0,0 +1,286 @@
+'''Состояние пользователей: настройки, диалог и викторина, переживающие перезапуск
+
+Записи — компактные объекты со __slots__; StateStore держит в памяти только
+ограниченный LRU горячих записей, а остальное — в бэкенде: SQLite (по
+умолчанию) или словаре в памяти (BOT_STATE_PATH=''). Изменения пишутся
+отложенно (write-behind): помеченные записи сбрасываются в бэкенд одной
+транзакцией раз в FLUSH_INTERVAL секунд или по накоплении FLUSH_BATCH штук.
+Заброшенные диалоги и викторины удаляются по TTL.
+'''
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Путь к базе; пустая строка — состояние только в памяти процесса
+STATE_PATH = os.getenv('BOT_STATE_PATH', 'bot_state.sqlite3')
+
+# Сколько записей держать в памяти (остальные читаются из базы)
+CACHE_SIZE = int(os.getenv('BOT_STATE_CACHE', '100000'))
+
+# Отложенная запись: не реже раза в FLUSH_INTERVAL секунд или по FLUSH_BATCH изменениям
+FLUSH_INTERVAL = float(os.getenv('BOT_STATE_FLUSH', '2'))
+FLUSH_BATCH = 1000
+
+# Удаление просроченных записей — не чаще раза в столько секунд
+SWEEP_INTERVAL = 60
+
+
+class Settings:
+    '''Настройки поиска пользователя'''
+
+    __slots__ = ('city_id', 'experience', 'remote_only', 'touched')
+    KIND = 'settings'
+    TTL = None  # настройки не истекают
+
+    def __init__(self, city_id=1, experience='all', remote_only=0, touched=0.0):
+        self.city_id = city_id
+        self.experience = experience
+        self.remote_only = remote_only
+        self.touched = touched
+
+    def dump(self):
+        return [self.city_id, self.experience, self.remote_only]
+
+    def copy(self):
+        return Settings(*self.dump(), touched=self.touched)
+
+
+class DialogState:
+    '''Состояние диалога: чего бот ждет от пользователя и его последний запрос'''
+
+    __slots__ = ('state', 'last_query', 'touched')
+    KIND = 'dialog'
+    TTL = int(os.getenv('BOT_DIALOG_TTL', '3600'))
+
+    def __init__(self, state=None, last_query=None, touched=0.0):
+        self.state = state
+        self.last_query = last_query
+        self.touched = touched
+
+    def dump(self):
+        return [self.state, self.last_query]
+
+
+class QuizProgress:
+    '''Ответы пройденных вопросов викторины (номер вопроса — их число)'''
+
+    __slots__ = ('answers', 'touched')
+    KIND = 'quiz'
+    TTL = int(os.getenv('BOT_QUIZ_TTL', '86400'))
+
+    def __init__(self, answers=b'', touched=0.0):
+        self.answers = bytes(answers)  # номера вариантов, по байту на вопрос
+        self.touched = touched
+
+    def dump(self):
+        return [list(self.answers)]
+
+
+RECORDS = {cls.KIND: cls for cls in (Settings, DialogState, QuizProgress)}
+
+
+class MemoryBackend:
+    '''Бэкенд в памяти процесса: записи в виде JSON-строк'''
+
+    def __init__(self):
+        self.rows = {}  # (kind, user_id) -> (touched, data)
+
+    def load(self, kind, user_id):
+        return self.rows.get((kind, user_id))
+
+    def save(self, changes):
+        '''changes: [(kind, user_id, touched, data или None для удаления)]'''
+        for kind, user_id, touched, data in changes:
+            if data is None:
+                self.rows.pop((kind, user_id), None)
+            else:
+                self.rows[(kind, user_id)] = (touched, data)
+
+    def expire(self, kind, cutoff):
+        for key in [k for k, (touched, _) in self.rows.items()
+                    if k[0] == kind and touched < cutoff]:
+            del self.rows[key]
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    '''Бэкенд в SQLite: одна таблица (kind, user_id) -> JSON'''
+
+    def __init__(self, path=STATE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS state (
+                kind TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                touched REAL NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (kind, user_id)
+            ) WITHOUT ROWID''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS state_touched ON state (kind, touched)')
+
+    def load(self, kind, user_id):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT touched, data FROM state WHERE kind = ? AND user_id = ?',
+                (kind, user_id)).fetchone()
+
+    def save(self, changes):
+        '''changes: [(kind, user_id, touched, data или None для удаления)]'''
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)',
+                [change for change in changes if change[3] is not None])
+            self.conn.executemany(
+                'DELETE FROM state WHERE kind = ? AND user_id = ?',
+                [change[:2] for change in changes if change[3] is None])
+
+    def expire(self, kind, cutoff):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM state WHERE kind = ? AND touched < ?', (kind, cutoff))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class StateStore:
+    '''Записи пользователей поверх бэкенда: LRU в памяти, отложенная запись, TTL'''
+
+    def __init__(self, backend, cache_size=CACHE_SIZE, flush_interval=FLUSH_INTERVAL,
+                 flush_batch=FLUSH_BATCH):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.flush_batch = flush_batch
+        self._cache = OrderedDict()  # (kind, user_id) -> запись или None (нет в бэкенде)
+        self._dirty = {}  # (kind, user_id) -> запись или None (удалить)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._last_sweep = time.time()
+        self._writer = threading.Thread(target=self._write_behind, args=(flush_interval,),
+                                        name='state-writer', daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def _expired(record, now):
+        return record.TTL is not None and record.touched + record.TTL < now
+
+    def get(self, cls, user_id):
+        '''Запись пользователя или None (в том числе, если она просрочена)'''
+        key = (cls.KIND, user_id)
+        with self._lock:
+            if key in self._dirty:
+                record = self._dirty[key]
+            elif key in self._cache:
+                self._cache.move_to_end(key)
+                record = self._cache[key]
+            else:
+                record = None
+                row = self.backend.load(*key)
+                if row is not None:
+                    record = cls(*json.loads(row[1]), touched=row[0])
+                self._remember(key, record)
+
+        if record is not None and self._expired(record, time.time()):
+            return None
+        return record
+
+    def put(self, record, user_id):
+        '''Сохранение записи (запись в бэкенд — отложенная)'''
+        record.touched = time.time()
+        self._change((record.KIND, user_id), record)
+
+    def delete(self, cls, user_id):
+        '''Удаление записи'''
+        self._change((cls.KIND, user_id), None)
+
+    def _change(self, key, record):
+        with self._lock:
+            self._dirty[key] = record
+            self._remember(key, record)
+            if len(self._dirty) >= self.flush_batch:
+                self._wake.set()
+
+    def _remember(self, key, record):
+        '''Запись в LRU (вызывать под блокировкой)'''
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def flush(self):
+        '''Запись накопленных изменений одной транзакцией'''
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return
+            changes = [(kind, user_id, record.touched if record else 0.0,
+                        json.dumps(record.dump(), ensure_ascii=False) if record else None)
+                       for (kind, user_id), record in dirty.items()]
+            try:
+                self.backend.save(changes)
+            except Exception as e:
+                print(f"Ошибка при сохранении состояния: {e}")
+                # Не теряем изменения: вернем те, что не перезаписаны новыми
+                with self._lock:
+                    for key, record in dirty.items():
+                        self._dirty.setdefault(key, record)
+
+    def sweep(self):
+        '''Удаление просроченных диалогов и викторин из памяти и бэкенда'''
+        now = time.time()
+        with self._lock:
+            for key in [k for k, r in self._cache.items()
+                        if r is not None and self._expired(r, now)]:
+                del self._cache[key]
+        for cls in RECORDS.values():
+            if cls.TTL is not None:
+                self.backend.expire(cls.KIND, now - cls.TTL)
+        self._last_sweep = now
+
+    def _write_behind(self, interval):
+        '''Фоновый поток отложенной записи'''
+        while not self._closed:
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.time() - self._last_sweep >= SWEEP_INTERVAL:
+                    self.sweep()
+            except Exception as e:
+                print(f"Ошибка фоновой записи состояния: {e}")
+
+    def close(self):
+        '''Запись оставшихся изменений и закрытие бэкенда'''
+        self._closed = True
+        self._wake.set()
+        self._writer.join(timeout=5)
+        self.flush()
+        self.backend.close()
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_state():
+    '''Общее хранилище состояния процесса'''
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                backend = SQLiteBackend(STATE_PATH) if STATE_PATH else MemoryBackend()
+                _state = StateStore(backend)
+                atexit.register(_state.close)
+    return _state
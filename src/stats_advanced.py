@@ -1,34 +1,250 @@
-import requests
+import contextvars
+import hashlib
+import io
+import itertools
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from time import sleep
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # Для работы без GUI
-import seaborn as sns
+import cache
+import charts
 import converter
+import dispatch
+import harvester
+import hh_client
+import metrics
+import schema
+import sketch
+import vacancy_store
 import numpy as np
 
-# Настройка стиля графиков
-sns.set(style='whitegrid', font_scale=1.2, palette='Set2')
-plt.rcParams['figure.figsize'] = (12, 7)
-plt.rcParams['font.sans-serif'] = ['DejaVu Sans', 'Arial Unicode MS', 'Helvetica']
-plt.rcParams['axes.unicode_minus'] = False
+# Общий кэш результатов поиска для всех пользователей
+RESULT_CACHE = metrics.watch_cache('result', cache.TTLCache(
+    ttl=int(os.getenv('HH_CACHE_TTL', '900')),
+    max_bytes=int(os.getenv('HH_CACHE_MB', '256')) * 2**20
+))
+
+
+# Сливаемые сводки зарплат по тем же ключам, что и кадры: живут дольше кадров
+# и занимают килобайты, из них собирается статистика по нескольким запросам.
+# Значение — (версия кадра, сводка): сводка по прежнему кадру ключа не отдается
+SUMMARY_CACHE = metrics.watch_cache(
+    'summary', cache.TTLCache(ttl=86400, max_bytes=16 * 2**20, sizeof=lambda e: e[1].nbytes))
+
+# Версии загруженных кадров (attrs['version']): новая у каждой загрузки
+_FRAME_VERSIONS = itertools.count(1)
+
+# Промежуточные итоги загрузки — не чаще раза в столько секунд (лимит правок в Telegram)
+PROGRESS_INTERVAL = float(os.getenv('BOT_PROGRESS_INTERVAL', '1.5'))
+
+# Готовые PNG по хэшу данных графика: одинаковый график не рисуется дважды
+CHART_CACHE = metrics.watch_cache('chart', cache.TTLCache(ttl=3600, max_bytes=64 * 2**20, sizeof=len))
+
+
+class Chart:
+    '''PNG-график в памяти и хэш данных, по которым он построен'''
+
+    def __init__(self, key, png, name='chart.png'):
+        self.key = key
+        self.png = png
+        self.name = name
+
+    def buffer(self):
+        '''Файлоподобный объект для send_photo'''
+        buf = io.BytesIO(self.png)
+        buf.name = self.name
+        return buf
+
+
+def chart_key(kind, *parts):
+    '''Хэш содержимого графика: тип, подписи и данные'''
+    digest = hashlib.sha1(kind.encode())
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def search_params(query, city_id=1, experience=None, remote_only=False):
+    '''Параметры запроса /vacancies по фильтрам'''
+    params = {
+        'area': city_id,
+        'text': query
+    }
+
+    if experience and experience != 'all':
+        params['experience'] = experience
+
+    if remote_only:
+        params['schedule'] = 'remote'
+
+    return params
+
+
+def store_key(client, key):
+    '''Ключ запроса в локальном хранилище (с адресом API, чтобы не смешивать стаб и hh.ru)'''
+    return json.dumps([client.base_url, *key], ensure_ascii=False)
+
+
+def is_complete(df):
+    '''Все ли страницы выдачи загрузились (неполные кадры не кэшируются)'''
+    return not df.attrs.get('missing_pages')
+
+
+def finish_frame(key, df, missing=None, truncated=0):
+    '''Отметки на только что загруженном кадре key: потерянные страницы, неполнота и версия
+
+    Сводка зарплат полного кадра сразу кладется в SUMMARY_CACHE (один раз
+    на загрузку, а не на каждый поиск) и заменяет сводку прежнего кадра.
+    '''
+    if missing:
+        df.attrs['missing_pages'] = len(missing)
+    if truncated:
+        df.attrs['truncated'] = truncated
+    df.attrs['version'] = next(_FRAME_VERSIONS)
+    if not missing:
+        VacancyStats.from_frame(key[0], key[1], df, key).salary_summary()
+    return df
+
+
+def make_query_key(query, city_id=1, experience=None, remote_only=False):
+    '''Нормализованный ключ запроса: (запрос, регион, опыт, график)'''
+    return (
+        ' '.join(query.lower().split()),
+        int(city_id),
+        experience if experience and experience != 'all' else None,
+        'remote' if remote_only else None
+    )
+
+
+def base_key(key):
+    '''Ключ выдачи без фильтров опыта и графика: с hh.ru грузится только она'''
+    return key[:2] + (None, None)
+
+
+def key_params(key):
+    '''Параметры запроса /vacancies по ключу make_query_key'''
+    return search_params(key[0], key[1], key[2], key[3] == 'remote')
+
+
+def is_truncated(df, key):
+    '''Нужен ли для фильтров key отдельный запрос: выдача без них загружена не целиком'''
+    return key != base_key(key) and df.attrs.get('truncated', 0) > 0
+
+
+def known_frame_key(key, client=None, store=None):
+    '''Ключ кадра для key, если выбрать его можно без запросов к hh.ru, иначе None
+
+    Выдача без фильтров выгодна, только если загружается целиком. Это видно
+    по кадру в RESULT_CACHE или по хранилищу (truncated последней полной
+    загрузки); кадр с фильтрами, загруженный своим запросом, тоже годится.
+    '''
+    base = base_key(key)
+    df = RESULT_CACHE.peek(base)
+    if df is not None:
+        return key if is_truncated(df, key) else base
+    if base == key or RESULT_CACHE.peek(key) is not None:
+        return key
+    if store is not None:
+        query_key = store_key(client, base)
+        if store.last_sync(query_key) is not None:
+            return key if store.truncated(query_key) else base
+        if store.last_sync(store_key(client, key)) is not None:
+            return key
+    return None
+
+
+def plan_frame(key, client, store):
+    '''Какой кадр грузить для key: (ключ, первая страница его выдачи или None)
+
+    Если по кэшу и хранилищу не понять, поместится ли выдача без фильтров,
+    решает found ее первой страницы: страница потом переиспользуется
+    загрузкой, а с перебором сразу грузится выдача с фильтрами.
+    '''
+    frame = known_frame_key(key, client, store)
+    if frame is not None:
+        return frame, None
+    base = base_key(key)
+    first = client.get_page(dict(key_params(base), per_page=hh_client.PER_PAGE), 0)
+    if harvester.fits(first.get('found', 0)):
+        return base, first
+    return key, None
+
+
+def frame_key(key):
+    '''Ключ RESULT_CACHE, под которым лежит (или, скорее всего, будет лежать) кадр для key'''
+    return known_frame_key(key) or base_key(key)
+
+
+def matches(record, key):
+    '''Подходит ли запись project под фильтры опыта и графика key'''
+    experience, schedule = key[2:]
+    return ((experience is None or record['experience.id'] == experience) and
+            (schedule is None or record['schedule.id'] == schedule))
+
+
+def filter_frame(df, key):
+    '''Кадр с фильтрами опыта и графика key из кадра без фильтров: маски по столбцам'''
+    experience, schedule = key[2:]
+    if (experience is None and schedule is None) or len(df) == 0:
+        return df
+
+    with metrics.stage('filter'):
+        mask = np.ones(len(df), bool)
+        for name, value in (('experience.id', experience), ('schedule.id', schedule)):
+            if value is not None:
+                mask &= (df[name] == value).to_numpy()
+        filtered = df[mask].reset_index(drop=True)
+        # Как у кадра, загруженного с фильтрами: без категорий, которых в нем нет
+        for name in schema.CATEGORY_COLUMNS:
+            filtered[name] = filtered[name].cat.remove_unused_categories()
+    return filtered
+
+
+def load_frame(key, client, store, progress=None):
+    '''Кадр по ключу запроса через RESULT_CACHE
+
+    С hh.ru грузится выдача без фильтров опыта и графика, а фильтры
+    применяются к ней масками (filter_frame), так что смена настроек не
+    требует новой загрузки. Если выдача без фильтров больше, чем можно
+    загрузить (см. harvester), кадр с фильтрами сразу грузится своим
+    запросом: так он полнее (см. plan_frame).
+    '''
+    frame, first = plan_frame(key, client, store)
+    if progress is not None and frame != key:
+        progress = FilteredProgress(progress, key)
+    df = RESULT_CACHE.get_or_load(
+        frame, shared_load(frame, lambda: VacancyStats._load_frame(
+            frame, key_params(frame), client, store, progress, first)),
+        keep=is_complete)
+    if frame == key:
+        return df
+    if not is_truncated(df, key):
+        return filter_frame(df, key)
+    # found обещал загрузку целиком, но окна по дате не вместили выдачу
+    return RESULT_CACHE.get_or_load(
+        key, shared_load(key, lambda: VacancyStats._load_frame(key, key_params(key), client,
+                                                               store)),
+        keep=is_complete)
+
+
+def shared_load(key, loader):
+    '''Загрузка для RESULT_CACHE; вытесненная задача бросает ее, если больше никто не ждет'''
+    def load():
+        with dispatch.shared(lambda: RESULT_CACHE.abandon(key)):
+            return loader()
+    return load
 
 
 class VacancyStats:
     '''Расширенная статистика по вакансиям'''
 
     # Словарь городов
-    CITIES = {
-        1: 'Москва',
-        2: 'Санкт-Петербург',
-        3: 'Екатеринбург',
-        4: 'Новосибирск',
-        88: 'Казань',
-        66: 'Нижний Новгород',
-        113: 'Россия'
-    }
+    CITIES = hh_client.CITIES
 
     # Опыт работы
     EXPERIENCE = {
@@ -38,256 +254,347 @@ class VacancyStats:
         'moreThan6': 'Более 6 лет'
     }
 
-    def __init__(self, query, city_id=1, experience=None, remote_only=False):
-        '''Инициализация с фильтрами'''
-        URL = 'https://api.hh.ru/vacancies'
-        params = {
-            'area': city_id,
-            'page': 0,
-            'per_page': 100,
-            'text': query
-        }
+    def __init__(self, query, city_id=1, experience=None, remote_only=False, client=None,
+                 store=None, progress=None):
+        '''Инициализация с фильтрами (progress — Progress для промежуточных итогов)'''
+        self._reset(query, city_id)
 
-        if experience and experience != 'all':
-            params['experience'] = experience
+        try:
+            client = client or hh_client.get_client()
+            store = store or vacancy_store.get_store()
+            key = self.key = make_query_key(query, city_id, experience, remote_only)
+            # Кадр общий с кэшем и не изменяется
+            self.df = load_frame(key, client, store, progress)
+
+        except dispatch.Cancelled:
+            raise
+        except Exception as e:
+            print(f"Ошибка при загрузке данных: {e}")
 
-        if remote_only:
-            params['schedule'] = 'remote'
+    @classmethod
+    def from_frame(cls, query, city_id, df, key=None):
+        '''Статистика по уже загруженному кадру вакансий (key — ключ кэша, если он есть)'''
+        stats = cls.__new__(cls)
+        stats._reset(query, city_id)
+        stats.df = df
+        stats.key = key
+        return stats
 
+    def _reset(self, query, city_id):
+        '''Начальное состояние объекта'''
         self.query = query
         self.city_id = city_id
         self.city_name = self.CITIES.get(city_id, 'Неизвестно')
         self.df = pd.DataFrame()
-
-        try:
-            req = requests.get(URL, params, timeout=10)
-            data = json.loads(req.content.decode())
-            pages = min(data.get('pages', 0), 20)  # Ограничим 20 страницами
-
-            for page in range(pages):
-                params['page'] = page
-                req = requests.get(URL, params, timeout=10)
-                data = json.loads(req.content.decode())
-                self.df = pd.concat([self.df, pd.json_normalize(
-                    data['items'])], ignore_index=True)
-                sleep(0.5)  # Чтобы не нагружать API
-
-        except Exception as e:
-            print(f"Ошибка при загрузке данных: {e}")
+        self.salary_df = None  # очищенные данные по зарплатам, считаются один раз
+        self.key = None
+        self._memo = {}
+
+    @staticmethod
+    @metrics.timed('load')
+    def _load_frame(key, params, client, store, progress=None, first=None):
+        '''Загрузка вакансий: через локальное хранилище, если оно включено
+
+        first — уже загруженная первая страница выдачи (см. plan_frame).
+        '''
+        on_page = progress.add if progress is not None else None
+        missing = []
+        # Выдача больше 2000 вакансий грузится окнами по дате (harvester)
+        source = harvester.Harvester(client)
+        if store is None:
+            pages = source.iter_pages(params, project=schema.project, missing=missing,
+                                      first=first)
+            if on_page is not None:
+                pages = _watch(pages, on_page)
+        else:
+            pages = store.sync(store_key(client, key), params, source, project=schema.project,
+                               on_page=on_page, missing=missing, first=first)
+        df = schema.build_frame(pages)
+        truncated = source.truncated if store is None else store.truncated(store_key(client, key))
+        return finish_frame(key, df, missing, truncated)
+
+    @property
+    def missing_pages(self):
+        '''Сколько страниц выдачи не загрузилось (статистика по остальным)'''
+        return self.df.attrs.get('missing_pages', 0)
+
+    @property
+    def truncated(self):
+        '''Сколько вакансий выдачи не поместилось в окна harvester (статистика без них)'''
+        return self.df.attrs.get('truncated', 0)
+
+    def _memoize(self, key, compute):
+        '''Производный агрегат, посчитанный не больше одного раза'''
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
 
     def prepare_salary_data(self):
-        '''Подготовка данных по зарплатам'''
-        if len(self.df) == 0:
-            return False
-
-        # Рассчитываем среднюю зарплату
-        self.df['salary'] = (self.df['salary.from'].fillna(0) +
-                            self.df['salary.to'].fillna(0)) / 2
-
-        # Если одно из значений 0, берем другое
-        self.df.loc[self.df['salary.from'].isna() & self.df['salary.to'].notna(), 'salary'] = \
-            self.df['salary.to']
-        self.df.loc[self.df['salary.to'].isna() & self.df['salary.from'].notna(), 'salary'] = \
-            self.df['salary.from']
-
-        # Конвертируем в рубли
-        self.df['salary'] = self.df.apply(converter.convert_to_rub, axis=1)
-        self.df['salary'] = self.df.apply(converter.convert_to_net, axis=1)
-
-        # Фильтруем разумные значения
-        self.df = self.df[self.df['salary'] > 0]
-        self.df = self.df[self.df['salary'] < 1000000]  # Убираем явные выбросы
-
-        return len(self.df) > 0
+        '''Подготовка данных по зарплатам (повторные вызовы ничего не пересчитывают)'''
+        if self.salary_df is None:
+            with metrics.stage('salary_prep'):
+                self.salary_df = self._clean_salaries()
+        return len(self.salary_df) > 0
+
+    def _clean_salaries(self):
+        '''Отдельный кадр с зарплатой в рублях «на руки» и нужными для статистики столбцами'''
+        if 'salary.from' not in self.df.columns:
+            return pd.DataFrame({'employer.name': [], 'salary': []})
+
+        # Середина вилки, перевод в рубли и «на руки» — целыми столбцами
+        salary = converter.salary_midpoint(self.df['salary.from'], self.df['salary.to'])
+        salary = converter.to_rub(salary, self.df['salary.currency'].to_numpy())
+        salary = converter.to_net(salary, self.df['salary.gross'])
+
+        # Фильтруем разумные значения и убираем явные выбросы
+        mask = (salary > 0) & (salary < 1000000)
+        return pd.DataFrame({
+            'employer.name': self.df['employer.name'].array[mask],
+            'salary': salary[mask]
+        })
 
     def get_basic_stats(self):
         '''Базовая статистика по зарплатам'''
         if not self.prepare_salary_data():
             return None
 
-        stats = {
-            'count': len(self.df),
-            'mean': int(self.df['salary'].mean()),
-            'median': int(self.df['salary'].median()),
-            'min': int(self.df['salary'].min()),
-            'max': int(self.df['salary'].max()),
-            'std': int(self.df['salary'].std()),
-            'percentile_25': int(self.df['salary'].quantile(0.25)),
-            'percentile_75': int(self.df['salary'].quantile(0.75))
-        }
-        return stats
+        @metrics.timed('basic_stats')
+        def compute():
+            salary = self.salary_df['salary']
+            p25, median, p75 = salary.quantile([0.25, 0.5, 0.75])
+            return {
+                'count': len(salary),
+                'mean': int(salary.mean()),
+                'median': int(median),
+                'min': int(salary.min()),
+                'max': int(salary.max()),
+                'std': int(salary.std()) if len(salary) > 1 else 0,
+                'percentile_25': int(p25),
+                'percentile_75': int(p75)
+            }
+
+        return dict(self._memoize('basic_stats', compute))
+
+    def salary_summary(self):
+        '''Сливаемая сводка зарплат (sketch.SalarySummary), хранится в SUMMARY_CACHE
+
+        Сводка из кэша берется, только если посчитана по этой же загрузке
+        кадра (attrs['version']), иначе пересчитывается и заменяет ее.
+        '''
+        def compute():
+            self.prepare_salary_data()
+            return sketch.SalarySummary.from_salaries(self.salary_df['salary'].to_numpy())
+
+        version = self.df.attrs.get('version')
+        if self.key is None or version is None or len(self.df) == 0 or self.missing_pages:
+            return self._memoize('summary', compute)
+        cached = SUMMARY_CACHE.get(self.key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        summary = self._memoize('summary', compute)
+        SUMMARY_CACHE.put(self.key, (version, summary))
+        return summary
 
     def get_top_employers(self, limit=5):
         '''Топ работодателей по количеству вакансий'''
         if len(self.df) == 0:
             return []
 
-        employers = self.df['employer.name'].value_counts().head(limit)
-        return [(name, count) for name, count in employers.items()]
+        employers = self._memoize('employer_counts',
+                                  lambda: self.df['employer.name'].value_counts())
+        return [(name, count) for name, count in employers.head(limit).items()]
 
     def get_top_paid_employers(self, limit=5):
         '''Топ работодателей по зарплате'''
         if not self.prepare_salary_data():
             return []
 
-        avg_salary = self.df.groupby('employer.name')['salary'].mean()
-        top_employers = avg_salary.nlargest(limit)
-        return [(name, int(salary)) for name, salary in top_employers.items()]
+        avg_salary = self._memoize(
+            'employer_salary',
+            lambda: self.salary_df.groupby('employer.name', observed=True)['salary'].mean()
+                                  .sort_values(ascending=False, kind='stable'))
+        return [(name, int(salary)) for name, salary in avg_salary.head(limit).items()]
 
     def get_experience_distribution(self):
         '''Распределение по опыту работы'''
         if 'experience.name' not in self.df.columns:
             return {}
 
-        exp_dist = self.df['experience.name'].value_counts().to_dict()
-        return exp_dist
+        return dict(self._memoize(
+            'experience', lambda: self.df['experience.name'].value_counts().to_dict()))
 
     def get_employment_type_distribution(self):
         '''Распределение по типу занятости'''
         if 'employment.name' not in self.df.columns:
             return {}
 
-        emp_dist = self.df['employment.name'].value_counts().to_dict()
-        return emp_dist
+        return dict(self._memoize(
+            'employment', lambda: self.df['employment.name'].value_counts().to_dict()))
 
-    def create_salary_histogram(self, filename='salaries.png'):
-        '''Создание гистограммы зарплат'''
+    def create_salary_histogram(self, render=None):
+        '''Гистограмма зарплат (render — где рисовать, например пул процессов)'''
         if not self.prepare_salary_data():
-            return False
+            return None
 
-        fig, ax = plt.subplots(figsize=(12, 7))
+        stats = self.get_basic_stats()
+        args = (self.salary_df['salary'].to_numpy(), self.query, self.city_name,
+                stats['median'], stats['mean'])
+        key = chart_key('histogram', *args)
+        png = CHART_CACHE.get_or_load(key, lambda: _render(render, charts.salary_histogram, *args))
+        return Chart(key, png, 'salaries.png')
 
-        # Гистограмма
-        ax.hist(self.df['salary'], bins=30, color='#3498db', alpha=0.7, edgecolor='black')
+    def create_detailed_report(self, render=None):
+        '''Создание детального отчета с несколькими графиками'''
+        if not self.prepare_salary_data():
+            return None
 
-        # Линии для медианы и среднего
-        median = self.df['salary'].median()
-        mean = self.df['salary'].mean()
+        args = (self.salary_df['salary'].to_numpy(), self.get_basic_stats()['median'],
+                self.get_top_employers(10), self.get_experience_distribution(),
+                self.get_employment_type_distribution(), self.query, self.city_name)
+        key = chart_key('report', *args)
+        png = CHART_CACHE.get_or_load(key, lambda: _render(render, charts.detailed_report, *args))
+        return Chart(key, png, 'report.png')
 
-        ax.axvline(median, color='red', linestyle='--', linewidth=2, label=f'Медиана: {int(median):,} ₽')
-        ax.axvline(mean, color='green', linestyle='--', linewidth=2, label=f'Среднее: {int(mean):,} ₽')
+    def create_comparison_chart(self, other_stats_list, render=None):
+        '''Создание сравнительного графика для нескольких профессий'''
+        return Comparison([self] + list(other_stats_list)).create_chart(render)
+
+
+class Comparison:
+    '''Сравнение профессий: медианы, средние и число вакансий одной группировкой
+
+    Зарплаты всех профессий складываются в один кадр с номером профессии
+    (номер, а не название: одинаковые запросы остаются отдельными), и все
+    агрегаты считаются одним groupby. Из результата строятся и график, и текст.
+    '''
+
+    @metrics.timed('comparison')
+    def __init__(self, all_stats):
+        self.queries = [stats.query for stats in all_stats]
+        salaries = []
+        for stats in all_stats:
+            stats.prepare_salary_data()
+            salaries.append(stats.salary_df['salary'].to_numpy(np.float64))
+
+        frame = pd.DataFrame({
+            'profession': np.repeat(np.arange(len(salaries)), [len(s) for s in salaries]),
+            'salary': np.concatenate(salaries) if salaries else np.empty(0)
+        })
+        # Профессии без зарплат остаются в результате с нулями
+        self.summary = (frame.groupby('profession')['salary'].agg(['median', 'mean', 'count'])
+                             .reindex(range(len(self.queries)), fill_value=0))
+
+    def rows(self):
+        '''(профессия, медиана, среднее, вакансий) для профессий с зарплатами'''
+        rows = zip(self.queries, self.summary['median'], self.summary['mean'],
+                   self.summary['count'])
+        return [(query, int(median), int(mean), int(count))
+                for query, median, mean, count in rows if count > 0]
+
+    def create_chart(self, render=None):
+        '''Сравнительный график медиан и средних'''
+        medians = [int(v) for v in self.summary['median']]
+        means = [int(v) for v in self.summary['mean']]
+        professions = self.queries
+        key = chart_key('comparison', professions, medians, means)
+        png = CHART_CACHE.get_or_load(
+            key, lambda: _render(render, charts.comparison_chart, professions, medians, means))
+        return Chart(key, png, 'comparison.png')
+
+
+def merged_summary(queries, city_ids=None, experience=None, remote_only=False):
+    '''Сводка зарплат по нескольким запросам и городам из SUMMARY_CACHE
+
+    Например, merged_summary(['python'], city_ids=[1, 2, 3]) — по трем
+    городам, без загрузки вакансий. Если кадр сочетания еще в RESULT_CACHE,
+    сводка сверяется с ним (и пересчитывается после обновления кадра), иначе
+    берется сохраненная. Сочетания без того и другого пропускаются; второй
+    элемент результата — сколько сводок слито.
+    '''
+    summaries = []
+    for query in queries:
+        for city_id in city_ids or [1]:
+            key = make_query_key(query, city_id, experience, remote_only)
+            frame = frame_key(key)
+            df = RESULT_CACHE.peek(frame)
+            if df is not None:
+                if frame != key:
+                    df = filter_frame(df, key)
+                summaries.append(VacancyStats.from_frame(query, city_id, df, key).salary_summary())
+                continue
+            cached = SUMMARY_CACHE.get(key)
+            if cached is not None:
+                summaries.append(cached[1])
+    return sketch.SalarySummary.merged(summaries), len(summaries)
+
+
+def load_comparison(queries, **filters):
+    '''Статистика по нескольким профессиям, загружаемым одновременно'''
+    # Копия контекста на каждую профессию: загрузки попадают в разбивку сравнения
+    jobs = [(contextvars.copy_context(), query) for query in queries]
+    with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix='compare') as pool:
+        return list(pool.map(lambda job: job[0].run(VacancyStats, job[1], **filters), jobs))
+
+
+class Progress:
+    '''Промежуточная статистика по уже загруженным страницам
+
+    Страницы копятся в отдельном FrameBuilder; callback получает VacancyStats
+    по загруженной части не чаще раза в interval секунд (первый раз — сразу
+    после первой страницы) и может вернуть корутину, которую дождется
+    асинхронный загрузчик. Ошибки callback не прерывают загрузку.
+    '''
+
+    def __init__(self, query, city_id, callback, interval=PROGRESS_INTERVAL):
+        self.query = query
+        self.city_id = city_id
+        self.callback = callback
+        self.interval = interval
+        self.builder = schema.FrameBuilder()
+        self.updated = None
+
+    def add(self, records):
+        '''Новая страница записей; результат callback, если пора показать итоги'''
+        self.builder.add(records)
+        now = time.monotonic()
+        if self.updated is not None and now - self.updated < self.interval:
+            return None
+        self.updated = now
+        try:
+            return self.callback(VacancyStats.from_frame(self.query, self.city_id,
+                                                         self.builder.frame()))
+        except Exception as e:
+            print(f"Ошибка при отправке промежуточных итогов: {e}")
 
-        ax.set_xlabel('Заработная плата (₽)', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Количество вакансий', fontsize=12, fontweight='bold')
-        ax.set_title(f'Распределение зарплат: {self.query}\n{self.city_name}',
-                    fontsize=14, fontweight='bold')
-        ax.legend(fontsize=11)
-        ax.grid(True, alpha=0.3)
 
-        # Форматирование оси X
-        ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x/1000)}k'))
+class FilteredProgress:
+    '''Progress, получающий только записи под фильтры key (выдача грузится без фильтров)'''
 
-        plt.tight_layout()
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close()
-        return True
+    def __init__(self, progress, key):
+        self.progress = progress
+        self.key = key
 
-    def create_detailed_report(self, filename='report.png'):
-        '''Создание детального отчета с несколькими графиками'''
-        if not self.prepare_salary_data():
-            return False
-
-        fig = plt.figure(figsize=(16, 10))
-
-        # 1. Гистограмма зарплат
-        ax1 = plt.subplot(2, 3, 1)
-        ax1.hist(self.df['salary'], bins=25, color='#3498db', alpha=0.7, edgecolor='black')
-        ax1.axvline(self.df['salary'].median(), color='red', linestyle='--', linewidth=2)
-        ax1.set_xlabel('Зарплата (₽)')
-        ax1.set_ylabel('Количество')
-        ax1.set_title('Распределение зарплат')
-        ax1.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x/1000)}k'))
-
-        # 2. Топ работодателей
-        ax2 = plt.subplot(2, 3, 2)
-        top_emp = self.get_top_employers(10)
-        if top_emp:
-            names, counts = zip(*top_emp)
-            ax2.barh(range(len(names)), counts, color='#2ecc71')
-            ax2.set_yticks(range(len(names)))
-            ax2.set_yticklabels([n[:25] + '...' if len(n) > 25 else n for n in names], fontsize=9)
-            ax2.set_xlabel('Количество вакансий')
-            ax2.set_title('Топ работодателей')
-            ax2.invert_yaxis()
-
-        # 3. Опыт работы
-        ax3 = plt.subplot(2, 3, 3)
-        exp_dist = self.get_experience_distribution()
-        if exp_dist:
-            colors = ['#e74c3c', '#f39c12', '#3498db', '#9b59b6']
-            ax3.pie(exp_dist.values(), labels=exp_dist.keys(), autopct='%1.1f%%',
-                   colors=colors, startangle=90)
-            ax3.set_title('Распределение по опыту')
-
-        # 4. Тип занятости
-        ax4 = plt.subplot(2, 3, 4)
-        emp_dist = self.get_employment_type_distribution()
-        if emp_dist:
-            ax4.bar(range(len(emp_dist)), emp_dist.values(), color='#1abc9c')
-            ax4.set_xticks(range(len(emp_dist)))
-            ax4.set_xticklabels(emp_dist.keys(), rotation=45, ha='right', fontsize=9)
-            ax4.set_ylabel('Количество')
-            ax4.set_title('Тип занятости')
-
-        # 5. Box plot зарплат
-        ax5 = plt.subplot(2, 3, 5)
-        ax5.boxplot(self.df['salary'], vert=True)
-        ax5.set_ylabel('Зарплата (₽)')
-        ax5.set_title('Статистика зарплат')
-        ax5.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x/1000)}k'))
-
-        plt.suptitle(f'Детальный анализ: {self.query} | {self.city_name}',
-                    fontsize=16, fontweight='bold', y=0.995)
-        plt.tight_layout()
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close()
-        return True
-
-    def create_comparison_chart(self, other_stats_list, filename='comparison.png'):
-        '''Создание сравнительного графика для нескольких профессий'''
-        fig, ax = plt.subplots(figsize=(14, 8))
-
-        professions = [self.query] + [s.query for s in other_stats_list]
-        medians = []
-        means = []
-
-        # Собираем статистику
-        all_stats = [self] + other_stats_list
-        for stat in all_stats:
-            if stat.prepare_salary_data():
-                medians.append(stat.df['salary'].median())
-                means.append(stat.df['salary'].mean())
-            else:
-                medians.append(0)
-                means.append(0)
-
-        x = np.arange(len(professions))
-        width = 0.35
-
-        bars1 = ax.bar(x - width/2, medians, width, label='Медиана', color='#3498db')
-        bars2 = ax.bar(x + width/2, means, width, label='Среднее', color='#2ecc71')
-
-        ax.set_xlabel('Профессия', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Зарплата (₽)', fontsize=12, fontweight='bold')
-        ax.set_title('Сравнение зарплат по профессиям', fontsize=14, fontweight='bold')
-        ax.set_xticks(x)
-        ax.set_xticklabels(professions, rotation=15, ha='right')
-        ax.legend()
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x/1000)}k'))
-
-        # Добавляем значения на столбцы
-        for bars in [bars1, bars2]:
-            for bar in bars:
-                height = bar.get_height()
-                if height > 0:
-                    ax.text(bar.get_x() + bar.get_width()/2., height,
-                           f'{int(height/1000)}k',
-                           ha='center', va='bottom', fontsize=9)
-
-        plt.tight_layout()
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close()
-        return True
+    def add(self, records):
+        records = [r for r in records if matches(r, self.key)]
+        return self.progress.add(records) if records else None
+
+
+def _watch(pages, on_page):
+    '''Поток страниц, о каждой из которых сообщается on_page'''
+    for records in pages:
+        on_page(records)
+        yield records
+
+
+def _render_inline(plot, *args):
+    '''Отрисовка графика в текущем потоке'''
+    return plot(*args)
+
+
+def _render(render, plot, *args):
+    '''Отрисовка графика (render или в текущем потоке) с замером'''
+    with metrics.stage('chart_render'):
+        return (render or _render_inline)(plot, *args)
 
 
 def format_stats_message(stats_obj):
@@ -309,6 +616,14 @@ def format_stats_message(stats_obj):
     msg += f"  • 25% перцентиль: {stats['percentile_25']:,} ₽\n"
     msg += f"  • 75% перцентиль: {stats['percentile_75']:,} ₽\n\n"
 
+    if stats_obj.missing_pages:
+        msg += f"⚠️ <i>hh.ru не отдал страниц выдачи: {stats_obj.missing_pages}, "
+        msg += "статистика по остальным</i>\n\n"
+
+    if stats_obj.truncated:
+        msg += f"⚠️ <i>hh.ru нашел больше вакансий, чем отдает: загружено {len(stats_obj.df)}, "
+        msg += f"еще ~{stats_obj.truncated} не вошли в статистику</i>\n\n"
+
     # Топ работодателей по зарплате
     top_paid = stats_obj.get_top_paid_employers(5)
     if top_paid:
@@ -319,3 +634,17 @@ def format_stats_message(stats_obj):
 
     return msg
 
+
+def format_progress_message(stats_obj):
+    '''Предварительная статистика по уже загруженной части вакансий'''
+    msg = f"🔍 Ищу вакансии: <b>{stats_obj.query}</b>...\n\n"
+    stats = stats_obj.get_basic_stats()
+    if not stats:
+        return msg + f"Загружено вакансий: {len(stats_obj.df)}, с зарплатой пока нет"
+
+    msg += f"⏳ <i>Предварительно: загружено {len(stats_obj.df)} вакансий, "
+    msg += f"с зарплатой {stats['count']}</i>\n"
+    msg += f"  • Медиана: ~{stats['median']:,} ₽\n"
+    msg += f"  • 25–75% перцентили: ~{stats['percentile_25']:,} – {stats['percentile_75']:,} ₽\n"
+    return msg
+
@@ -0,0 +1,311 @@
+'''Локальное хранилище вакансий в SQLite с инкрементальным обновлением
+
+Базу могут открывать сразу несколько процессов (main_webhook). Загрузку
+запроса из hh.ru один из них отмечает в таблице claims, а остальные ждут
+ее конца и берут вакансии из базы, так что одна и та же выдача грузится один
+раз на все процессы.
+'''
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# Путь к базе; пустая строка отключает хранилище
+STORE_PATH = os.getenv('HH_STORE_PATH', 'vacancies.sqlite3')
+
+# Не чаще одного обновления запроса за этот интервал (секунды)
+REFRESH_INTERVAL = int(os.getenv('HH_STORE_REFRESH', '300'))
+
+# Не реже этого интервала запрос загружается целиком, а не догружается с date_from:
+# закрытые и архивные вакансии пропадают из выдачи, и только полная загрузка их убирает
+FULL_REFRESH_INTERVAL = int(os.getenv('HH_STORE_FULL_REFRESH', '3600'))
+
+# Вакансии старше этого срока удаляются (hh.ru ищет за последние 30 дней)
+RETENTION_DAYS = 30
+
+# Сколько ждать загрузку запроса другим процессом (секунды); дольше — отметка считается
+# брошенной (процесс упал), и запрос загружается заново
+CLAIM_TIMEOUT = float(os.getenv('HH_STORE_CLAIM_TIMEOUT', '60'))
+
+# Пауза между проверками, закончилась ли чужая загрузка
+CLAIM_POLL = 0.05
+
+# Запас по времени для date_from: вакансии появляются в поиске с задержкой
+SYNC_OVERLAP = timedelta(minutes=10)
+
+# Версия формата записей (PRAGMA user_version): при смене база заполняется заново
+SCHEMA_VERSION = 4
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS vacancies (
+    query_key TEXT NOT NULL,
+    id TEXT NOT NULL,
+    published_ts REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (query_key, id)
+);
+CREATE TABLE IF NOT EXISTS syncs (
+    query_key TEXT PRIMARY KEY,
+    synced_at TEXT NOT NULL,
+    synced_ts REAL NOT NULL,
+    truncated INTEGER NOT NULL DEFAULT 0,
+    full_ts REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS claims (
+    query_key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    claimed_ts REAL NOT NULL
+);
+'''
+
+
+def parse_published(value):
+    '''Время публикации hh.ru (2024-01-31T12:00:00+0300) в секундах epoch'''
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z').timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class SyncPlan:
+    '''Синхронизация запроса между VacancyStore.plan_sync и commit_sync
+
+    params — что загрузить из API (None — данные свежие, загружать нечего),
+    synced_at — время, которым будет отмечена синхронизация, owner — отметка
+    загрузки в claims (None — загрузку никто не отмечал).
+    '''
+
+    def __init__(self, query_key, params, synced_at, owner=None):
+        self.query_key = query_key
+        self.params = params
+        self.synced_at = synced_at
+        self.owner = owner
+
+    @property
+    def full(self):
+        '''Полная ли загрузка, а не догрузка новых вакансий с date_from
+
+        При догрузке в страницах только новые вакансии: итоги по ним одним были
+        бы неверны, а уже загруженная первая страница params не годится.
+        '''
+        return self.params is not None and 'date_from' not in self.params
+
+
+class VacancyStore:
+    '''Вакансии по запросам, переживающие перезапуск бота'''
+
+    def __init__(self, path=STORE_PATH, refresh_interval=REFRESH_INTERVAL,
+                 retention_days=RETENTION_DAYS, full_refresh_interval=FULL_REFRESH_INTERVAL,
+                 claim_timeout=CLAIM_TIMEOUT):
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.claim_timeout = claim_timeout
+        self.retention = retention_days * 86400
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._migrate()
+
+    def _migrate(self):
+        '''Создание таблиц; записи старого формата удаляются (это лишь копия выдачи hh.ru)
+
+        Одной транзакцией BEGIN IMMEDIATE: базу могут открывать сразу несколько
+        процессов (main_webhook), и проверка версии не должна перемежаться с
+        чужим пересозданием таблиц.
+        '''
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+                if version != SCHEMA_VERSION:
+                    self.conn.execute('DROP TABLE IF EXISTS vacancies')
+                    self.conn.execute('DROP TABLE IF EXISTS syncs')
+                    self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                for statement in SCHEMA.split(';'):
+                    if statement.strip():
+                        self.conn.execute(statement)
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def last_sync(self, query_key):
+        '''Последняя синхронизация запроса: (ISO-строка, epoch, epoch полной загрузки) или None'''
+        with self.lock:
+            return self.conn.execute(
+                'SELECT synced_at, synced_ts, full_ts FROM syncs WHERE query_key = ?',
+                (query_key,)).fetchone()
+
+    def truncated(self, query_key):
+        '''Сколько вакансий запроса осталось за пределом последней полной загрузки'''
+        with self.lock:
+            row = self.conn.execute('SELECT truncated FROM syncs WHERE query_key = ?',
+                                    (query_key,)).fetchone()
+        return row[0] if row else 0
+
+    def iter_load(self, query_key, batch=100):
+        '''Сохраненные вакансии запроса пачками: в памяти JSON-строки и одна разобранная пачка'''
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT payload FROM vacancies WHERE query_key = ? ORDER BY published_ts DESC',
+                (query_key,)).fetchall()
+        for start in range(0, len(rows), batch):
+            yield [json.loads(payload) for payload, in rows[start:start + batch]]
+
+    def load(self, query_key):
+        '''Все сохраненные вакансии запроса'''
+        return [item for items in self.iter_load(query_key) for item in items]
+
+    def merge(self, query_key, items, synced_at, truncated=None, replace=False):
+        '''Слияние вакансий по id и отметка о синхронизации (synced_at=None — без отметки)
+
+        truncated — сколько вакансий полной загрузки не поместилось (см.
+        harvester); None — как было (догрузка новых вакансий). replace —
+        items и есть вся выдача (полная загрузка без потерь): вакансии, которых
+        в ней нет, закрыты и удаляются. Архивные (archived) удаляются всегда.
+        '''
+        archived = [(query_key, item['id']) for item in items if item.get('archived')]
+        rows = [(query_key, item['id'], parse_published(item.get('published_at')),
+                 json.dumps(item, ensure_ascii=False))
+                for item in items if not item.get('archived')]
+        cutoff = time.time() - self.retention
+        with self.lock, self.conn:
+            if replace:
+                self.conn.execute('DELETE FROM vacancies WHERE query_key = ?', (query_key,))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO vacancies VALUES (?, ?, ?, ?)', rows)
+            self.conn.executemany(
+                'DELETE FROM vacancies WHERE query_key = ? AND id = ?', archived)
+            self.conn.execute(
+                'DELETE FROM vacancies WHERE query_key = ? AND published_ts < ?',
+                (query_key, cutoff))
+            if synced_at is not None:
+                full_ts = synced_at.timestamp() if replace else None
+                self.conn.execute(
+                    'INSERT INTO syncs VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (query_key) DO UPDATE SET synced_at = excluded.synced_at, synced_ts = excluded.synced_ts, '
+                    'truncated = COALESCE(?, truncated), full_ts = COALESCE(?, full_ts)',
+                    (query_key, synced_at.isoformat(timespec='seconds'), synced_at.timestamp(),
+                     truncated or 0, full_ts or 0, truncated, full_ts))
+
+    def refresh_params(self, query_key, params):
+        '''Что догрузить из API: (параметры запроса или None, если данные свежие; время синхронизации)'''
+        now = datetime.now(timezone.utc)
+        last = self.last_sync(query_key)
+
+        if last is None:
+            return params, now
+        if now.timestamp() - last[1] < self.refresh_interval:
+            return None, now
+        if now.timestamp() - last[2] >= self.full_refresh_interval:
+            # Полная загрузка заменит сохраненное: закрытые вакансии уйдут из статистики
+            return params, now
+
+        date_from = datetime.fromisoformat(last[0]) - SYNC_OVERLAP
+        return dict(params, date_from=date_from.isoformat(timespec='seconds'),
+                    order_by='publication_time'), now
+
+    def claim(self, query_key):
+        '''Отметка о загрузке запроса: owner или None, если его уже загружает другой'''
+        owner = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            # Сначала чтение: ожидающие не отнимают блокировку записи у загружающего
+            row = self.conn.execute('SELECT claimed_ts FROM claims WHERE query_key = ?',
+                                    (query_key,)).fetchone()
+            if row is not None and row[0] >= now - self.claim_timeout:
+                return None
+            with self.conn:
+                self.conn.execute('DELETE FROM claims WHERE query_key = ? AND claimed_ts < ?',
+                                  (query_key, now - self.claim_timeout))
+                claimed = self.conn.execute('INSERT OR IGNORE INTO claims VALUES (?, ?, ?)',
+                                            (query_key, owner, now)).rowcount
+        return owner if claimed else None
+
+    def release(self, plan):
+        '''Снятие отметки plan о загрузке (повторный вызов ничего не делает)'''
+        if plan.owner is None:
+            return
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM claims WHERE query_key = ? AND owner = ?',
+                              (plan.query_key, plan.owner))
+        plan.owner = None
+
+    def plan_sync(self, query_key, params):
+        '''Первый шаг синхронизации: SyncPlan с тем, что догрузить из API
+
+        Загрузка отмечается в claims. Если запрос уже загружает другой процесс,
+        plan_sync ждет конца его загрузки (не дольше claim_timeout) и
+        планирует заново: обычно загружать уже нечего.
+        '''
+        deadline = time.monotonic() + self.claim_timeout
+        while True:
+            fetch_params, now = self.refresh_params(query_key, params)
+            if fetch_params is None:
+                return SyncPlan(query_key, None, now)
+            owner = self.claim(query_key)
+            if owner is not None or time.monotonic() >= deadline:
+                return SyncPlan(query_key, fetch_params, now, owner)
+            time.sleep(CLAIM_POLL)
+
+    def commit_sync(self, plan, fresh, failed, truncated=0):
+        '''Второй шаг: сохранение загруженного по plan
+
+        Если страницы потерялись (failed), загруженное сохраняется без отметки
+        о синхронизации, и следующий поиск повторит загрузку. truncated (см.
+        harvester) запоминается только после полной загрузки, и только полная
+        загрузка без потерь заменяет сохраненные вакансии запроса. Отметка
+        загрузки снимается (если загрузка сорвалась, ее снимает release).
+        '''
+        self.merge(plan.query_key, fresh, None if failed else plan.synced_at,
+                   truncated if plan.full else None, replace=plan.full and not failed)
+        self.release(plan)
+
+    def sync(self, query_key, params, client, project=None, on_page=None, missing=None,
+             first=None):
+        '''Пачки вакансий запроса (iter_load); из API догружаются только новые с прошлой синхронизации
+
+        on_page получает страницы только полной загрузки (см. SyncPlan.full).
+        Номера не загрузившихся страниц добавляются в missing (см. commit_sync).
+        first — уже загруженная первая страница params (пригодится при полной загрузке).
+        '''
+        plan = self.plan_sync(query_key, params)
+        if plan.params is not None:
+            if not plan.full:
+                on_page = first = None
+            fresh, failed = [], []
+            try:
+                for records in client.iter_pages(plan.params, project=project, missing=failed,
+                                                 first=first):
+                    fresh.extend(records)
+                    if on_page is not None:
+                        on_page(records)
+                self.commit_sync(plan, fresh, failed, getattr(client, 'truncated', 0))
+            finally:
+                self.release(plan)
+            if missing is not None:
+                missing.extend(failed)
+        return self.iter_load(query_key)
+
+    def close(self):
+        '''Закрытие базы'''
+        with self.lock:
+            self.conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    '''Общее хранилище процесса или None, если оно отключено'''
+    global _store
+    if _store is None and STORE_PATH:
+        with _store_lock:
+            if _store is None:
+                _store = VacancyStore()
+    return _store
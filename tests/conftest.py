@@ -0,0 +1,177 @@
+'''Общее для тестов: модули бота из src/, фейковый hh.ru, вакансии, часы и сброс кэшей
+
+Модули бота лежат плоско в src/ и импортируются по имени, как при запуске.
+Помощники импортируются в тестах из conftest (from conftest import FakeHH).
+'''
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import hh_client  # noqa: E402
+
+# Время публикации по умолчанию: сейчас (хранилище удаляет вакансии старше 30 дней)
+NOW = datetime.now(timezone.utc).timestamp()
+
+
+def vacancy(index, salary=100000, currency='RUR', gross=False, experience='noExperience',
+            schedule='fullDay', employer=None, published=None):
+    '''Вакансия выдачи hh.ru с вилкой salary ± 10% (salary=None — без зарплаты)'''
+    return {
+        'id': str(index),
+        'published_at': datetime.fromtimestamp(NOW if published is None else published,
+                                               timezone.utc).strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'salary': None if salary is None else {
+            'from': salary * 0.9, 'to': salary * 1.1, 'currency': currency, 'gross': gross},
+        'employer': {'name': employer or f'Работодатель {index % 7}'},
+        'experience': {'id': experience, 'name': experience.upper()},
+        'employment': {'id': 'full', 'name': 'Полная занятость'},
+        'schedule': {'id': schedule, 'name': schedule},
+    }
+
+
+def published(item):
+    '''Время публикации вакансии в секундах epoch (ts у упрощенных вакансий)'''
+    if 'ts' in item:
+        return item['ts']
+    return datetime.strptime(item['published_at'], '%Y-%m-%dT%H:%M:%S%z').timestamp()
+
+
+class FakeHH:
+    '''Клиент hh.ru над списком вакансий
+
+    Как hh.ru, применяет к выдаче фильтры experience и schedule и окно
+    date_from/date_to (границы включительно), считает found по всей выдаче и
+    отдает не глубже depth вакансий одной страницей. found, если задан, —
+    число найденных вместо выдачи (страницы тогда пустые).
+    '''
+
+    base_url = 'http://hh.test'
+
+    def __init__(self, items=(), found=None, depth=2000):
+        self.items = list(items)
+        self.found = found
+        self.depth = depth
+        self.calls = []
+
+    def search(self, params):
+        '''Вакансии выдачи с фильтрами params'''
+        import harvester
+        dated = 'date_from' in params or 'date_to' in params
+        start, end = harvester.period(params) if dated else (None, None)
+        return [item for item in self.items
+                if params.get('experience', item.get('experience', {}).get('id')) ==
+                item.get('experience', {}).get('id')
+                and params.get('schedule', item.get('schedule', {}).get('id')) ==
+                item.get('schedule', {}).get('id')
+                and (not dated or start <= published(item) <= end)]
+
+    def get_page(self, params, page):
+        self.calls.append(dict(params, page=page))
+        if self.found is not None:
+            return {'found': self.found, 'pages': 1, 'items': []}
+        items = self.search(params)
+        return {'found': len(items), 'pages': 1, 'items': items[:self.depth]}
+
+    def iter_pages(self, params, max_pages=None, project=None, missing=None, first=None):
+        yield hh_client.page_items(first or self.get_page(params, 0), project)
+
+    def base_calls(self):
+        '''Запросы выдачи без фильтров'''
+        return [c for c in self.calls if 'experience' not in c and 'schedule' not in c]
+
+    def windows(self):
+        '''Окна date_from/date_to, запрошенные при загрузке'''
+        return {(c['date_from'], c['date_to']) for c in self.calls if 'date_from' in c}
+
+
+class AsyncFakeHH(FakeHH):
+    async def get_page(self, params, page):
+        return FakeHH.get_page(self, params, page)
+
+    async def iter_pages(self, params, max_pages=None, project=None, missing=None, first=None):
+        yield hh_client.page_items(first or await self.get_page(params, 0), project)
+
+
+class Response:
+    '''Ответ requests с JSON-телом'''
+
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class PagedSession:
+    '''Сессия requests для HHClient: выдача из pages страниц, каждая отвечает через latency с'''
+
+    headers = {}
+
+    def __init__(self, pages=3, latency=0.0):
+        self.pages = pages
+        self.latency = latency
+        self.requested = []  # номера запрошенных страниц
+
+    def get(self, url, params, timeout):
+        self.requested.append(params['page'])
+        time.sleep(self.latency)
+        return Response({'found': self.pages * 100, 'pages': self.pages,
+                         'items': [vacancy(params['page'])]})
+
+    def close(self):
+        pass
+
+
+class Clock:
+    '''Часы теста вместо модуля time: time() и monotonic() — одно и то же now'''
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    '''Часы теста; модуль подменяет ими time (monkeypatch.setattr(module, 'time', clock))'''
+    return Clock()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    '''Пустые кэши поисков, сводок и графиков до и после каждого теста'''
+    import stats_advanced
+    caches = (stats_advanced.RESULT_CACHE, stats_advanced.SUMMARY_CACHE,
+              stats_advanced.CHART_CACHE)
+    for cache in caches:
+        cache.clear()
+    yield
+    for cache in caches:
+        cache.clear()
+
+
+@pytest.fixture
+def state(monkeypatch):
+    '''Общее хранилище состояния процесса в памяти (вместо bot_state.sqlite3)'''
+    import state_store
+    store = state_store.StateStore(state_store.MemoryBackend(), flush_interval=3600)
+    monkeypatch.setattr(state_store, '_state', store)
+    yield store
+    store.close()
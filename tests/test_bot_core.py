@@ -0,0 +1,215 @@
+'''Графики по file_id, ответы викторины из callback и промежуточные итоги main_async'''
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import types
+
+import pytest
+
+import state_store
+from conftest import AsyncFakeHH, FakeHH, vacancy
+
+
+@pytest.fixture
+def entry_points(monkeypatch, state):
+    '''main_advanced и main_async с фейковым токеном и состоянием в памяти'''
+    monkeypatch.setenv('BOT_TOKEN', '123:test')
+    import main_advanced
+    import main_async
+    return main_advanced, main_async
+
+
+class PhotoBot:
+    '''Bot API, который не принимает file_id из rejected'''
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.sent = []
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        self.sent.append(photo if isinstance(photo, str) else photo.read())
+        if isinstance(photo, str) and photo in self.rejected:
+            raise RuntimeError('Bad Request: wrong file identifier')
+        return types.SimpleNamespace(photo=[types.SimpleNamespace(file_id=f'id{len(self.sent)}')])
+
+
+class AsyncPhotoBot(PhotoBot):
+    async def send_photo(self, chat_id, photo, **kwargs):
+        return PhotoBot.send_photo(self, chat_id, photo, **kwargs)
+
+
+@pytest.fixture
+def chart():
+    import bot_core
+    import stats_advanced
+    bot_core.PHOTO_IDS.clear()
+    yield stats_advanced.Chart('hash', b'png')
+    bot_core.PHOTO_IDS.clear()
+
+
+def test_file_id_reused_after_upload(entry_points, chart, monkeypatch):
+    import bot_core
+    main_advanced = entry_points[0]
+    bot = PhotoBot()
+    monkeypatch.setattr(main_advanced, 'bot', bot)
+    main_advanced.execute([bot_core.photo_reply(1, chart)])
+    main_advanced.execute([bot_core.photo_reply(1, chart)])
+    assert bot.sent == [b'png', 'id1']
+
+
+def test_rejected_file_id_falls_back_to_upload(entry_points, chart, monkeypatch):
+    import bot_core
+    main_advanced = entry_points[0]
+    bot_core.PHOTO_IDS.put(chart.key, 'stale')
+    bot = PhotoBot(rejected={'stale'})
+    monkeypatch.setattr(main_advanced, 'bot', bot)
+
+    main_advanced.execute([bot_core.photo_reply(1, chart, caption='График')])
+    assert bot.sent == ['stale', b'png']
+    # Вместо устаревшего id — id новой загрузки
+    assert bot_core.PHOTO_IDS.peek(chart.key) == 'id2'
+
+
+def test_stale_file_id_evicted_even_if_upload_fails(entry_points, chart, monkeypatch):
+    import bot_core
+    main_advanced = entry_points[0]
+    bot_core.PHOTO_IDS.put(chart.key, 'stale')
+
+    class DownBot(PhotoBot):
+        def send_photo(self, chat_id, photo, **kwargs):
+            self.sent.append(photo)
+            raise RuntimeError('Telegram недоступен')
+
+    monkeypatch.setattr(main_advanced, 'bot', DownBot())
+    with pytest.raises(RuntimeError):
+        main_advanced.execute([bot_core.photo_reply(1, chart)])
+    assert bot_core.PHOTO_IDS.peek(chart.key) is None
+
+
+def test_async_rejected_file_id_falls_back_to_upload(entry_points, chart, monkeypatch):
+    import bot_core
+    main_async = entry_points[1]
+    bot_core.PHOTO_IDS.put(chart.key, 'stale')
+    bot = AsyncPhotoBot(rejected={'stale'})
+    monkeypatch.setattr(main_async, 'bot', bot)
+
+    asyncio.run(main_async.execute([bot_core.photo_reply(1, chart)]))
+    assert bot.sent == ['stale', b'png']
+    assert bot_core.PHOTO_IDS.peek(chart.key) == 'id2'
+
+
+def quiz_call(data):
+    user = types.SimpleNamespace(id=7)
+    message = types.SimpleNamespace(chat=types.SimpleNamespace(id=7), message_id=1)
+    return types.SimpleNamespace(id='call', from_user=user, message=message, data=data)
+
+
+@pytest.mark.parametrize('data', ['quiz_256', 'quiz_-1', 'quiz_x', 'quiz_'])
+def test_crafted_quiz_callback_is_ignored(entry_points, state, data):
+    import bot_core
+    bot_core.quiz_manager.start_quiz(7)
+    actions = bot_core.callback_handler(quiz_call(data))
+    assert [action.method for action in actions] == ['answer_callback_query']
+    assert bot_core.quiz_manager.get_current_question(7) is bot_core.quiz.QUIZ_QUESTIONS[0]
+    assert state.get(state_store.QuizProgress, 7).answers == b''
+
+
+def test_import_does_not_open_state_store(tmp_path):
+    # Хранилище создается при первом обращении: импорт не создает bot_state.sqlite3
+    code = 'import main_advanced, main_async, bot_core; print(state_store._state)'
+    env = dict(os.environ, BOT_TOKEN='123:test', PYTHONPATH=os.pathsep.join(sys.path))
+    env.pop('BOT_STATE_PATH', None)
+    out = subprocess.run([sys.executable, '-c', 'import state_store; ' + code], env=env,
+                         cwd=tmp_path, capture_output=True, text=True, check=True).stdout
+    assert out.split() == ['None']
+    assert list(tmp_path.iterdir()) == []
+
+
+
+class SearchBot:
+    '''Асинхронный Bot API, записывающий отправленные и исправленные сообщения'''
+
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return types.SimpleNamespace(message_id=len(self.sent))
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.edits.append((chat_id, text))
+
+
+class GatedHH(AsyncFakeHH):
+    '''Асинхронный hh.ru, страницы которого ждут release'''
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.release = asyncio.Event()
+
+    async def get_page(self, params, page):
+        await self.release.wait()
+        return FakeHH.get_page(self, params, page)
+
+
+@pytest.fixture
+def async_search(entry_points, monkeypatch):
+    '''main_async с фейковыми Bot API и hh.ru; потоки format_progress_message — в threads'''
+    import hh_async
+    import stats_advanced
+    import vacancy_store
+    main_async = entry_points[1]
+    bot = SearchBot()
+    client = GatedHH([vacancy(i, salary=None) for i in range(5)])
+    threads = []
+
+    def format_progress_message(preview):
+        threads.append(threading.current_thread())
+        return 'Предварительно'
+
+    monkeypatch.setattr(main_async, 'bot', bot)
+    monkeypatch.setattr(hh_async, '_client', client)
+    monkeypatch.setattr(vacancy_store, 'get_store', lambda: None)
+    monkeypatch.setattr(stats_advanced, 'format_progress_message', format_progress_message)
+    return main_async, bot, client, threads
+
+
+def search(user_id):
+    import bot_core
+    return bot_core.Search(user_id, user_id, 'python', state_store.Settings())
+
+
+def test_async_progress_is_formatted_off_the_event_loop(async_search):
+    main_async, bot, client, threads = async_search
+
+    async def run():
+        client.release.set()
+        await main_async.search_job(search(1))
+
+    asyncio.run(run())
+    assert [text for _, text in bot.edits][0] == 'Предварительно'
+    assert len(bot.edits) == 2
+    assert threads and threading.main_thread() not in threads
+
+
+def test_cancelled_search_gets_no_progress_from_a_shared_load(async_search):
+    main_async, bot, client, threads = async_search
+
+    async def run():
+        main_async.start_task(search(1), main_async.search_job(search(1)))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(main_async.search_job(search(2)))
+        await asyncio.sleep(0.05)
+        # Поиск первого пользователя вытеснен, но выдачу ждет второй
+        main_async.user_tasks[1].cancel()
+        await asyncio.sleep(0)
+        client.release.set()
+        await follower
+
+    asyncio.run(run())
+    assert len(client.base_calls()) == 1
+    assert threads == []
+    assert [chat for chat, _ in bot.edits] == [2]
@@ -0,0 +1,144 @@
+'''Кэш результатов поиска: TTL, LRU по лимиту памяти, single-flight и keep'''
+import threading
+
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+def sized(max_bytes, ttl=60):
+    '''Кэш, где размер значения — его длина'''
+    return cache.TTLCache(ttl=ttl, max_bytes=max_bytes, sizeof=len)
+
+
+def test_entries_expire_after_ttl(clock):
+    results = sized(100, ttl=10)
+    results.put('a', 'x')
+    clock.now += 9
+    assert results.get('a') == 'x'
+    assert results.expires_in('a') == pytest.approx(1)
+    clock.now += 2
+    assert results.peek('a') is None
+    assert results.expires_in('a') is None
+    assert results.get('a', 'нет') == 'нет'
+    assert len(results) == 0 and results.size == 0
+    assert (results.hits, results.misses) == (1, 1)
+
+
+def test_put_refreshes_ttl(clock):
+    results = sized(100, ttl=10)
+    results.put('a', 'x')
+    clock.now += 8
+    results.put('a', 'y')
+    clock.now += 8
+    assert results.get('a') == 'y'
+
+
+def test_lru_eviction_by_memory_budget(clock):
+    results = sized(10)
+    results.put('a', 'aaaa')
+    results.put('b', 'bbbb')
+    assert results.get('a') == 'aaaa'  # a — самая свежая по использованию
+    results.put('c', 'cccc')
+    assert results.peek('b') is None
+    assert results.peek('a') == 'aaaa' and results.peek('c') == 'cccc'
+    assert results.size == 8
+
+
+def test_peek_does_not_touch_lru(clock):
+    results = sized(10)
+    results.put('a', 'aaaa')
+    results.put('b', 'bbbb')
+    assert results.peek('a') == 'aaaa'
+    results.put('c', 'cccc')
+    assert results.peek('a') is None
+    assert (results.hits, results.misses) == (0, 0)
+
+
+def test_value_larger_than_budget_is_not_stored(clock):
+    results = sized(10)
+    results.put('a', 'aaaa')
+    results.put('big', 'x' * 11)
+    assert results.peek('big') is None
+    assert results.peek('a') == 'aaaa'
+
+
+def test_replacing_value_updates_size(clock):
+    results = sized(10)
+    results.put('a', 'aaaa')
+    results.put('a', 'aa')
+    assert results.size == 2 and len(results) == 1
+    results.clear()
+    assert results.size == 0 and len(results) == 0
+
+
+def test_single_flight_runs_loader_once():
+    results = sized(100)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(results.get_or_load('k', loader)))
+               for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert values == ['value'] * 8
+    assert results.get_or_load('k', loader) == 'value'
+    assert calls == [1]
+
+
+def test_loader_error_reaches_waiters_and_is_not_cached():
+    results = sized(100)
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('hh.ru недоступен')
+
+    def call():
+        try:
+            results.get_or_load('k', failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 4
+    assert results.peek('k') is None
+    assert results.get_or_load('k', lambda: 'снова') == 'снова'
+
+
+def test_keep_rejects_value_without_caching():
+    results = sized(100)
+    assert results.get_or_load('k', lambda: 'partial', keep=lambda v: v != 'partial') == 'partial'
+    assert results.peek('k') is None
+    assert results.get_or_load('k', lambda: 'full', keep=lambda v: v != 'partial') == 'full'
+    assert results.peek('k') == 'full'
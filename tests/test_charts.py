@@ -0,0 +1,52 @@
+'''Шаблоны графиков: длинные запросы и названия профессий не выходят за край картинки'''
+import numpy as np
+import pytest
+
+import charts
+
+LONG_QUERY = 'ведущий python разработчик высоконагруженных backend-сервисов и data engineer'
+PROFESSIONS = [f'{LONG_QUERY} {i}' for i in range(8)]
+
+
+def inside(figure, artists):
+    '''Все ли видимые тексты artists целиком в пределах фигуры'''
+    renderer = figure.canvas.get_renderer()
+    bounds = figure.bbox
+    for artist in artists:
+        if not artist.get_visible() or not artist.get_text():
+            continue
+        box = artist.get_window_extent(renderer)
+        if box.x0 < bounds.x0 - 1 or box.x1 > bounds.x1 + 1 or \
+                box.y0 < bounds.y0 - 1 or box.y1 > bounds.y1 + 1:
+            return False
+    return True
+
+
+@pytest.mark.parametrize('n', [2, 5, 8])
+def test_long_professions_fit_comparison(n):
+    charts.comparison_chart(PROFESSIONS[:n], [150_000] * n, [170_000] * n)
+    chart = charts._template(charts.ComparisonChart, n)
+    assert inside(chart.figure, chart.ax.get_xticklabels())
+    labels = [label.get_text() for label in chart.ax.get_xticklabels()]
+    assert all(len(line) <= charts.LABEL_WIDTH for label in labels for line in label.split('\n'))
+
+
+def test_long_query_fits_histogram_title():
+    charts.salary_histogram(np.linspace(50_000, 250_000, 100), LONG_QUERY * 2, 'Санкт-Петербург',
+                            120_000, 130_000)
+    chart = charts._template(charts.HistogramChart)
+    assert inside(chart.figure, [chart.title])
+    assert chart.title.get_text().endswith('…\nСанкт-Петербург')
+
+
+def test_long_query_fits_report_title():
+    top = [(f'ООО Очень длинное название работодателя {i}', 10 - i) for i in range(10)]
+    charts.detailed_report(np.linspace(50_000, 250_000, 100), 120_000, top,
+                           {'Нет опыта': 3}, {'Полная занятость': 2}, LONG_QUERY * 2, 'Россия')
+    chart = charts._template(charts.ReportChart)
+    assert inside(chart.figure, [chart.suptitle, *chart.top_ax.get_yticklabels()])
+
+
+def test_short_labels_unchanged():
+    assert charts.shorten('python', 60) == 'python'
+    assert charts.wrap_label('python  разработчик') == 'python\nразработчик'
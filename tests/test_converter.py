@@ -0,0 +1,74 @@
+'''Векторная нормализация зарплат совпадает с прежней построчной'''
+import math
+import random
+
+import numpy as np
+import pytest
+
+import converter
+
+CURRENCIES = ['RUR', 'EUR', 'USD', 'KZT', None]
+
+
+def legacy_salary(row):
+    '''Прежний расчет по одной строке: середина вилки, рубли, «на руки»'''
+    salary_from, salary_to = row['from'], row['to']
+    if salary_from is None and salary_to is None:
+        return math.nan
+    if salary_from is None:
+        salary = salary_to
+    elif salary_to is None:
+        salary = salary_from
+    else:
+        salary = (salary_from + salary_to) / 2
+    if row['currency'] == 'EUR':
+        salary *= 90
+    elif row['currency'] == 'USD':
+        salary *= 80
+    if row['gross'] == 1:
+        salary *= 0.87
+    return salary
+
+
+def vector_salary(rows):
+    salary = converter.salary_midpoint([np.nan if r['from'] is None else r['from'] for r in rows],
+                                       [np.nan if r['to'] is None else r['to'] for r in rows])
+    salary = converter.to_rub(salary, converter.currency_codes([r['currency'] for r in rows]))
+    return converter.to_net(salary, [r['gross'] for r in rows])
+
+
+def random_rows(count, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        low = rng.choice([None, rng.randrange(20, 400) * 1000])
+        high = rng.choice([None, (low or 50_000) + rng.randrange(0, 100) * 1000])
+        rows.append({'from': low, 'to': high, 'currency': rng.choice(CURRENCIES),
+                     'gross': rng.choice([True, False, None])})
+    return rows
+
+
+def test_vectorized_matches_row_wise():
+    rows = random_rows(2000)
+    expected = np.array([legacy_salary(row) for row in rows])
+    np.testing.assert_allclose(vector_salary(rows), expected, equal_nan=True)
+
+
+def test_midpoint_with_one_sided_ranges():
+    result = converter.salary_midpoint([100, np.nan, 100, np.nan], [200, 300, np.nan, np.nan])
+    np.testing.assert_array_equal(result, [150, 300, 100, np.nan])
+
+
+def test_unknown_currency_counts_as_rubles():
+    codes = converter.currency_codes(['USD', 'KZT', None, 'RUR', 'EUR'])
+    assert codes.tolist() == [2, -1, -1, 0, 1]
+    np.testing.assert_array_equal(converter.to_rub([10] * 5, codes), [800, 10, 10, 10, 900])
+
+
+@pytest.mark.parametrize('gross, expected', [
+    ([True, False, None], [87.0, 100.0, 100.0]),
+    ([1, 0, 0], [87.0, 100.0, 100.0]),
+])
+def test_to_net_only_for_gross(gross, expected):
+    assert converter.to_net([100, 100, 100], np.array(gross, dtype=object)) == \
+        pytest.approx(expected)
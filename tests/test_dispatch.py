@@ -0,0 +1,226 @@
+'''Диспетчер задач: вытеснение, очередь пользователя, отказ при перегрузке и отмена загрузки'''
+import threading
+import time
+
+import pytest
+
+import dispatch
+import harvester
+import hh_client
+import stats_advanced
+from conftest import FakeHH, PagedSession, vacancy
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def dispatcher():
+    result = dispatch.Dispatcher(job_workers=2, max_active_users=2)
+    yield result
+    result.shutdown()
+
+
+def wait_idle(dispatcher):
+    deadline = time.monotonic() + TIMEOUT
+    while dispatcher.active_users:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+class Blocking:
+    '''Задача, которая ждет release и записывает, чем закончилась'''
+
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, job):
+        self.started.set()
+        self.release.wait(TIMEOUT)
+        try:
+            job.check()
+        except dispatch.Cancelled:
+            self.log.append((self.name, 'cancelled'))
+            raise
+        self.log.append((self.name, 'done'))
+
+
+def test_new_job_supersedes_running_and_pending(dispatcher):
+    log = []
+    first, second, third = (Blocking(name, log) for name in ('first', 'second', 'third'))
+    assert dispatcher.submit(1, first)
+    assert first.started.wait(TIMEOUT)
+    assert dispatcher.submit(1, second)
+    assert dispatcher.submit(1, third)
+    assert dispatcher.active_users == 1
+    assert dispatcher.queued == 1
+
+    first.release.set()
+    assert third.started.wait(TIMEOUT)
+    third.release.set()
+    wait_idle(dispatcher)
+    # Вытесненная ожидающая задача не запускалась вовсе
+    assert log == [('first', 'cancelled'), ('third', 'done')]
+    assert not second.started.is_set()
+
+
+def test_busy_refuses_new_users_but_queues_known(dispatcher):
+    log = []
+    jobs = [Blocking(user, log) for user in range(2)]
+    for user, job in enumerate(jobs):
+        assert dispatcher.submit(user, job)
+        assert job.started.wait(TIMEOUT)
+
+    assert not dispatcher.submit(2, Blocking(2, log))
+    later = Blocking('later', log)
+    assert dispatcher.submit(0, later)
+    assert (dispatcher.active_users, dispatcher.queued) == (2, 1)
+
+    for job in jobs:
+        job.release.set()
+    later.release.set()
+    wait_idle(dispatcher)
+    assert set(log) == {(0, 'cancelled'), (1, 'done'), ('later', 'done')}
+    assert dispatcher.submit(2, lambda job: None)
+
+
+def test_errors_are_reported_and_cancelled_is_silent(dispatcher, capsys):
+    def fails(job):
+        raise ValueError('сбой')
+
+    def cancelled(job):
+        raise dispatch.Cancelled()
+
+    dispatcher.submit(1, fails)
+    dispatcher.submit(2, cancelled)
+    wait_idle(dispatcher)
+    assert capsys.readouterr().out.splitlines() == ['Ошибка в задаче пользователя 1: сбой']
+
+
+def cancel_after_first(dispatcher, user, load):
+    '''Исход задачи load(on_page), которую вытесняют после первой страницы'''
+    outcome, page_seen = [], threading.Event()
+
+    def job_fn(job):
+        try:
+            outcome.append(load(lambda: page_seen.set()))
+        except dispatch.Cancelled:
+            outcome.append('cancelled')
+            raise
+
+    dispatcher.submit(user, job_fn)
+    assert page_seen.wait(TIMEOUT)
+    dispatcher.submit(user, lambda job: None)
+    wait_idle(dispatcher)
+    return outcome
+
+
+def test_cancel_stops_page_loading(dispatcher):
+    client = hh_client.HHClient('http://hh.test', concurrency=1, rate=1000, retries=0)
+    client.session = PagedSession(pages=20, latency=0.02)
+
+    def load(on_page):
+        pages = []
+        for page in client.iter_pages({'text': 'python'}):
+            on_page()
+            time.sleep(0.05)
+            pages.append(page)
+        return pages
+
+    try:
+        assert cancel_after_first(dispatcher, 1, load) == ['cancelled']
+    finally:
+        client.close()
+    assert len(client.session.requested) < 10
+
+
+def test_cancel_stops_harvester_windows(dispatcher, monkeypatch):
+    monkeypatch.setattr(harvester, 'DEPTH', 10)
+
+    class SlowHH(FakeHH):
+        def get_page(self, params, page):
+            time.sleep(0.02)
+            return FakeHH.get_page(self, params, page)
+
+    now, period = time.time(), (harvester.PERIOD_DAYS - 1) * 86400
+    items = [dict(vacancy(i), ts=now - period * (i + 0.5) / 80) for i in range(80)]
+    full = FakeHH(items, depth=10)
+    assert sum(map(len, harvester.Harvester(full, max_shards=16).iter_pages({}))) == 80
+    client = SlowHH(items, depth=10)
+    source = harvester.Harvester(client, max_shards=16, workers=1)
+
+    def load(on_page):
+        for page in source.iter_pages({'text': 'python'}):
+            on_page()
+            time.sleep(0.05)
+
+    assert cancel_after_first(dispatcher, 1, load) == ['cancelled']
+    # Окна, до которых очередь не дошла, не запрашивались
+    assert len(client.windows()) < len(full.windows()) / 2
+
+
+class SharedHH(FakeHH):
+    '''Выдача, первая страница которой ждет release'''
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def iter_pages(self, params, max_pages=None, project=None, missing=None, first=None):
+        self.started.set()
+        self.release.wait(TIMEOUT)
+        dispatch.check()
+        yield from FakeHH.iter_pages(self, params, max_pages, project, missing, first)
+
+
+def test_cancelled_leader_finishes_a_shared_load(dispatcher):
+    client = SharedHH([vacancy(i) for i in range(10)])
+    key = stats_advanced.make_query_key('python', 1)
+    results = {}
+
+    def search(job, name):
+        results[name] = len(stats_advanced.load_frame(key, client, None))
+        job.check()
+
+    dispatcher.submit(1, search, 'leader')
+    assert client.started.wait(TIMEOUT)
+    dispatcher.submit(2, search, 'follower')
+    deadline = time.monotonic() + TIMEOUT
+    while not stats_advanced.RESULT_CACHE._inflight[key].waiters:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    dispatcher.submit(1, lambda job: None)  # лидера вытеснили, но выдачу ждет follower
+    client.release.set()
+    wait_idle(dispatcher)
+    assert results == {'leader': 10, 'follower': 10}
+    assert stats_advanced.RESULT_CACHE.peek(key) is not None
+
+
+def test_cancelled_load_nobody_waits_for_is_abandoned(dispatcher):
+    client = SharedHH([vacancy(i) for i in range(10)])
+    key = stats_advanced.make_query_key('python', 1)
+    outcome = []
+
+    def search(job):
+        try:
+            stats_advanced.load_frame(key, client, None)
+        except dispatch.Cancelled:
+            outcome.append('cancelled')
+            raise
+
+    dispatcher.submit(1, search)
+    assert client.started.wait(TIMEOUT)
+    dispatcher.submit(1, lambda job: None)
+    client.release.set()
+    wait_idle(dispatcher)
+    assert outcome == ['cancelled']
+    assert stats_advanced.RESULT_CACHE.peek(key) is None
+    assert key not in stats_advanced.RESULT_CACHE._inflight
+
+    # Следующий поиск грузит выдачу заново
+    client.started.clear()
+    assert len(stats_advanced.load_frame(key, client, None)) == 10
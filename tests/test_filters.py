@@ -0,0 +1,129 @@
+'''Фильтры опыта и графика: выдача без фильтров грузится, только если поместится целиком'''
+import asyncio
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+import harvester
+import hh_async
+import schema
+import stats_advanced
+import vacancy_store
+from conftest import AsyncFakeHH, FakeHH, vacancy
+
+KEY = stats_advanced.make_query_key('python', 1, 'noExperience', True)
+
+
+def test_small_superset_loaded_once_first_page_reused():
+    client = FakeHH(found=50)
+    stats_advanced.load_frame(KEY, client, None)
+    assert len(client.calls) == 1
+    assert len(client.base_calls()) == 1
+    assert stats_advanced.RESULT_CACHE.peek(stats_advanced.base_key(KEY)) is not None
+
+
+def test_large_superset_not_harvested():
+    client = FakeHH(found=harvester.DEPTH * harvester.MAX_SHARDS + 1)
+    stats_advanced.load_frame(KEY, client, None)
+    # Только первая страница выдачи без фильтров, по ее found решено грузить с фильтрами
+    assert len(client.base_calls()) == 1
+    assert stats_advanced.RESULT_CACHE.peek(stats_advanced.base_key(KEY)) is None
+    assert stats_advanced.RESULT_CACHE.peek(KEY) is not None
+
+
+def test_async_large_superset_not_harvested(tmp_path):
+    store = vacancy_store.VacancyStore(str(tmp_path / 'store.db'))
+    client = AsyncFakeHH(found=harvester.DEPTH * harvester.MAX_SHARDS + 1)
+    asyncio.run(hh_async.load_stats('python', 1, 'noExperience', True, client=client,
+                                    store=store))
+    assert len(client.base_calls()) == 1
+    assert stats_advanced.RESULT_CACHE.peek(KEY) is not None
+    store.close()
+
+
+def test_store_decides_without_requests(tmp_path):
+    store = vacancy_store.VacancyStore(str(tmp_path / 'store.db'))
+    client = FakeHH(found=50)
+    base = stats_advanced.store_key(client, stats_advanced.base_key(KEY))
+    store.merge(base, [], datetime.now(timezone.utc), truncated=10000)
+    assert stats_advanced.plan_frame(KEY, client, store) == (KEY, None)
+    assert client.calls == []
+    store.close()
+
+
+EXPERIENCES = ['noExperience', 'between1And3', 'between3And6', 'moreThan6']
+SCHEDULES = ['fullDay', 'remote', 'flexible']
+
+
+def varied(index):
+    '''Вакансия с зарплатой, валютой, опытом и графиком, зависящими от номера'''
+    item = vacancy(index, 50000 + 1000 * index, currency='USD' if index % 11 == 0 else 'RUR',
+                   gross=index % 3 == 0, experience=EXPERIENCES[index % 4],
+                   schedule=SCHEDULES[index % 7 % 3], employer=f'Работодатель {index % 13}')
+    item['salary']['to'] = None
+    item['employment']['name'] = ['Полная', 'Частичная'][index % 5 == 0]
+    return item
+
+
+@pytest.mark.parametrize('experience, remote', [
+    ('noExperience', False), ('between3And6', False), (None, True), ('between1And3', True),
+])
+def test_filtered_superset_equals_direct_load(experience, remote):
+    client = FakeHH([varied(i) for i in range(300)])
+    key = stats_advanced.make_query_key('python', 1, experience, remote)
+    base = stats_advanced.base_key(key)
+    superset = stats_advanced.VacancyStats._load_frame(base, stats_advanced.key_params(base),
+                                                       client, None)
+    local = stats_advanced.filter_frame(superset, key)
+    direct = stats_advanced.VacancyStats._load_frame(key, stats_advanced.key_params(key),
+                                                     client, None)
+
+    assert len(local) == len(direct) > 0
+    assert list(local.columns) == list(direct.columns)
+    for name in local.columns:
+        # Порядок категорий зависит от выдачи, значения — нет
+        pd.testing.assert_series_equal(local[name].astype(object), direct[name].astype(object))
+    for name in schema.CATEGORY_COLUMNS:
+        assert set(local[name].cat.categories) == set(direct[name].cat.categories), name
+    for name in ('experience.name', 'employment.name', 'schedule.id'):
+        assert local[name].value_counts().to_dict() == direct[name].value_counts().to_dict()
+
+    local_stats = stats_advanced.VacancyStats.from_frame('python', 1, local, key)
+    direct_stats = stats_advanced.VacancyStats.from_frame('python', 1, direct, key)
+    assert local_stats.get_basic_stats() == direct_stats.get_basic_stats()
+    # Работодатели с равным числом вакансий идут в порядке категорий, поэтому без порядка
+    assert dict(local_stats.get_top_employers(100)) == dict(direct_stats.get_top_employers(100))
+
+
+def test_load_frame_filters_superset_locally():
+    client = FakeHH([varied(i) for i in range(300)])
+    key = stats_advanced.make_query_key('python', 1, 'moreThan6', True)
+    df = stats_advanced.load_frame(key, client, None)
+    assert stats_advanced.RESULT_CACHE.peek(stats_advanced.base_key(key)) is not None
+    assert stats_advanced.RESULT_CACHE.peek(key) is None
+    assert set(df['experience.id']) == {'moreThan6'}
+    assert set(df['schedule.id']) == {'remote'}
+    assert len(df) == client.get_page(stats_advanced.key_params(key), 0)['found']
+
+
+def test_sync_plan_full_then_incremental(tmp_path):
+    store = vacancy_store.VacancyStore(str(tmp_path / 'store.db'), refresh_interval=0)
+    query_key = stats_advanced.store_key(FakeHH(), KEY)
+    plan = store.plan_sync(query_key, {'text': 'python'})
+    assert plan.full
+    store.commit_sync(plan, [varied(1)], [], truncated=500)
+    assert store.truncated(query_key) == 500
+
+    plan = store.plan_sync(query_key, {'text': 'python'})
+    assert not plan.full and 'date_from' in plan.params
+    # Догрузка не меняет truncated полной загрузки
+    store.commit_sync(plan, [varied(2)], [], truncated=0)
+    assert store.truncated(query_key) == 500
+    assert sorted(item['id'] for item in store.load(query_key)) == ['1', '2']
+
+    # Потерянные страницы: без отметки о синхронизации
+    other = stats_advanced.store_key(FakeHH(), stats_advanced.base_key(KEY))
+    store.commit_sync(store.plan_sync(other, {'text': 'python'}), [varied(3)], [4])
+    assert store.last_sync(other) is None
+    store.close()
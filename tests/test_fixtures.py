@@ -0,0 +1,63 @@
+'''Записанная выдача hh.ru для бенчмарков: очистка и путь через стаб до статистики'''
+import os
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+sys.path.insert(0, BENCHMARKS)
+
+import hh_client  # noqa: E402
+import record_fixtures  # noqa: E402
+import schema  # noqa: E402
+import stats_advanced  # noqa: E402
+from stub_hh_server import load_fixture, make_vacancy, start_server  # noqa: E402
+
+SAMPLE = os.path.join(record_fixtures.FIXTURES_DIR, 'python_sample.json.gz')
+
+
+def test_sanitize_keeps_only_statistics_fields():
+    items = [make_vacancy(1, i, 1.7e9 - i * 60) for i in range(5)]
+    items[1]['salary'] = None
+    items[2]['employer'] = dict(items[0]['employer'])
+    page = {'found': 5, 'pages': 1, 'page': 0, 'per_page': 100, 'items': items,
+            'clusters': None, 'alternate_url': 'https://hh.ru/search/vacancy'}
+    [clean] = record_fixtures.sanitize([page])
+
+    assert set(clean) == {'found', 'pages', 'page', 'per_page', 'items'}
+    assert [item['id'] for item in clean['items']] == ['1', '2', '3', '4', '5']
+    assert clean['items'][1]['salary'] is None
+    assert clean['items'][2]['employer'] == clean['items'][0]['employer']
+    for original, item in zip(items, clean['items']):
+        assert set(item) <= {path[0] for path in schema.FIELDS.values()}
+        assert item['employer']['name'].startswith('Работодатель ')
+        expected = dict(schema.project(original), id=item['id'],
+                        **{'employer.name': item['employer']['name']})
+        assert schema.project(item) == expected
+
+
+def test_sample_fixture_is_sanitized():
+    items = load_fixture(SAMPLE)
+    assert len(items) == 250
+    assert [item['id'] for item in items] == [str(i) for i in range(1, 251)]
+    for item in items:
+        assert set(item) <= {path[0] for path in schema.FIELDS.values()}
+        assert item['employer']['name'].startswith('Работодатель ')
+
+
+def test_sample_fixture_through_stub():
+    items = load_fixture(SAMPLE)
+    server, stub, url = start_server(latency=0, items=items)
+    client = hh_client.HHClient(url, rate=100000)
+    try:
+        key = stats_advanced.make_query_key('python', 1)
+        df = stats_advanced.load_frame(key, client, None)
+    finally:
+        client.close()
+        server.shutdown()
+
+    assert len(df) == len(items)
+    stats = stats_advanced.VacancyStats.from_frame('python', 1, df, key)
+    assert stats.prepare_salary_data()
+    basic = stats.get_basic_stats()
+    salaried = sum(item['salary'] is not None for item in items)
+    assert 0 < basic['count'] <= salaried < len(items)
+    assert basic['min'] <= basic['median'] <= basic['max']
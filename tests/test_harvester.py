@@ -0,0 +1,130 @@
+'''Загрузка выдачи больше DEPTH вакансий окнами по дате публикации'''
+import asyncio
+import math
+import time
+
+import pytest
+
+import harvester
+from conftest import AsyncFakeHH, FakeHH
+
+DEPTH = 100  # вместо 2000, чтобы выдачи в тестах были маленькими
+
+
+@pytest.fixture(autouse=True)
+def small_depth(monkeypatch):
+    monkeypatch.setattr(harvester, 'DEPTH', DEPTH)
+
+
+def published_items(stamps):
+    '''Упрощенные вакансии: id, время публикации ts и зарплата'''
+    return [{'id': str(i), 'ts': ts, 'salary': {'from': 100000 + i, 'currency': 'RUR'}}
+            for i, ts in enumerate(stamps)]
+
+
+def dated(stamps):
+    '''Клиент hh.ru с вакансиями, опубликованными в stamps, не глубже DEPTH на запрос'''
+    return FakeHH(published_items(stamps), depth=DEPTH)
+
+
+def uniform(count, days=harvester.PERIOD_DAYS - 1):
+    '''count публикаций, равномерно за последние days дней'''
+    now = time.time()
+    return [now - days * 86400 * (i + 0.5) / count for i in range(count)]
+
+
+def harvest(client, **kwargs):
+    source = harvester.Harvester(client, workers=2, **kwargs)
+    ids = [item['id'] for page in source.iter_pages({'text': 'python'}) for item in page]
+    return ids, source
+
+
+def test_small_result_not_split():
+    client = dated(uniform(DEPTH))
+    ids, source = harvest(client)
+    assert len(ids) == DEPTH
+    assert len(client.calls) == 1
+    assert source.truncated == 0
+
+
+def test_windows_cover_whole_result_without_duplicates():
+    client = dated(uniform(5 * DEPTH))
+    ids, source = harvest(client, max_shards=16)
+    assert sorted(ids, key=int) == [str(i) for i in range(5 * DEPTH)]
+    assert source.truncated == 0
+    assert 2 <= len(client.windows()) <= 16
+
+
+def test_crowded_window_is_split_again():
+    # Половина выдачи опубликована за последние два дня
+    stamps = uniform(2 * DEPTH) + uniform(2 * DEPTH, days=2)
+    client = dated(stamps)
+    ids, source = harvest(client, max_shards=16)
+    assert len(ids) == len(set(ids)) == 4 * DEPTH
+    assert source.truncated == 0
+
+
+def test_vacancies_on_window_boundaries_are_not_repeated():
+    client = dated(uniform(3 * DEPTH))
+    start, end = harvester.period({})
+    # Вакансии ровно на границах окон попадают в оба соседних окна
+    for window_start, _ in harvester.split(start, end, 3 * DEPTH, 15)[1:]:
+        client.items.append({'id': f'b{len(client.items)}', 'ts': math.floor(window_start)})
+    ids, _ = harvest(client, max_shards=16)
+    assert len(ids) == len(set(ids)) == len(client.items)
+
+
+def test_unique_drops_repeats_and_empty_pages():
+    pages = [[{'id': 1}, {'id': 2}], [{'id': 2}], [{'id': 2}, {'id': 3}]]
+    assert list(harvester.unique(pages)) == [[{'id': 1}, {'id': 2}], [{'id': 3}]]
+
+
+def test_shard_cap_truncates_and_reports_rest():
+    total = 30 * DEPTH
+    client = dated(uniform(total))
+    ids, source = harvest(client, max_shards=4)
+    assert len(ids) == len(set(ids)) <= 4 * DEPTH
+    assert len(client.windows()) <= 4
+    # Все, что не загружено, учтено в truncated
+    assert len(ids) + source.truncated >= total
+    assert not harvester.fits(total, 4)
+
+
+def test_truncated_result_is_reported_to_user():
+    import stats_advanced
+    key = stats_advanced.make_query_key('python', 113)
+    df = stats_advanced.VacancyStats._load_frame(key, stats_advanced.key_params(key),
+                                                 dated(uniform(30 * DEPTH)), None)
+    stats = stats_advanced.VacancyStats.from_frame('python', 113, df, key)
+    assert stats.truncated == df.attrs['truncated'] > 0
+    assert f'загружено {len(df)}' in stats_advanced.format_stats_message(stats)
+
+
+def test_no_shards_loads_first_depth_only():
+    client = dated(uniform(3 * DEPTH))
+    ids, source = harvest(client, max_shards=0)
+    assert len(ids) == DEPTH
+    assert source.truncated == 2 * DEPTH
+    assert len(client.calls) == 1
+
+
+def test_split_limits():
+    assert len(harvester.split(0, 86400, 100 * DEPTH, 3)) == 4
+    assert harvester.split(0, harvester.MIN_WINDOW - 1, 10 * DEPTH, 8) is None
+    windows = harvester.split(0, 1000, 3 * DEPTH, 8)
+    assert windows[0][0] == 0 and windows[-1][1] == 1000
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+
+
+def test_async_harvester_matches_sync():
+    stamps = uniform(2 * DEPTH) + uniform(2 * DEPTH, days=2)
+    sync_ids, _ = harvest(dated(stamps), max_shards=16)
+
+    async def run():
+        source = harvester.AsyncHarvester(AsyncFakeHH(published_items(stamps), depth=DEPTH), max_shards=16, workers=2)
+        return [item['id'] async for page in source.iter_pages({'text': 'python'})
+                for item in page], source.truncated
+
+    async_ids, truncated = asyncio.run(run())
+    assert sorted(async_ids) == sorted(sync_ids)
+    assert truncated == 0
@@ -0,0 +1,368 @@
+'''Общий бюджет запросов к hh.ru: слоты возвращаются при любом исходе запроса, бюджет делят
+потоки, корутины, фоновые запросы и процессы webhook-режима'''
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+import hh_async
+import hh_client
+
+
+class RaisingSession:
+    '''Сессия requests, у которой каждый запрос падает с error'''
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def get(self, *args, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+def sync_client(error):
+    client = hh_client.HHClient('http://hh.test', concurrency=2, rate=1000, retries=1)
+    client.session = RaisingSession(error)
+    return client
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ChunkedEncodingError('обрыв'),
+    requests.exceptions.ContentDecodingError('gzip'),
+    requests.exceptions.TooManyRedirects('петля'),
+    requests.exceptions.InvalidURL('адрес'),
+])
+def test_sync_request_errors_release_slot_and_retry(monkeypatch, error):
+    monkeypatch.setattr(hh_client, 'backoff_delay', lambda *args: 0)
+    client = sync_client(error)
+    for _ in range(2):
+        with pytest.raises(type(error)):
+            client.get_json('/vacancies', {})
+    assert client.session.calls == 4  # первая попытка и повтор
+    assert client.limiter.in_flight == 0
+
+
+class FakeResponse:
+    def __init__(self, status=200, body=None):
+        self.status = status
+        self.headers = {}
+        self.request_info = None
+        self.history = ()
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self):
+        return self.body()
+
+
+class FakeRequest:
+    def __init__(self, enter):
+        self.enter = enter
+
+    async def __aenter__(self):
+        return await self.enter()
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    '''Сессия aiohttp, отвечающая корутиной enter'''
+
+    def __init__(self, enter):
+        self.enter = enter
+        self.calls = 0
+
+    def get(self, *args, **kwargs):
+        self.calls += 1
+        return FakeRequest(self.enter)
+
+
+def async_client(enter):
+    client = hh_async.AsyncHHClient('http://hh.test', concurrency=2, rate=1000, retries=1)
+    client._session = FakeSession(enter)
+    return client
+
+
+def test_async_bad_json_releases_slot_and_retries(monkeypatch):
+    monkeypatch.setattr(hh_client, 'backoff_delay', lambda *args: 0)
+
+    def broken():
+        raise ValueError('Expecting value')
+
+    async def enter():
+        return FakeResponse(body=broken)
+
+    async def run():
+        client = async_client(enter)
+        with pytest.raises(ValueError):
+            await client.get_json('/vacancies', {})
+        return client
+
+    client = asyncio.run(run())
+    assert client._session.calls == 2
+    assert client.limiter.in_flight == 0
+
+
+def test_async_cancel_releases_slot_without_shrinking_window():
+    async def enter():
+        await asyncio.sleep(10)
+
+    async def run():
+        client = async_client(enter)
+        window = client.limiter.limit
+        tasks = [asyncio.ensure_future(client.get_json('/vacancies', {})) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert client.limiter.in_flight == 2
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return client, window
+
+    client, window = asyncio.run(run())
+    assert client.limiter.in_flight == 0
+    assert client.limiter.limit == window
+
+
+def limiter(window):
+    return hh_client.AdaptiveLimiter(rate=1000, concurrency=window, max_concurrency=window)
+
+
+def test_background_share_of_window():
+    budget = limiter(4)
+    now = time.monotonic()
+    assert budget.try_acquire(now, share=0.5) == 0
+    assert budget.try_acquire(now, share=0.5) == 0
+    # Половина окна занята: фоновым больше нельзя, пользователям можно
+    assert budget.try_acquire(now, share=0.5) is None
+    assert budget.try_acquire(now) == 0
+
+
+def test_background_yields_to_waiting_users():
+    budget = limiter(4)
+    budget.waiting = 1
+    assert budget.try_acquire(time.monotonic(), share=1.0) is None
+    budget.waiting = 0
+    assert budget.try_acquire(time.monotonic(), share=1.0) == 0
+
+
+def test_threads_and_coroutines_share_one_budget():
+    budget = limiter(1)
+    started = budget.acquire()
+    timer = threading.Timer(0.05, budget.release, args=(started, 200))
+    timer.start()
+
+    async def run():
+        begin = time.monotonic()
+        await asyncio.wait_for(budget.acquire_async(), 2)
+        return time.monotonic() - begin
+
+    waited = asyncio.run(run())
+    timer.join()
+    assert 0.03 < waited < 1
+    assert budget.in_flight == 1 and budget.waiting == 0
+
+
+def test_budget_split_between_processes():
+    code = 'import hh_client; print(hh_client.DEFAULT_RATE, hh_client.MAX_CONCURRENCY)'
+    env = dict(os.environ, HH_BUDGET_SHARES='4', HH_RATE='8', HH_MAX_CONCURRENCY='16',
+               PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True,
+                         text=True, check=True).stdout.split()
+    assert out == ['2.0', '4']
+
+
+def congestion(rate=8, window=8, max_window=16):
+    '''Бюджет с часами теста: время передается в try_acquire и on_result явно'''
+    budget = hh_client.Congestion(rate=rate, concurrency=window, max_concurrency=max_window,
+                                  latency_target=3)
+    budget.updated = 0.0
+    return budget
+
+
+def test_throttle_halves_window_and_rate_once_per_round():
+    budget = congestion()
+    for _ in range(3):
+        assert budget.try_acquire(0.0) == 0
+    budget.on_result(0.0, 1.0, 429)
+    assert (budget.limit, budget.rate) == (4.0, 4.0)
+    # Ответы на запросы, отправленные до сокращения, — тот же раунд
+    budget.on_result(0.0, 1.1, 429)
+    budget.on_result(0.0, 1.2, 503)
+    assert (budget.limit, budget.rate) == (4.0, 4.0)
+    assert (budget.throttled, budget.failed, budget.in_flight) == (2, 1, 0)
+
+    assert budget.try_acquire(2.0) == 0
+    budget.on_result(2.0, 2.5, 429)
+    assert (budget.limit, budget.rate) == (2.0, 2.0)
+
+
+def test_server_errors_shrink_window_but_not_rate():
+    budget = congestion()
+    budget.try_acquire(0.0)
+    budget.on_result(0.0, 0.5, 502)
+    assert (budget.limit, budget.rate) == (4.0, 8.0)
+    budget.try_acquire(1.0)
+    budget.on_result(1.0, 1.5, None)  # обрыв без ответа
+    assert budget.limit == 2.0
+
+
+def test_slow_success_shrinks_window():
+    budget = congestion()
+    budget.try_acquire(0.0)
+    budget.on_result(0.0, 5.0, 200)
+    assert budget.ok == 1
+    assert (budget.limit, budget.rate) == (4.0, 8.0)
+
+
+def test_additive_increase_up_to_ceilings():
+    budget = congestion(rate=4, window=4, max_window=6)
+    budget.on_result(0.0, 0.0, 429)
+    assert (budget.limit, budget.rate) == (2.0, 2.0)
+    budget.in_flight = 2
+    budget.on_result(1.0, 1.1, 200)
+    budget.on_result(1.0, 1.2, 200)
+    # +1/окно и +1/частота за каждый ответ: примерно +1 за раунд
+    assert budget.limit == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+    assert budget.rate == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+    for step in range(100):
+        budget.in_flight = 1
+        budget.on_result(2.0, 2.0 + step / 100, 200)
+    assert (budget.limit, budget.rate) == (6, 4)
+
+
+def test_retry_after_pauses_all_requests():
+    budget = congestion()
+    budget.try_acquire(10.0)
+    budget.on_result(10.0, 10.0, 429, retry_after=5)
+    assert budget.try_acquire(12.0) == pytest.approx(3.0)
+    assert budget.try_acquire(15.0) == 0
+
+
+def test_backoff_delay_is_capped_and_respects_retry_after(monkeypatch):
+    monkeypatch.setattr(hh_client.random, 'uniform', lambda low, high: high)
+    assert hh_client.backoff_delay(0) == hh_client.BACKOFF_BASE
+    assert hh_client.backoff_delay(2) == hh_client.BACKOFF_BASE * 4
+    assert hh_client.backoff_delay(20) == hh_client.BACKOFF_CAP
+    assert hh_client.backoff_delay(0, retry_after=7) == 7
+
+
+class StatusResponse:
+    '''Ответ requests с кодом status и телом body'''
+
+    def __init__(self, status, body=None, headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+        self.body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code}', response=self)
+
+    def json(self):
+        return self.body
+
+
+class ScriptedSession:
+    '''Сессия requests: ответ выбирает respond(params, номер вызова)'''
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append(dict(params))
+        return self.respond(params, len(self.calls))
+
+
+def scripted_client(respond, retries=3):
+    client = hh_client.HHClient('http://hh.test', concurrency=4, rate=1000, retries=retries)
+    client.session = ScriptedSession(respond)
+    return client
+
+
+def test_retries_stop_after_limit(monkeypatch):
+    delays = []
+    monkeypatch.setattr(hh_client.time, 'sleep', delays.append)
+    client = scripted_client(lambda params, call: StatusResponse(503, headers={'Retry-After': '2'}))
+    with pytest.raises(requests.HTTPError):
+        client.get_json('/vacancies', {})
+    assert len(client.session.calls) == 4  # первая попытка и три повтора
+    assert len(delays) == 3 and all(delay >= 2 for delay in delays)
+    assert client.limiter.in_flight == 0
+
+
+def test_retry_recovers_after_server_error(monkeypatch):
+    monkeypatch.setattr(hh_client.time, 'sleep', lambda delay: None)
+    client = scripted_client(
+        lambda params, call: StatusResponse(500) if call == 1 else StatusResponse(200, {'ok': 1}))
+    assert client.get_json('/vacancies', {}) == {'ok': 1}
+    assert len(client.session.calls) == 2
+
+
+def test_client_errors_are_not_retried():
+    client = scripted_client(lambda params, call: StatusResponse(400))
+    with pytest.raises(requests.HTTPError):
+        client.get_json('/vacancies', {})
+    assert len(client.session.calls) == 1
+
+
+def page_or_error(lost_page):
+    '''Выдача из 3 страниц по 2 вакансии, страница lost_page всегда отвечает 503'''
+    def respond(params, call):
+        page = int(params['page'])
+        if page == lost_page:
+            return StatusResponse(503)
+        items = [{'id': f'{page}-{i}', 'salary': {'from': 100000, 'to': None,
+                                                  'currency': 'RUR', 'gross': False}}
+                 for i in range(2)]
+        return StatusResponse(200, {'found': 6, 'pages': 3, 'items': items})
+    return respond
+
+
+def test_lost_page_gives_partial_uncached_frame(monkeypatch):
+    import stats_advanced
+    monkeypatch.setattr(hh_client.time, 'sleep', lambda delay: None)
+    client = scripted_client(page_or_error(2), retries=1)
+    key = stats_advanced.make_query_key('python', 1)
+
+    df = stats_advanced.load_frame(key, client, None)
+    assert len(df) == 4
+    assert df.attrs['missing_pages'] == 1
+    assert stats_advanced.RESULT_CACHE.peek(key) is None
+    stats = stats_advanced.VacancyStats.from_frame('python', 1, df, key)
+    assert 'не отдал страниц выдачи: 1' in stats_advanced.format_stats_message(stats)
+
+    # Следующий поиск грузит выдачу заново
+    stats_advanced.load_frame(key, client, None)
+    assert sum(call['page'] == 1 for call in client.session.calls) == 2
+
+
+def test_async_lost_page_not_cached_or_marked_synced(tmp_path):
+    import stats_advanced
+    import vacancy_store
+    respond = page_or_error(2)
+
+    class Client(hh_async.AsyncHHClient):
+        async def get_json(self, path, params):
+            resp = respond(params, 0)
+            if resp.status_code != 200:
+                raise requests.HTTPError('503')
+            return resp.json()
+
+    store = vacancy_store.VacancyStore(str(tmp_path / 'store.db'))
+    client = Client('http://hh.test')
+    stats = asyncio.run(hh_async.load_stats('python', client=client, store=store))
+    key = stats_advanced.make_query_key('python', 1)
+    assert stats.missing_pages == 1 and len(stats.df) == 4
+    assert stats_advanced.RESULT_CACHE.peek(key) is None
+    assert store.last_sync(stats_advanced.store_key(client, key)) is None
+    store.close()
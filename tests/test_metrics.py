@@ -0,0 +1,134 @@
+'''Метрики: разбивка поиска по этапам через потоки и формат Prometheus'''
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import harvester
+import hh_async
+import hh_client
+import metrics
+from conftest import FakeHH, PagedSession, vacancy
+
+LATENCY = 0.05
+
+
+def work(name, seconds=LATENCY):
+    with metrics.stage(name):
+        time.sleep(seconds)
+
+
+class TimedHH(FakeHH):
+    '''Фейковый hh.ru, у которого каждый запрос — этап hh_request'''
+
+    def get_page(self, params, page):
+        work('hh_request')
+        return FakeHH.get_page(self, params, page)
+
+
+def test_trace_sums_stages_and_logs_a_line(tmp_path, monkeypatch):
+    path = tmp_path / 'metrics.log'
+    monkeypatch.setattr(metrics, 'LOG_PATH', str(path))
+    monkeypatch.setattr(metrics, '_log_file', None)
+
+    search = metrics.trace('search', user_id=1, query='python')
+    with search as fields:
+        work('load', 0.01)
+        work('load', 0.01)
+        work('charts', 0.01)
+        fields['cache'] = 'miss'
+    with pytest.raises(ValueError):
+        with metrics.trace('compare', user_id=2):
+            raise ValueError
+    metrics._log_file.close()
+
+    assert set(search.stages) == {'load', 'charts'}
+    assert search.stages['load'] >= 0.02
+    first, second = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert first['event'] == 'search' and first['cache'] == 'miss'
+    assert first['query'] == 'python' and set(first['stages']) == {'load', 'charts'}
+    assert first['seconds'] >= sum(first['stages'].values())
+    assert second['event'] == 'compare' and second['error'] == 'ValueError'
+
+
+def test_stages_outside_a_trace_only_go_to_the_histogram():
+    search = metrics.trace('search')
+    with search:
+        # Поток без копии контекста не видит текущий поиск
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(work, 'lost', 0).result()
+    assert search.stages == {}
+    assert ('lost',) in metrics.STAGE_SECONDS.values
+
+
+def test_run_blocking_keeps_the_breakdown():
+    search = metrics.trace('search')
+
+    async def run():
+        with search:
+            await asyncio.gather(hh_async._run_blocking(work, 'prepare'),
+                                 hh_async._run_blocking(work, 'stats'))
+
+    asyncio.run(run())
+    assert set(search.stages) == {'prepare', 'stats'}
+    assert min(search.stages.values()) >= LATENCY
+
+
+def test_parallel_pages_count_in_the_breakdown():
+    client = hh_client.HHClient('http://hh.test', rate=1000, concurrency=4, retries=0)
+    client.session = PagedSession(pages=3, latency=LATENCY)
+    search = metrics.trace('search')
+    try:
+        with search:
+            pages = list(client.iter_pages({'text': 'python'}))
+    finally:
+        client.close()
+    assert len(pages) == 3
+    # Страницы 1 и 2 грузятся в пуле hh-fetch параллельно, но обе попадают в разбивку
+    assert search.stages['hh_request'] >= 3 * LATENCY
+
+
+def test_harvester_windows_count_in_the_breakdown(monkeypatch):
+    monkeypatch.setattr(harvester, 'DEPTH', 10)
+    now, period = time.time(), (harvester.PERIOD_DAYS - 1) * 86400
+    items = [dict(vacancy(i), ts=now - period * (i + 0.5) / 30) for i in range(30)]
+    source = harvester.Harvester(TimedHH(items, depth=10), max_shards=8, workers=2)
+    search = metrics.trace('search')
+    with search:
+        ids = {item['id'] for page in source.iter_pages({'text': 'python'}) for item in page}
+    assert len(ids) == 30
+    requests = len(source.client.calls)
+    assert requests > 2
+    assert search.stages['hh_request'] >= requests * LATENCY * 0.9
+
+
+def test_render_prometheus_text(monkeypatch):
+    monkeypatch.setattr(metrics, '_registry', [])
+    hits = metrics.Counter('test_hits_total', 'Попадания', ('cache',))
+    hits.inc('search')
+    hits.inc('search', amount=2)
+    seconds = metrics.Histogram('test_seconds', 'Длительность', ('stage',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        seconds.observe(value, 'load')
+    metrics.gauge('test_queue', 'Очередь', lambda: {'prefetch': 4}, label='queue')
+    metrics.gauge('test_broken', 'Ошибка чтения', lambda: 1 / 0)
+
+    assert metrics.render().splitlines() == [
+        '# HELP test_hits_total Попадания',
+        '# TYPE test_hits_total counter',
+        'test_hits_total{cache="search"} 3',
+        '# HELP test_seconds Длительность',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{stage="load",le="0.1"} 1',
+        'test_seconds_bucket{stage="load",le="1"} 3',
+        'test_seconds_bucket{stage="load",le="+Inf"} 4',
+        'test_seconds_sum{stage="load"} 4.05',
+        'test_seconds_count{stage="load"} 4',
+        '# HELP test_queue Очередь',
+        '# TYPE test_queue gauge',
+        'test_queue{queue="prefetch"} 4',
+        '# HELP test_broken Ошибка чтения',
+        '# TYPE test_broken gauge',
+    ]
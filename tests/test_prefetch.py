@@ -0,0 +1,121 @@
+'''Упреждающая загрузка: порядок очереди, учет попаданий, уступка пользователям и размер раунда'''
+import threading
+import time
+
+import pytest
+
+import hh_client
+import prefetch
+import stats_advanced
+import vacancy_store
+from conftest import FakeHH, vacancy
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(vacancy_store, 'get_store', lambda: None)
+    return FakeHH([vacancy(i) for i in range(30)])
+
+
+def drain(prefetcher):
+    '''Содержимое очереди в порядке выдачи: (приоритет, запрос, фильтры)'''
+    result = []
+    while not prefetcher._queue.empty():
+        priority, _, query, filters, _ = prefetcher._queue.get_nowait()
+        result.append((priority, query, filters))
+    return result
+
+
+def test_recommendations_before_popular_newest_first():
+    prefetcher = prefetch.Prefetcher(top=2)
+    prefetcher.start = lambda: prefetcher
+    for query in ['go', 'python', 'go', 'java']:
+        prefetcher.note_search(query, {'city_id': 1})
+    prefetcher.schedule_popular()
+    prefetcher.recommend(['аналитик', 'тестировщик'], {'city_id': 2})
+    prefetcher.recommend(['дизайнер'], {'city_id': 1})
+    prefetcher.recommend(['Аналитик '], {'city_id': 2})  # уже в очереди
+
+    queued = drain(prefetcher)
+    assert queued[:3] == [(prefetch.RECOMMENDED, 'дизайнер', {'city_id': 1}),
+                          (prefetch.RECOMMENDED, 'аналитик', {'city_id': 2}),
+                          (prefetch.RECOMMENDED, 'тестировщик', {'city_id': 2})]
+    popular = queued[3:]
+    assert {priority for priority, _, _ in popular} == {prefetch.POPULAR}
+    assert len(popular) == 2 * len(hh_client.CITIES)
+    # Сначала пары, которые искали, потом остальные в порядке популярности запросов
+    assert popular[0] == (prefetch.POPULAR, 'go', {'city_id': 1})
+    assert [query for _, query, _ in popular[1:3]] == ['python', 'go']
+
+
+def test_note_search_counts_cache_and_prefetch_hits(client):
+    prefetcher = prefetch.Prefetcher(client=client, top=0)
+    prefetcher.note_search('python', {'city_id': 1})
+    assert prefetcher.prefetch('python', {'city_id': 1, 'experience': 'noExperience'})
+    # Свежий кадр в кэше: повторная загрузка не нужна
+    assert not prefetcher.prefetch('python', {'city_id': 1})
+
+    prefetcher.note_search('python', {'city_id': 1, 'remote_only': True})
+    prefetcher.note_search('python', {'city_id': 1})
+    prefetcher.note_search('python', {'city_id': 2})
+    stats = prefetcher.stats()
+    assert (stats['searches'], stats['cache_hits'], stats['prefetch_hits']) == (4, 2, 1)
+    assert stats['prefetched'] == 1
+    assert stats['saved_seconds'] >= 0
+    assert stats['hit_rate'] == 0.5
+    assert len(client.base_calls()) == 1
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_waits_while_users_are_busy(client, monkeypatch):
+    monkeypatch.setattr(prefetch, 'IDLE_POLL', 0.01)
+    busy = threading.Event()
+    busy.set()
+    prefetcher = prefetch.Prefetcher(busy=busy.is_set, client=client, top=0)
+    try:
+        prefetcher.recommend(['python'], {'city_id': 1})
+        wait_for(lambda: prefetcher.stats()['queued'] == 0)
+        time.sleep(0.1)
+        assert client.calls == [] and prefetcher.stats()['prefetched'] == 0
+
+        busy.clear()
+        wait_for(lambda: prefetcher.stats()['prefetched'] == 1)
+        assert len(client.base_calls()) == 1
+    finally:
+        prefetcher.stop()
+
+
+def test_popular_round_shrinks_with_hit_rate(client):
+    prefetcher = prefetch.Prefetcher(client=client, top=2)
+    prefetcher.start = lambda: prefetcher
+    prefetcher.note_search('python', {'city_id': 1})
+    prefetcher.note_search('go', {'city_id': 1})
+    total = 2 * len(hh_client.CITIES)
+
+    prefetcher.schedule_popular()
+    queued = drain(prefetcher)
+    assert len(queued) == total
+    for priority, query, filters in queued:
+        prefetcher.prefetch(query, filters, priority)
+        prefetcher._queued.clear()
+    # Нашли только две пары из всех предзагруженных
+    prefetcher.note_search('python', {'city_id': 1})
+    prefetcher.note_search('go', {'city_id': 2})
+
+    stats_advanced.RESULT_CACHE.clear()
+    prefetcher.schedule_popular()
+    queued = drain(prefetcher)
+    assert len(queued) == prefetcher.stats()['popular_limit'] == 2
+    assert [(query, filters['city_id']) for _, query, filters in queued] == \
+        [('python', 1), ('go', 1)]
+
+    # Пока раунд не набрал MIN_POPULAR_SAMPLE загрузок, предел прежний
+    prefetcher._queued.clear()
+    prefetcher.schedule_popular()
+    assert len(drain(prefetcher)) == 2
@@ -0,0 +1,87 @@
+'''Подсчет викторины: ответ i — на вопрос i, пакетный подсчет совпадает с поштучным'''
+import random
+
+import pytest
+
+import quiz
+import state_store
+
+QUESTIONS = len(quiz.QUIZ_QUESTIONS)
+OPTIONS = len(quiz.QUIZ_QUESTIONS[0]['options'])
+
+
+def expected_traits(answers):
+    '''Черты, посчитанные вручную'''
+    traits = {}
+    for question, answer in zip(quiz.QUIZ_QUESTIONS, answers):
+        if 0 <= answer < len(question['options']):
+            for trait in question['options'][answer]['traits']:
+                traits[trait] = traits.get(trait, 0) + 1
+    return traits
+
+
+@pytest.mark.parametrize('answers', [[0] * QUESTIONS, [3] * QUESTIONS, [1, 1, 2, 2, 0, 0, 3]])
+def test_repeated_answer_counts_for_its_own_question(answers):
+    result = quiz.calculate_quiz_result(answers)
+    assert result['trait_scores'] == expected_traits(answers)
+
+
+@pytest.mark.parametrize('answers, counted', [
+    ([], []),
+    ([2, OPTIONS, -1], [2]),
+    ([2, 9, 1], [2, None, 1]),
+    ([1] * (QUESTIONS + 3), [1] * QUESTIONS),
+])
+def test_out_of_range_answers_are_skipped(answers, counted):
+    expected = expected_traits([-1 if a is None else a for a in counted])
+    assert quiz.calculate_quiz_result(answers)['trait_scores'] == expected
+
+
+def test_empty_answers_are_balanced():
+    assert quiz.calculate_quiz_result([])['profile'] == 'balanced'
+
+
+def test_batch_matches_single():
+    engine = quiz.get_engine()
+    rng = random.Random(0)
+    # Вместе с неполными наборами и неверными номерами
+    sets = [[rng.randint(-1, OPTIONS) for _ in range(rng.randint(0, QUESTIONS + 1))]
+            for _ in range(500)]
+    trait_scores, profile_scores, best = engine.score_batch(sets)
+    for answers, traits, scores, index in zip(sets, trait_scores, profile_scores, best):
+        result = engine.score(answers)
+        assert result['profile'] == engine.profiles[index]
+        assert list(result['scores'].values()) == scores.tolist()
+        assert result['trait_scores'] == {trait: count for trait, count
+                                          in zip(engine.traits, traits.tolist()) if count}
+
+
+def test_profile_counts_cover_all_sets():
+    counts = quiz.get_engine().profile_counts([[0] * QUESTIONS, [3] * QUESTIONS, []])
+    assert sum(counts.values()) == 3
+    assert counts['balanced'] >= 1
+
+
+@pytest.fixture
+def session():
+    store = state_store.StateStore(state_store.MemoryBackend(), flush_interval=3600)
+    yield quiz.QuizSession(store)
+    store.close()
+
+
+@pytest.mark.parametrize('answer', [-1, OPTIONS, 255, 256, 10**6])
+def test_answer_outside_options_is_rejected(session, answer):
+    session.start_quiz(1)
+    assert not session.add_answer(1, answer)
+    assert session.get_current_question(1) is quiz.QUIZ_QUESTIONS[0]
+    assert session.add_answer(1, OPTIONS - 1)
+    assert session.get_current_question(1) is quiz.QUIZ_QUESTIONS[1]
+
+
+def test_answers_after_last_question_are_rejected(session):
+    session.start_quiz(1)
+    for _ in range(QUESTIONS):
+        assert session.add_answer(1, 0)
+    assert session.is_quiz_complete(1)
+    assert not session.add_answer(1, 0)
+    assert session.get_result(1)['trait_scores'] == expected_traits([0] * QUESTIONS)
@@ -0,0 +1,106 @@
+'''Компактная схема вакансий: проекция, типы столбцов и совпадение с json_normalize'''
+import numpy as np
+import pandas as pd
+
+import converter
+import schema
+from conftest import vacancy
+
+
+def items(count):
+    '''Вакансии с пропусками: без зарплаты, без валюты, без работодателя'''
+    result = []
+    for i in range(count):
+        item = vacancy(i, salary=None if i % 5 == 0 else 50_000 + i * 1000,
+                       currency=['RUR', 'EUR', 'USD', 'KZT'][i % 4], gross=i % 3 == 0,
+                       experience=['noExperience', 'between1And3'][i % 2],
+                       schedule=['fullDay', 'remote', 'flexible'][i % 3])
+        if item['salary'] and i % 7 == 3:
+            item['salary']['to'] = None
+        if i % 11 == 4:
+            item['employer'] = None
+        item['snippet'] = {'requirement': 'Python', 'responsibility': '...'}
+        item['address'] = {'city': 'Москва'}
+        result.append(item)
+    return result
+
+
+def baseline(raw):
+    '''Прежний кадр: pd.json_normalize по всей выдаче и выбор столбцов'''
+    df = pd.json_normalize(raw)
+    for name in schema.FIELDS:
+        if name not in df:
+            df[name] = None
+    return df[[name for name in schema.FIELDS if name not in ('id', 'published_at')]]
+
+
+def values(column):
+    '''Значения столбца списком, пропуски — None'''
+    column = column.astype(object)
+    return list(column.where(column.notna(), None))
+
+
+def assert_matches_baseline(df, raw):
+    expected = baseline(raw)
+    assert list(df.index) == list(expected.index)
+    for name in schema.SALARY_COLUMNS:
+        np.testing.assert_allclose(df[name], expected[name].astype(float), rtol=1e-6)
+    currencies = [None if code < 0 else converter.CURRENCIES[code]
+                  for code in df['salary.currency']]
+    known = expected['salary.currency'].where(
+        expected['salary.currency'].isin(converter.CURRENCIES))
+    assert currencies == values(known)
+    assert list(df['salary.gross']) == [g is True for g in expected['salary.gross']]
+    for name in schema.CATEGORY_COLUMNS:
+        assert values(df[name]) == values(expected[name])
+
+
+def test_project_keeps_only_schema_fields():
+    item = items(5)[4]
+    record = schema.project(item)
+    assert list(record) == list(schema.FIELDS)
+    assert record['salary.from'] == item['salary']['from']
+    assert record['employer.name'] is None
+    assert schema.project({'id': '1', 'salary': None})['salary.currency'] is None
+
+
+def test_frame_dtypes():
+    df = schema.to_frame([schema.project(item) for item in items(40)])
+    assert all(df[name].dtype == np.float32 for name in schema.SALARY_COLUMNS)
+    assert df['salary.currency'].dtype == np.int8
+    assert df['salary.gross'].dtype == bool
+    assert all(isinstance(df[name].dtype, pd.CategoricalDtype)
+               for name in schema.CATEGORY_COLUMNS)
+    assert set(df['schedule.id'].cat.categories) == {'fullDay', 'remote', 'flexible'}
+
+
+def test_frame_matches_json_normalize():
+    raw = items(60)
+    assert_matches_baseline(schema.to_frame([schema.project(item) for item in raw]), raw)
+
+
+def test_buffers_double_past_capacity():
+    raw = items(45)
+    pages = [[schema.project(item) for item in raw[start:start + 10]]
+             for start in range(0, len(raw), 10)]
+    builder = schema.FrameBuilder(capacity=4)
+    capacities = []
+    for records in pages:
+        builder.add(records)
+        capacities.append(len(builder.columns['salary.from']))
+    assert capacities == [10, 20, 40, 40, 80]
+
+    df = builder.frame()
+    assert builder.size == len(df) == len(raw)
+    assert_matches_baseline(df, raw)
+    pd.testing.assert_frame_equal(df, schema.to_frame([r for page in pages for r in page]))
+    pd.testing.assert_frame_equal(schema.build_frame(pages, capacity=1), df)
+
+
+def test_streamed_pages_match_json_normalize():
+    raw = items(250)
+    # Страницы приходят генератором, как из iter_pages, и не хранятся целиком
+    pages = ([schema.project(item) for item in raw[start:start + 100]]
+             for start in range(0, len(raw), 100))
+    assert_matches_baseline(schema.build_frame(pages, capacity=100), raw)
+    assert schema.build_frame([]).empty
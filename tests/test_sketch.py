@@ -0,0 +1,99 @@
+'''Сливаемые сводки зарплат: ошибка ранга KLL, слияние и точные моменты'''
+import numpy as np
+import pandas as pd
+import pytest
+
+import sketch
+import stats_advanced
+from conftest import FakeHH, vacancy
+
+# Ошибка ранга из описания sketch.py для k=200
+RANK_ERROR = 0.0165
+QS = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def salaries(rng, size):
+    '''Зарплаты с длинным правым хвостом, как у выдачи hh.ru'''
+    return rng.lognormal(np.log(120_000), 0.5, size)
+
+
+def rank_errors(values, estimates, qs):
+    '''|доля значений не больше оценки − q| для каждого квантиля'''
+    ordered = np.sort(values)
+    ranks = np.searchsorted(ordered, estimates, side='right') / len(ordered)
+    return np.abs(ranks - np.asarray(qs))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_merged_sketch_within_rank_error(seed):
+    rng = np.random.default_rng(seed)
+    parts = [salaries(rng, size) for size in rng.integers(500, 20_000, 30)]
+    merged = sketch.KLLSketch(seed=seed)
+    for i, part in enumerate(parts):
+        merged.merge(sketch.KLLSketch(seed=seed * 100 + i).update(part))
+    values = np.concatenate(parts)
+
+    assert merged.count == len(values)
+    estimates = merged.quantiles(QS)
+    assert rank_errors(values, estimates, QS).max() <= RANK_ERROR
+    # Размер не растет с числом значений и слияний
+    assert sum(len(level) for level in merged.levels) <= 3 * sketch.DEFAULT_K
+
+
+def test_merge_order_does_not_matter_beyond_error():
+    rng = np.random.default_rng(7)
+    parts = [salaries(rng, 10_000) for _ in range(8)]
+    values = np.concatenate(parts)
+    forward, backward = sketch.KLLSketch(seed=1), sketch.KLLSketch(seed=2)
+    for part in parts:
+        forward.merge(sketch.KLLSketch(seed=3).update(part))
+    for part in reversed(parts):
+        backward.merge(sketch.KLLSketch(seed=4).update(part))
+    for result in (forward, backward):
+        assert rank_errors(values, result.quantiles(QS), QS).max() <= RANK_ERROR
+
+
+def test_small_sketch_is_exact():
+    values = salaries(np.random.default_rng(0), sketch.DEFAULT_K)
+    result = sketch.KLLSketch().update(values)
+    assert result.quantiles(QS) == pytest.approx(np.quantile(values, QS))
+    assert result.quantile(0.5) == pytest.approx(pd.Series(values).median())
+
+
+def test_summary_moments_are_exact_after_merge():
+    rng = np.random.default_rng(1)
+    parts = [salaries(rng, 3000) for _ in range(5)]
+    parts[2][::10] = np.nan
+    values = np.concatenate(parts)
+    values = values[~np.isnan(values)]
+
+    merged = sketch.SalarySummary.merged(sketch.SalarySummary.from_salaries(p) for p in parts)
+    assert merged.count == len(values)
+    assert merged.mean == pytest.approx(values.mean())
+    assert merged.std == pytest.approx(values.std(ddof=1))
+    assert (merged.min, merged.max) == (values.min(), values.max())
+    basic = merged.basic_stats()
+    median_rank = rank_errors(values, [basic['median']], [0.5])[0]
+    assert median_rank <= RANK_ERROR
+
+
+def test_empty_summary():
+    summary = sketch.SalarySummary()
+    assert summary.basic_stats() is None
+    assert np.isnan(summary.quantile(0.5))
+
+
+def test_summary_cache_checks_frame_version():
+    key = stats_advanced.make_query_key('python', 1)
+    client = FakeHH([vacancy(i, 100_000) for i in range(20)])
+    df = stats_advanced.load_frame(key, client, None)
+    version = df.attrs['version']
+    assert stats_advanced.SUMMARY_CACHE.peek(key)[0] == version
+
+    # Сводка другой загрузки под тем же ключом не используется и заменяется
+    stale = sketch.SalarySummary.from_salaries([1.0, 2.0, 3.0])
+    stats_advanced.SUMMARY_CACHE.put(key, (version - 1, stale))
+    stats = stats_advanced.VacancyStats.from_frame('python', 1, df, key)
+    assert stats.salary_summary() is not stale
+    assert stats.salary_summary().quantile(0.5) == pytest.approx(100_000)
+    assert stats_advanced.SUMMARY_CACHE.peek(key)[0] == version
@@ -0,0 +1,173 @@
+'''Состояние пользователей: TTL, LRU, отложенная запись в SQLite и перезапуск'''
+import time as real_time
+
+import pytest
+
+import state_store
+from state_store import DialogState, QuizProgress, Settings
+
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    monkeypatch.setattr(state_store, 'time', clock)
+    return clock
+
+
+class CountingBackend(state_store.MemoryBackend):
+    '''MemoryBackend, считающий чтения и транзакции записи'''
+
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+        self.saves = []
+
+    def load(self, kind, user_id):
+        self.loads += 1
+        return super().load(kind, user_id)
+
+    def save(self, changes):
+        self.saves.append(list(changes))
+        super().save(changes)
+
+
+def open_store(backend, **kwargs):
+    # Фоновый поток почти не просыпается: записью управляет тест
+    kwargs.setdefault('flush_interval', 3600)
+    return state_store.StateStore(backend, **kwargs)
+
+
+def test_dialog_and_quiz_expire_settings_do_not(clock):
+    store = open_store(state_store.MemoryBackend())
+    store.put(Settings(city_id=2), 1)
+    store.put(DialogState('waiting_query', 'python'), 1)
+    store.put(QuizProgress(b'\x01\x02'), 1)
+
+    clock.now += DialogState.TTL + 1
+    assert store.get(DialogState, 1) is None
+    assert store.get(QuizProgress, 1).answers == b'\x01\x02'
+    clock.now += QuizProgress.TTL
+    assert store.get(QuizProgress, 1) is None
+    assert store.get(Settings, 1).city_id == 2
+    store.close()
+
+
+def test_sweep_removes_expired_rows_from_backend(clock):
+    backend = state_store.MemoryBackend()
+    store = open_store(backend)
+    store.put(DialogState('waiting_query'), 1)
+    store.put(Settings(), 1)
+    store.flush()
+    clock.now += DialogState.TTL + 1
+    store.put(DialogState('waiting_compare'), 2)
+    store.flush()
+
+    store.sweep()
+    assert set(backend.rows) == {('settings', 1), ('dialog', 2)}
+    store.close()
+
+
+def test_lru_keeps_only_cache_size_records_in_memory(clock):
+    backend = CountingBackend()
+    store = open_store(backend, cache_size=3)
+    for user_id in range(5):
+        store.put(Settings(city_id=user_id), user_id)
+    store.flush()
+    assert len(store._cache) == 3
+
+    loads = backend.loads
+    assert store.get(Settings, 4).city_id == 4  # горячая запись — без чтения из бэкенда
+    assert backend.loads == loads
+    assert store.get(Settings, 0).city_id == 0  # вытесненная — из бэкенда
+    assert backend.loads == loads + 1
+    assert len(store._cache) == 3
+    store.close()
+
+
+def test_missing_record_is_remembered(clock):
+    backend = CountingBackend()
+    store = open_store(backend)
+    assert store.get(Settings, 7) is None
+    assert store.get(Settings, 7) is None
+    assert backend.loads == 1
+    store.close()
+
+
+def test_write_behind_batches_changes(clock):
+    backend = CountingBackend()
+    store = open_store(backend)
+    store.put(Settings(city_id=2), 1)
+    store.put(Settings(city_id=3), 1)
+    store.put(DialogState('waiting_query'), 1)
+    assert backend.saves == []  # пока только в памяти
+    # Несохраненная запись видна до записи в бэкенд
+    assert store.get(Settings, 1).city_id == 3
+
+    store.flush()
+    assert len(backend.saves) == 1
+    assert sorted(change[:2] for change in backend.saves[0]) == [('dialog', 1), ('settings', 1)]
+    store.flush()
+    assert len(backend.saves) == 1  # изменений нет — транзакции нет
+    store.close()
+
+
+def test_flush_batch_wakes_writer(clock):
+    backend = CountingBackend()
+    store = open_store(backend, flush_batch=3)
+    for user_id in range(3):
+        store.put(Settings(), user_id)
+    # Поток записи просыпается сам, не дожидаясь интервала
+    deadline = real_time.monotonic() + 5
+    while not backend.saves and real_time.monotonic() < deadline:
+        real_time.sleep(0.01)
+    assert sum(map(len, backend.saves)) == 3
+    store.close()
+
+
+def test_failed_flush_keeps_changes(clock):
+    class FailingBackend(state_store.MemoryBackend):
+        fail = True
+
+        def save(self, changes):
+            if self.fail:
+                raise OSError('диск полон')
+            super().save(changes)
+
+    backend = FailingBackend()
+    store = open_store(backend)
+    store.put(Settings(city_id=4), 1)
+    store.flush()
+    assert backend.rows == {}
+    backend.fail = False
+    store.flush()
+    assert ('settings', 1) in backend.rows
+    store.close()
+
+
+def test_sqlite_reload_after_restart(tmp_path, clock):
+    path = str(tmp_path / 'state.db')
+    store = open_store(state_store.SQLiteBackend(path))
+    store.put(Settings(city_id=88, experience='between1And3', remote_only=1), 1)
+    store.put(DialogState('waiting_query', 'аналитик'), 1)
+    store.put(QuizProgress(bytes([0, 3, 2])), 2)
+    store.put(Settings(), 3)
+    store.delete(Settings, 3)
+    store.close()  # оставшиеся изменения записываются при закрытии
+
+    store = open_store(state_store.SQLiteBackend(path))
+    settings = store.get(Settings, 1)
+    assert (settings.city_id, settings.experience, settings.remote_only) == (88, 'between1And3', 1)
+    assert settings.touched == clock.now
+    dialog = store.get(DialogState, 1)
+    assert (dialog.state, dialog.last_query) == ('waiting_query', 'аналитик')
+    assert store.get(QuizProgress, 2).answers == bytes([0, 3, 2])
+    assert store.get(Settings, 3) is None
+
+    # TTL отсчитывается от последнего изменения и после перезапуска
+    clock.now += DialogState.TTL + 1
+    assert store.get(DialogState, 1) is None
+    store.sweep()
+    store.close()
+    store = open_store(state_store.SQLiteBackend(path))
+    assert store.get(DialogState, 1) is None
+    assert store.get(Settings, 1).city_id == 88
+    store.close()
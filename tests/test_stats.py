@@ -0,0 +1,86 @@
+'''Статистика по кадру вакансий: подготовка зарплат и сводки в SUMMARY_CACHE'''
+import pytest
+
+import stats_advanced
+from conftest import FakeHH, vacancy
+
+KEY = stats_advanced.make_query_key('python', 1)
+
+
+def client_with(salary, count=50):
+    return FakeHH([vacancy(i, salary) for i in range(count)])
+
+
+def search(client, key=KEY):
+    '''Поиск, как у VacancyStats, но без локального хранилища'''
+    return stats_advanced.VacancyStats.from_frame(
+        key[0], key[1], stats_advanced.load_frame(key, client, None), key)
+
+
+def test_prepare_salary_data_is_idempotent():
+    items = [vacancy(i, 100000 + 1000 * i, gross=i % 2 == 0) for i in range(40)]
+    items += [vacancy(100 + i, 1510, currency='USD', gross=True) for i in range(10)]
+    stats = search(FakeHH(items))
+    source = stats.df['salary.from'].to_numpy().copy()
+
+    assert stats.prepare_salary_data()
+    salaries = stats.salary_df['salary'].to_numpy().copy()
+    basic = stats.get_basic_stats()
+    assert stats.prepare_salary_data()
+    assert stats.salary_df['salary'].to_numpy().tolist() == salaries.tolist()
+    assert stats.get_basic_stats() == basic
+
+    # Новый объект по тому же кадру из кэша: gross не переводится «на руки» второй раз
+    again = search(FakeHH(items))
+    assert again.df is stats.df
+    assert again.df['salary.from'].to_numpy().tolist() == source.tolist()
+    assert again.prepare_salary_data()
+    assert again.salary_df['salary'].to_numpy().tolist() == salaries.tolist()
+    assert again.get_basic_stats() == basic
+    assert (basic['min'], basic['max']) == (87000, 139000)
+    assert sum(salary == pytest.approx(1510 * 80 * 0.87) for salary in salaries) == 10
+
+
+def test_basic_stats_do_not_build_summary():
+    df = stats_advanced.VacancyStats._load_frame(KEY, stats_advanced.key_params(KEY),
+                                                 client_with(100000), None)
+    stats_advanced.SUMMARY_CACHE.clear()
+    stats = stats_advanced.VacancyStats.from_frame('python', 1, df, KEY)
+    assert stats.get_basic_stats()['median'] == 100000
+    assert stats_advanced.SUMMARY_CACHE.peek(KEY) is None
+
+
+def test_summary_follows_refreshed_frame():
+    stats = search(client_with(100000))
+    assert stats.salary_summary().quantile(0.5) == pytest.approx(100000)
+    assert stats_advanced.merged_summary(['python'])[0].quantile(0.5) == pytest.approx(100000)
+
+    # Обновление до истечения, как у Prefetcher: новый кадр под тем же ключом
+    df = stats_advanced.VacancyStats._load_frame(KEY, stats_advanced.key_params(KEY),
+                                                 client_with(200000), None)
+    stats_advanced.RESULT_CACHE.put(KEY, df)
+
+    fresh = search(client_with(200000))
+    assert fresh.salary_summary().quantile(0.5) == pytest.approx(200000)
+    merged, count = stats_advanced.merged_summary(['python'])
+    assert count == 1
+    assert merged.quantile(0.5) == pytest.approx(200000)
+
+
+def test_summary_outlives_frame_and_is_replaced_on_reload():
+    search(client_with(100000))
+    stats_advanced.RESULT_CACHE.clear()
+    assert stats_advanced.merged_summary(['python'])[0].quantile(0.5) == pytest.approx(100000)
+
+    search(client_with(200000))
+    stats_advanced.RESULT_CACHE.clear()
+    assert stats_advanced.merged_summary(['python'])[0].quantile(0.5) == pytest.approx(200000)
+
+
+def test_filtered_summary_from_cached_frame():
+    items = [vacancy(i, 100000) for i in range(30)]
+    remote = [vacancy(100 + i, 300000, schedule='remote') for i in range(10)]
+    search(FakeHH(items + remote))
+    merged, count = stats_advanced.merged_summary(['python'], remote_only=True)
+    assert count == 1
+    assert merged.quantile(0.5) == pytest.approx(300000)
@@ -0,0 +1,181 @@
+'''Хранилище вакансий: миграция схемы, закрытые вакансии и загрузка несколькими процессами'''
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import schema
+import vacancy_store
+from conftest import NOW, FakeHH, vacancy
+
+
+def old_database(path):
+    '''База прошлой версии формата с записью, которую миграция должна удалить'''
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE vacancies (query_key TEXT, payload TEXT)')
+    conn.execute("INSERT INTO vacancies VALUES ('q', '{}')")
+    conn.execute('PRAGMA user_version = 1')
+    conn.commit()
+    conn.close()
+
+
+def test_old_schema_is_recreated(tmp_path):
+    path = str(tmp_path / 'store.db')
+    old_database(path)
+    store = vacancy_store.VacancyStore(path)
+    assert store.conn.execute('PRAGMA user_version').fetchone()[0] == vacancy_store.SCHEMA_VERSION
+    assert store.load('q') == []
+    store.close()
+
+
+def test_concurrent_opens_migrate_once(tmp_path):
+    path = str(tmp_path / 'store.db')
+    old_database(path)
+    ready = threading.Barrier(4)
+    stores, errors = [], []
+
+    def open_store():
+        ready.wait()
+        try:
+            stores.append(vacancy_store.VacancyStore(path))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_store) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert errors == [] and len(stores) == 4
+    stores[0].merge('q', [{'id': '1'}], None)
+    # Запись первого процесса не стерта запоздалой миграцией другого
+    assert [store.load('q') for store in stores] == [[{'id': '1'}]] * 4
+    for store in stores:
+        store.close()
+
+
+def ids(store, key='q'):
+    return sorted((item['id'] for item in store.load(key)), key=int)
+
+
+def sync(store, client, key='q'):
+    missing = []
+    store.sync(key, {'text': 'python'}, client, project=schema.project, missing=missing)
+    return missing
+
+
+def test_incremental_refresh_keeps_closed_until_full_refresh(tmp_path):
+    store = vacancy_store.VacancyStore(str(tmp_path / 'store.db'), refresh_interval=0)
+    old = NOW - 3600
+    client = FakeHH([vacancy(i, published=old) for i in range(5)])
+    sync(store, client)
+    assert ids(store) == ['0', '1', '2', '3', '4']
+
+    # Вакансию 1 закрыли, вакансию 2 перенесли в архив, появилась вакансия 5
+    client.items = [item for item in client.items if item['id'] != '1']
+    client.items.append(vacancy(5))
+    client.items.append(dict(vacancy(2), archived=True))
+    sync(store, client)
+    assert 'date_from' in client.calls[-1]
+    # Догрузка видит только новые: закрытая остается, архивная удаляется
+    assert ids(store) == ['0', '1', '3', '4', '5']
+
+    store.full_refresh_interval = 0
+    sync(store, client)
+    assert 'date_from' not in client.calls[-1]
+    assert ids(store) == ['0', '3', '4', '5']
+    store.close()
+
+
+def test_failed_full_refresh_keeps_stored(tmp_path):
+    store = vacancy_store.VacancyStore(str(tmp_path / 'store.db'), refresh_interval=0,
+                                       full_refresh_interval=0)
+    client = FakeHH([vacancy(i) for i in range(3)])
+    sync(store, client)
+    full_ts = store.last_sync('q')[2]
+    assert full_ts > 0
+
+    client.items = client.items[:1]
+    pages = client.iter_pages
+
+    def lossy(params, max_pages=None, project=None, missing=None, first=None):
+        missing.append(1)
+        yield from pages(params, max_pages, project, missing, first)
+
+    client.iter_pages = lossy
+    assert sync(store, client) == [1]
+    # Часть страниц потерялась: сохраненное не заменяется, отметка прежняя
+    assert ids(store) == ['0', '1', '2']
+    assert store.last_sync('q')[2] == full_ts
+    store.close()
+
+
+def load_in_process(path, url, ready, results):
+    '''Процесс-обработчик: поиск python через свое хранилище над общей базой'''
+    import hh_client
+    import stats_advanced
+    store = vacancy_store.VacancyStore(path)
+    client = hh_client.HHClient(url, rate=100000)
+    ready.wait(10)
+    try:
+        key = stats_advanced.make_query_key('python', 1)
+        results.put(len(stats_advanced.load_frame(key, client, store)))
+    finally:
+        client.close()
+        store.close()
+
+
+def test_processes_load_one_query_from_hh_once(tmp_path):
+    benchmarks = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+    sys.path.insert(0, benchmarks)
+    from stub_hh_server import start_server
+    server, stub, url = start_server(latency=0.05, found=250)
+    path = str(tmp_path / 'store.db')
+    vacancy_store.VacancyStore(path).close()
+
+    context = multiprocessing.get_context('spawn')
+    ready, results = context.Event(), context.Queue()
+    processes = [context.Process(target=load_in_process, args=(path, url, ready, results))
+                 for _ in range(3)]
+    try:
+        for process in processes:
+            process.start()
+        ready.set()
+        sizes = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join(10)
+    finally:
+        server.shutdown()
+        sys.path.remove(benchmarks)
+
+    assert sizes == [250] * 3
+    # Три страницы выдачи, каждая — один раз на все процессы
+    assert stub.requests == 3
+
+
+def test_claim_waits_for_the_loader_and_takes_over_stale(tmp_path):
+    path = str(tmp_path / 'store.db')
+    first = vacancy_store.VacancyStore(path)
+    second = vacancy_store.VacancyStore(path, claim_timeout=0.5)
+    plan = first.plan_sync('q', {'text': 'python'})
+    assert plan.owner is not None and second.claim('q') is None
+
+    # Пока первый загружает, второй ждет и после синхронизации ничего не грузит
+    done = threading.Timer(0.05, first.commit_sync, (plan, [vacancy(1)], []))
+    done.start()
+    assert second.plan_sync('q', {'text': 'python'}).params is None
+    done.join()
+
+    # Отметку упавшего процесса второй забирает через claim_timeout
+    assert first.claim('stale') is not None
+    started = time.monotonic()
+    stale = second.plan_sync('stale', {'text': 'python'})
+    assert stale.params is not None and stale.owner is not None
+    assert time.monotonic() - started >= 0.45
+    second.release(stale)
+    assert first.claim('stale') is not None
+    first.close()
+    second.close()